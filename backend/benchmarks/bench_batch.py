@@ -0,0 +1,79 @@
+"""
+Benchmark batched feature extraction against the per-image path and check
+that both produce identical features.
+
+Run from the backend directory:
+    python -m benchmarks.bench_batch --images ../client/public/wikiart_images --limit 200
+
+Images are decoded once up front so only feature computation is timed.
+"""
+import argparse
+import os
+import time
+import numpy as np
+from racomandation.image_extraction import (
+    ImageFeatureExtractor, COLOR_MODES, IMAGE_EXTENSIONS, iter_image_batches
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', default=os.path.join('..', 'client', 'public', 'wikiart_images'))
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--color-mode', choices=COLOR_MODES, default='quantized')
+    args = parser.parse_args()
+
+    filenames = sorted(f for f in os.listdir(args.images) if f.lower().endswith(IMAGE_EXTENSIONS))
+    paths = [os.path.join(args.images, f) for f in filenames[:args.limit]]
+    start = time.perf_counter()
+    batches = [img_arrays for _, img_arrays in iter_image_batches(paths, args.batch_size)]
+    decode = time.perf_counter() - start
+    n_images = sum(len(batch) for batch in batches)
+
+    extractor = ImageFeatureExtractor(color_mode=args.color_mode)
+
+    def per_image(a, colors=True):
+        parts = [extractor._extract_color_features(a)] if colors else [
+            a.mean(axis=(0, 1)) / 255.0, a.std(axis=(0, 1)) / 255.0
+        ]
+        parts += [extractor._extract_histogram_features(a), extractor._extract_composition_features(a)]
+        return np.concatenate(parts)
+
+    start = time.perf_counter()
+    single = np.vstack([np.stack([per_image(a) for a in batch]) for batch in batches])
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = np.vstack([extractor.extract_features_batch(batch) for batch in batches])
+    batch_time = time.perf_counter() - start
+
+    # Statistics, histogram and grid features only (dominant colors stubbed out)
+    start = time.perf_counter()
+    for batch in batches:
+        for a in batch:
+            per_image(a, colors=False)
+    single_stats = time.perf_counter() - start
+    no_colors = ImageFeatureExtractor(color_mode=args.color_mode)
+    no_colors._dominant_colors = lambda pixels: (None, np.zeros(no_colors.n_colors))
+    start = time.perf_counter()
+    for batch in batches:
+        no_colors.extract_features_batch(batch)
+    batch_stats = time.perf_counter() - start
+
+    identical = np.array_equal(single, batched)
+    max_diff = np.abs(single - batched).max()
+    print(f"{n_images} images, batch size {args.batch_size}, color mode {args.color_mode}, "
+          f"decode {n_images / decode:.0f} images/sec")
+    print(f"{'':>22} {'per-image':>12} {'batched':>12} {'speedup':>8}")
+    print(f"{'all features (img/s)':>22} {n_images / single_time:>12.0f} {n_images / batch_time:>12.0f} "
+          f"{single_time / batch_time:>7.1f}x")
+    print(f"{'no colors (img/s)':>22} {n_images / single_stats:>12.0f} {n_images / batch_stats:>12.0f} "
+          f"{single_stats / batch_stats:>7.1f}x")
+    print(f"Identical output: {identical} (max abs difference {max_diff:.2e})")
+    if not np.allclose(single, batched, rtol=0, atol=1e-12):
+        raise SystemExit("Batched features differ from the per-image path")
+
+
+if __name__ == "__main__":
+    main()
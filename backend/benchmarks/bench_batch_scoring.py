@@ -0,0 +1,71 @@
+"""
+Benchmark batch scoring of many users against per-user recommendation calls.
+
+Run from the backend directory:
+    python -m benchmarks.bench_batch_scoring --users 100000 --artworks 1000000
+
+Synthetic users each like and dislike a few random artworks.
+ArtRecommender.batch_recommendations scores all of them in one blocked pass;
+the per-user path (_get_similarity_based_recommendations) is timed on
+--single-sample users and extrapolated to all users. Peak memory is tracked
+with tracemalloc, which numpy reports its allocations to.
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from benchmarks.bench_scoring import build_recommender
+
+
+def add_users(recommender, n_users, n_liked=20, n_disliked=10, seed=1):
+    rng = np.random.default_rng(seed)
+    ids = recommender.artwork_ids
+    picks = rng.integers(len(ids), size=(n_users, n_liked + n_disliked))
+    for u in range(n_users):
+        recommender.user_preferences.set(
+            f"batch-user-{u}",
+            liked=ids[picks[u, :n_liked]].tolist(),
+            disliked=ids[picks[u, n_liked:]].tolist(),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--artworks', type=int, default=200_000)
+    parser.add_argument('-n', type=int, default=100)
+    parser.add_argument('--user-block', type=int, default=256)
+    parser.add_argument('--artwork-block', type=int, default=32768)
+    parser.add_argument('--single-sample', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = build_recommender(args.artworks, directory)
+        recommender.swipe_log.close()
+    add_users(recommender, args.users)
+    store = recommender.feature_store
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = recommender.batch_recommendations(n_recommendations=args.n, user_block=args.user_block,
+                                                artwork_block=args.artwork_block)
+    batch = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    sample = results.user_ids[:args.single_sample].tolist()
+    start = time.perf_counter()
+    singles = [recommender._get_similarity_based_recommendations(u, args.n, store) for u in sample]
+    single = (time.perf_counter() - start) / len(sample) * len(results)
+    agree = np.mean([s == results.recommendations(u, store) for u, s in zip(sample, singles)])
+
+    print(f"{len(results)} users x {args.artworks} artworks, top {args.n}, "
+          f"tiles of {args.user_block} x {args.artwork_block}")
+    print(f"  batch:    {batch:8.1f}s ({len(results) / batch:,.0f} users/s), peak {peak / 2**20:.0f} MiB")
+    print(f"  per user: {single:8.1f}s (extrapolated from {len(sample)} users), {single / batch:.1f}x slower")
+    print(f"  identical top {args.n} for {agree:.0%} of sampled users")
+
+
+if __name__ == '__main__':
+    main()
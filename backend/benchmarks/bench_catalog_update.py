@@ -0,0 +1,61 @@
+"""
+Benchmark incremental catalog updates against refitting the whole catalog.
+
+Run from the backend directory:
+    python -m benchmarks.bench_catalog_update --artworks 1000000 --delta 1000
+
+"refit" is what process_artwork_features does: fit the scaler and PCA on the
+whole catalog and rebuild the IVF index. "add" is ArtRecommender.add_artworks,
+which projects only the new artworks with the fitted pipeline and inserts
+them into the index; "remove" is remove_artworks for the same number of
+artworks. Drift is FeatureStore.drift() after the update.
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from racomandation.racomandation import ArtRecommender
+from racomandation.feature_store import FeatureStore
+from racomandation.vector_index import make_index
+from benchmarks.synthetic import N_RAW_FEATURES
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--artworks', type=int, default=1_000_000)
+    parser.add_argument('--delta', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    artwork_data = {f"image_{i}.jpg": row for i, row in enumerate(rng.random((args.artworks, N_RAW_FEATURES)))}
+    delta = {f"new_{i}.jpg": row for i, row in enumerate(rng.random((args.delta, N_RAW_FEATURES)))}
+
+    def refit(data):
+        store = FeatureStore.build(data)
+        return store, make_index('ivf').build(store.unit, store.version)
+
+    (store, index), initial = timed(refit, artwork_data)
+    _, full = timed(refit, {**artwork_data, **delta})
+
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = ArtRecommender(preferences_file=os.path.join(directory, 'user_preferences.json'))
+        recommender.load_feature_store(store, index)
+        updated, add = timed(recommender.add_artworks, delta)
+        _, remove = timed(recommender.remove_artworks, list(delta))
+        recommender.swipe_log.close()
+
+    print(f"{args.artworks} artworks, {args.delta} changed (initial fit + index: {initial:.1f}s)")
+    print(f"  refit:  {full * 1000:10.1f} ms")
+    print(f"  add:    {add * 1000:10.1f} ms ({full / add:.0f}x faster), drift {updated.drift():.4f}")
+    print(f"  remove: {remove * 1000:10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
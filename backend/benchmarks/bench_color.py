@@ -0,0 +1,62 @@
+"""
+Benchmark the dominant-color modes of ImageFeatureExtractor for speed and
+fidelity against the full KMeans reference.
+
+Run from the backend directory:
+    python -m benchmarks.bench_color --images ../client/public/wikiart_images --limit 50
+
+Fidelity is reported as the mean absolute difference of the color
+proportion features from the 'kmeans' mode, and as the palette's
+quantization error (mean squared RGB distance of each pixel to its nearest
+dominant color) relative to 'kmeans'.
+"""
+import argparse
+import os
+import time
+import numpy as np
+from PIL import Image
+from racomandation.image_extraction import ImageFeatureExtractor, COLOR_MODES, IMAGE_EXTENSIONS
+
+
+def load_pixels(directory, limit):
+    filenames = sorted(f for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    for filename in filenames:
+        img = Image.open(os.path.join(directory, filename)).convert('RGB').resize((150, 150))
+        yield np.array(img).reshape(-1, 3)
+
+
+def quantization_error(pixels, colors):
+    distances = ((pixels[:, None, :].astype(np.float64) - colors[None, :, :]) ** 2).sum(axis=2)
+    return distances.min(axis=1).mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', default=os.path.join('..', 'client', 'public', 'wikiart_images'))
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    images = list(load_pixels(args.images, args.limit))
+    results = {}
+    for mode in COLOR_MODES:
+        extractor = ImageFeatureExtractor(color_mode=mode)
+        start = time.perf_counter()
+        palettes = [extractor._dominant_colors(pixels) for pixels in images]
+        elapsed = time.perf_counter() - start
+        repeat = [extractor._dominant_colors(pixels)[1] for pixels in images[:5]]
+        deterministic = all(np.array_equal(a, b[1]) for a, b in zip(repeat, palettes))
+        errors = [quantization_error(pixels, colors) for pixels, (colors, _) in zip(images, palettes)]
+        results[mode] = (elapsed, palettes, np.mean(errors), deterministic)
+
+    reference_time, reference, reference_error, _ = results['kmeans']
+    print(f"{len(images)} images")
+    print(f"{'mode':>10} {'ms/image':>9} {'speedup':>8} {'proportion MAE':>15} "
+          f"{'quant. error vs kmeans':>23} {'deterministic':>14}")
+    for mode, (elapsed, palettes, error, deterministic) in results.items():
+        mae = np.mean([np.abs(p - r).mean() for (_, p), (_, r) in zip(palettes, reference)])
+        print(f"{mode:>10} {elapsed / len(images) * 1000:>9.1f} {reference_time / elapsed:>7.1f}x "
+              f"{mae:>15.4f} {error / reference_error:>22.2f}x {str(deterministic):>14}")
+
+
+if __name__ == "__main__":
+    main()
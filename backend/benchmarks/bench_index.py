@@ -0,0 +1,87 @@
+"""
+Benchmark the IVF vector index against the exact brute-force scan.
+
+Run from the backend directory:
+    python -m benchmarks.bench_index --sizes 100000 1000000 --probes 4 8 16 32
+
+Vectors are drawn from a Gaussian mixture so the catalog has cluster
+structure like real embeddings. Queries are the normalized mean of a few
+catalog vectors (like a user's liked profile), and each query excludes a
+random set of "seen" rows. Recall@k is the fraction of the exact top k that
+the index returns.
+"""
+import argparse
+import time
+import numpy as np
+from racomandation.vector_index import BruteForceIndex, IVFIndex, _normalize
+
+
+def synthetic_vectors(n, dim, n_clusters=200, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(n_clusters, size=n)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return _normalize(vectors).astype(np.float32)
+
+
+def synthetic_queries(vectors, n_queries, n_liked=20, n_seen=60, seed=1):
+    rng = np.random.default_rng(seed)
+    queries, masks = [], []
+    for _ in range(n_queries):
+        liked = rng.choice(len(vectors), size=n_liked, replace=False)
+        queries.append(_normalize(vectors[liked].mean(axis=0, keepdims=True))[0])
+        mask = np.zeros(len(vectors), dtype=bool)
+        mask[liked] = True
+        mask[rng.choice(len(vectors), size=n_seen, replace=False)] = True
+        masks.append(mask)
+    return queries, masks
+
+
+def run_queries(search, queries, masks):
+    """Return per-query results and latencies in milliseconds"""
+    results, latencies = [], []
+    for query, mask in zip(queries, masks):
+        start = time.perf_counter()
+        rows, _ = search(query, mask)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(rows)
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--dim', type=int, default=46)
+    parser.add_argument('--probes', type=int, nargs='+', default=[4, 8, 16, 32])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        vectors = synthetic_vectors(n, args.dim)
+        queries, masks = synthetic_queries(vectors, args.queries)
+
+        exact = BruteForceIndex().build(vectors)
+        truth, exact_ms = run_queries(lambda q, m: exact.search(q, args.k, exclude=m), queries, masks)
+
+        start = time.perf_counter()
+        ivf = IVFIndex().build(vectors)
+        build_s = time.perf_counter() - start
+
+        print(f"\n{n} vectors x {args.dim} dims, {ivf.n_lists} lists, built in {build_s:.2f}s")
+        print(f"{'method':>12} {'recall@' + str(args.k):>10} {'p50 ms':>9} {'p95 ms':>9} {'speedup':>8}")
+        print(f"{'exact':>12} {1.0:>10.3f} {np.percentile(exact_ms, 50):>9.3f} "
+              f"{np.percentile(exact_ms, 95):>9.3f} {1.0:>7.1f}x")
+        for n_probe in args.probes:
+            found, ivf_ms = run_queries(
+                lambda q, m: ivf.search(q, args.k, exclude=m, n_probe=n_probe), queries, masks)
+            recall = np.mean([len(np.intersect1d(a, b)) / len(a) for a, b in zip(truth, found)])
+            # Both paths must honor the exclusion mask
+            assert not any(m[rows].any() for rows, m in zip(found, masks))
+            print(f"{'ivf/' + str(n_probe):>12} {recall:>10.3f} {np.percentile(ivf_ms, 50):>9.3f} "
+                  f"{np.percentile(ivf_ms, 95):>9.3f} "
+                  f"{np.median(exact_ms) / np.median(ivf_ms):>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
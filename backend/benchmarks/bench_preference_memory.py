@@ -0,0 +1,100 @@
+"""
+Measure the memory per user of the in-memory preferences.
+
+Run from the backend directory:
+    python -m benchmarks.bench_preference_memory --users 1000000 --history 30
+
+"legacy" is the original representation: a dict of liked/disliked lists of
+artwork ID strings as json.load returns them (one string object per swipe),
+plus the user_preferences_file_image copy holding a dict and a feature row
+view per swipe. It is measured on --legacy-sample users and extrapolated,
+since at a million users it does not fit in memory. "compact" is
+PreferenceStore, measured for all users: sorted int32 code arrays with the
+artwork IDs interned once. Memory is what tracemalloc attributes to building
+each structure.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from racomandation.preferences import PreferenceStore
+from benchmarks.synthetic import N_RAW_FEATURES, artwork_ids
+
+
+def synthetic_users(n_users, history, art_ids, seed=1, chunk=10_000):
+    """Yield (user_id, liked IDs, disliked IDs) with history random swipes each, duplicates included"""
+    rng = np.random.default_rng(seed)
+    for first in range(0, n_users, chunk):
+        count = min(chunk, n_users - first)
+        picks = art_ids[rng.integers(len(art_ids), size=(count, history))]
+        likes = rng.random((count, history)) < 0.5
+        for i in range(count):
+            yield f"user-{first + i}", picks[i][likes[i]].tolist(), picks[i][~likes[i]].tolist()
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def build_legacy(users, raw, index):
+    preferences, file_image = {}, {}
+    for user_id, liked, disliked in users:
+        # Round trip through JSON so every swipe holds its own string, as after load_snapshot
+        entry = json.loads(json.dumps({'liked': liked, 'disliked': disliked}))
+        preferences[user_id] = entry
+        file_image[user_id] = {
+            choice: [{'file_name': name, 'file_data': raw[index[name]]} for name in entry[choice]]
+            for choice in ('liked', 'disliked')
+        }
+    return preferences, file_image
+
+
+def build_compact(users):
+    store = PreferenceStore()
+    for user_id, liked, disliked in users:
+        store.set(user_id, liked, disliked)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--history', type=int, default=30, help='swipes per user')
+    parser.add_argument('--artworks', type=int, default=100_000)
+    parser.add_argument('--legacy-sample', type=int, default=20_000)
+    args = parser.parse_args()
+
+    art_ids = np.array(artwork_ids(args.artworks))
+    index = {art_id: i for i, art_id in enumerate(art_ids.tolist())}
+    raw = np.random.default_rng(0).random((args.artworks, N_RAW_FEATURES)).astype(np.float32)
+
+    sample = min(args.legacy_sample, args.users)
+    (preferences, _), legacy_bytes, legacy_time = measure(
+        lambda: build_legacy(synthetic_users(sample, args.history, art_ids), raw, index))
+    legacy_swipes = sum(len(entry['liked']) + len(entry['disliked']) for entry in preferences.values())
+    del preferences
+
+    store, compact_bytes, compact_time = measure(
+        lambda: build_compact(synthetic_users(args.users, args.history, art_ids)))
+    kept = sum(len(store[user_id].liked) + len(store[user_id].disliked) for user_id in store)
+
+    legacy_per_user = legacy_bytes / sample
+    compact_per_user = compact_bytes / args.users
+    print(f"{args.users} users x {args.history} swipes over {args.artworks} artworks")
+    print(f"  legacy:  {legacy_per_user:8.0f} B/user  ({legacy_per_user * args.users / 2**30:6.2f} GiB, "
+          f"extrapolated from {sample} users, {legacy_time / sample * 1e6:.1f} us/user)")
+    print(f"  compact: {compact_per_user:8.0f} B/user  ({compact_bytes / 2**30:6.2f} GiB, "
+          f"{compact_time / args.users * 1e6:.1f} us/user, {len(store.codes)} interned IDs)")
+    print(f"  {legacy_per_user / compact_per_user:.1f}x smaller; "
+          f"{legacy_swipes / sample:.1f} swipes/user stored before, {kept / args.users:.1f} after dedup")
+
+
+if __name__ == '__main__':
+    main()
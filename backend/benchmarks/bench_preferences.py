@@ -0,0 +1,103 @@
+"""
+Benchmark swipe persistence: append-only swipe log vs full JSON rewrite.
+
+Run from the backend directory:
+    python -m benchmarks.bench_preferences --swipes 1000000
+
+Replays synthetic swipes through SwipeLog, reports append throughput and
+latency percentiles, then times compaction and the snapshot + log rebuild
+done at startup. The original full rewrite of user_preferences.json is timed
+at a few history sizes to show how its per-swipe cost grows.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from racomandation.swipe_log import SwipeLog, load_snapshot, write_snapshot
+from benchmarks.synthetic import synthetic_swipes
+
+
+def rebuild(snapshot_path, log):
+    """Same rebuild ArtRecommender._load_preferences performs"""
+    seq, preferences = load_snapshot(snapshot_path)
+    for record in log.replay(after_seq=seq):
+        entry = preferences.setdefault(record['user'], {'liked': [], 'disliked': []})
+        entry['liked' if record['liked'] else 'disliked'].append(record['art'])
+    return preferences
+
+
+def bench_log(directory, args):
+    log_path = os.path.join(directory, 'user_preferences.log')
+    snapshot_path = os.path.join(directory, 'user_preferences.json')
+    log = SwipeLog(log_path, fsync_every=args.fsync_every)
+    preferences = {}
+
+    latencies = np.empty(args.swipes)
+    start = time.perf_counter()
+    for i, (user, art, liked) in enumerate(synthetic_swipes(args.swipes, args.users, args.artworks)):
+        t0 = time.perf_counter()
+        entry = preferences.setdefault(user, {'liked': [], 'disliked': []})
+        entry['liked' if liked else 'disliked'].append(art)
+        log.append(user, art, liked)
+        latencies[i] = time.perf_counter() - t0
+    log.flush()
+    elapsed = time.perf_counter() - start
+
+    p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9]) * 1e6
+    print(f"Appended {args.swipes} swipes in {elapsed:.2f}s "
+          f"({args.swipes / elapsed:,.0f} swipes/s, fsync every {args.fsync_every})")
+    print(f"  append latency p50 {p50:.1f}us  p99 {p99:.1f}us  p99.9 {p999:.1f}us")
+    print(f"  log size {os.path.getsize(log_path) / 1e6:.1f} MB")
+
+    start = time.perf_counter()
+    rebuilt = rebuild(snapshot_path, log)
+    print(f"Rebuilt {len(rebuilt)} users from log in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    with log.locked():
+        log.flush()
+        write_snapshot(snapshot_path, log.seq, preferences)
+        log.truncate()
+    print(f"Compacted into snapshot in {time.perf_counter() - start:.2f}s "
+          f"({os.path.getsize(snapshot_path) / 1e6:.1f} MB)")
+
+    start = time.perf_counter()
+    rebuilt = rebuild(snapshot_path, log)
+    print(f"Rebuilt {len(rebuilt)} users from snapshot in {time.perf_counter() - start:.2f}s")
+    log.close()
+
+
+def bench_full_rewrite(directory, args):
+    path = os.path.join(directory, 'legacy_preferences.json')
+    print("Full rewrite per swipe (original _save_preferences):")
+    for total in args.rewrite_sizes:
+        preferences = {}
+        for user, art, liked in synthetic_swipes(total, args.users, args.artworks):
+            entry = preferences.setdefault(user, {'liked': [], 'disliked': []})
+            entry['liked' if liked else 'disliked'].append(art)
+        start = time.perf_counter()
+        with open(path, 'w') as file:
+            json.dump(preferences, file, indent=2)
+        cost = time.perf_counter() - start
+        print(f"  {total:>9} swipes stored: {cost * 1000:9.1f} ms per swipe "
+              f"(~{cost * args.swipes / 3600:,.1f} h to replay {args.swipes} swipes at this size)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--swipes', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--artworks', type=int, default=50_000)
+    parser.add_argument('--fsync-every', type=int, default=64)
+    parser.add_argument('--rewrite-sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_log(directory, args)
+        bench_full_rewrite(directory, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Load test /api/swipe latency with and without the per-user candidate queue.
+
+Run from the backend directory:
+    python -m benchmarks.bench_queue --artworks 200000 --users 50 --swipes 40 --threads 8
+
+Simulated users swipe through the cards they are shown from several threads.
+"sync" is the original handler (record_swipe trains the model, then
+get_recommendations rescores the whole catalog); "queue" is
+ArtRecommender.swipe, which pops from the precomputed queue and leaves
+training and rescoring to the background worker. Every user's first request
+ranks their queue inline; it is timed separately ("first ms") before the
+concurrent swipes start.
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from racomandation.racomandation import ArtRecommender
+from benchmarks.bench_scoring import build_recommender
+
+
+def run_user(recommender, mode, user_id, n_swipes, seed):
+    rng = np.random.default_rng(seed)
+    latencies = []
+    if mode == 'sync':
+        cards = recommender.get_recommendations(user_id)
+    else:
+        cards = recommender.next_recommendations(user_id)
+    for _ in range(n_swipes):
+        if not cards:
+            break
+        artwork_id, liked = cards[0], bool(rng.random() < 0.5)
+        start = time.perf_counter()
+        if mode == 'sync':
+            recommender.record_swipe(user_id, artwork_id, liked)
+            cards = recommender.get_recommendations(user_id)
+        else:
+            cards = recommender.swipe(user_id, artwork_id, liked)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def load_test(store, mode, args):
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = ArtRecommender(preferences_file=os.path.join(directory, 'user_preferences.json'))
+        recommender.load_feature_store(store)
+        users = [f"load-user-{i}" for i in range(args.users)]
+
+        # Warm up: each user's first request ranks their queue inline
+        warmup = []
+        for user_id in users:
+            start = time.perf_counter()
+            if mode == 'queue':
+                recommender.next_recommendations(user_id)
+            else:
+                recommender.get_recommendations(user_id)
+            warmup.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(
+                lambda i: run_user(recommender, mode, users[i], args.swipes, i),
+                range(args.users)
+            ))
+        elapsed = time.perf_counter() - start
+        recommender.candidate_queues.join()
+        recommender.swipe_log.close()
+
+    steady = np.array([x for r in results for x in r])
+    return np.array(warmup), steady, len(steady) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--artworks', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--swipes', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'queue'], choices=['sync', 'queue'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = build_recommender(args.artworks, directory)
+        recommender.swipe_log.close()
+    store = recommender.feature_store
+    print(f"\n{args.users} users x {args.swipes} swipes over {args.artworks} artworks, {args.threads} threads")
+    print(f"{'mode':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'first ms':>9} {'swipes/s':>9}")
+    for mode in args.modes:
+        warmup, steady, throughput = load_test(store, mode, args)
+        p50, p95, p99 = np.percentile(steady, [50, 95, 99])
+        print(f"{mode:>6} {p50:>9.3f} {p95:>9.3f} {p99:>9.3f} {steady.max():>9.3f} "
+              f"{np.median(warmup):>9.3f} {throughput:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark the vectorized scoring paths of ArtRecommender against the
+original per-artwork loops.
+
+Run from the backend directory:
+    python -m benchmarks.bench_scoring --sizes 500 50000 1000000
+
+The per-artwork loops make one sklearn call per artwork, so at large catalog
+sizes they are timed on a sample of --legacy-sample artworks and extrapolated
+linearly to the full catalog.
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from racomandation.racomandation import ArtRecommender
+from racomandation.preferences import PreferenceStore
+from benchmarks.synthetic import N_RAW_FEATURES
+
+USER_ID = 'bench-user'
+
+
+def build_recommender(n_artworks, directory, n_liked=40, n_disliked=20, seed=0):
+    """
+    Create a recommender with a synthetic catalog and one trained user
+
+    Parameters:
+    n_artworks: catalog size
+    directory: scratch directory for the preferences snapshot, swipe log
+               and lock, so the real user_preferences.json is never touched
+    """
+    rng = np.random.default_rng(seed)
+    raw = rng.random((n_artworks, N_RAW_FEATURES))
+    artwork_data = {f"image_{i}.jpg": raw[i] for i in range(n_artworks)}
+
+    recommender = ArtRecommender(preferences_file=os.path.join(directory, 'user_preferences.json'))
+    recommender.user_preferences = PreferenceStore(recommender.user_preferences.codes)
+    recommender.process_artwork_features(artwork_data)
+
+    seen = rng.choice(n_artworks, size=min(n_artworks, n_liked + n_disliked), replace=False)
+    recommender.user_preferences.set(
+        USER_ID,
+        liked=[f"image_{i}.jpg" for i in seen[:n_liked]],
+        disliked=[f"image_{i}.jpg" for i in seen[n_liked:]],
+    )
+    recommender._train_classifier(USER_ID)
+    return recommender
+
+
+def legacy_classifier_scores(recommender, art_ids):
+    """Original get_recommendations loop: one predict_proba call per artwork"""
+    preferences = recommender.user_preferences.to_dict()[USER_ID]
+    model = recommender._user_model(USER_ID)
+    predictions = {}
+    for art_id in art_ids:
+        features = recommender.artwork_matrix[recommender.artwork_index[art_id]]
+        if art_id not in preferences['liked'] and art_id not in preferences['disliked']:
+            predictions[art_id] = model.predict_proba(features.reshape(1, -1))[0][1]
+    return sorted(predictions.items(), key=lambda x: x[1], reverse=True)[:10]
+
+
+def legacy_similarity_scores(recommender, art_ids):
+    """Original _get_similarity_based_recommendations loop: one cosine_similarity call per artwork"""
+    preferences = recommender.user_preferences.to_dict()[USER_ID]
+    liked = [recommender.artwork_matrix[recommender.artwork_index[a]] for a in preferences['liked']]
+    user_profile = np.mean(liked, axis=0)
+    similarities = {}
+    for art_id in art_ids:
+        features = recommender.artwork_matrix[recommender.artwork_index[art_id]]
+        if art_id not in preferences['liked'] and art_id not in preferences['disliked']:
+            similarities[art_id] = cosine_similarity(
+                user_profile.reshape(1, -1),
+                features.reshape(1, -1)
+            )[0][0]
+    return sorted(similarities.items(), key=lambda x: x[1], reverse=True)[:10]
+
+
+def best_of(fn, repeats):
+    """Return the fastest wall-clock time of fn over a number of repeats"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(n_artworks, legacy_sample, repeats):
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = build_recommender(n_artworks, directory)
+        recommender.swipe_log.close()
+    sample_ids = recommender.artwork_ids[:min(legacy_sample, n_artworks)].tolist()
+    scale = n_artworks / len(sample_ids)
+
+    # The classifier path is used once the user is trained
+    vec_classifier = best_of(lambda: recommender.get_recommendations(USER_ID), repeats)
+    legacy_classifier = best_of(lambda: legacy_classifier_scores(recommender, sample_ids), 1) * scale
+
+    vec_similarity = best_of(lambda: recommender._get_similarity_based_recommendations(USER_ID, 10), repeats)
+    legacy_similarity = best_of(lambda: legacy_similarity_scores(recommender, sample_ids), 1) * scale
+
+    return {
+        'n_artworks': n_artworks,
+        'classifier': (legacy_classifier, vec_classifier),
+        'similarity': (legacy_similarity, vec_similarity),
+        'extrapolated': scale > 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 50_000, 1_000_000])
+    parser.add_argument('--legacy-sample', type=int, default=2_000,
+                        help='number of artworks the per-artwork loops are timed on')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'artworks':>10} {'path':>10} {'loop (s)':>12} {'vectorized (s)':>15} {'speedup':>9}")
+    for n_artworks in args.sizes:
+        result = run(n_artworks, args.legacy_sample, args.repeats)
+        for path in ('classifier', 'similarity'):
+            legacy, vectorized = result[path]
+            marker = '*' if result['extrapolated'] else ' '
+            print(f"{n_artworks:>10} {path:>10} {legacy:>11.3f}{marker} {vectorized:>15.4f} {legacy / vectorized:>8.0f}x")
+    print("* extrapolated from --legacy-sample artworks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark cold start of the Flask backend, from process spawn to the first
+served request.
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup --artworks 50000 --users 1 1000 10000
+
+Each run starts a fresh interpreter in a scratch directory holding a
+synthetic artwork_features.json and user_preferences.json, imports main and
+serves one request through the Flask test client. The first start compiles
+the feature store from JSON and fits the cold-start clusters; later starts
+memory-map the store and load the clusters. The phase columns are the
+breakdown create_app() records (tindeart_startup_seconds); "sklearn" tells
+whether serving the first request had to import it. The original
+startup (one JSON parse plus one re-parse per user, then a full fit) is
+timed in-process for comparison.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from racomandation.feature_store import FeatureStore
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+app = main.create_app(warm_up=False)
+loaded = time.perf_counter()
+response = app.test_client().get('/api/user_preferences')
+assert response.status_code == 200
+served = time.perf_counter()
+print(json.dumps({'startup': loaded - start, 'first_request': served - loaded,
+                  'sklearn': 'sklearn' in sys.modules, **app.extensions['tindeart'].startup}))
+"""
+
+
+def write_fixture(directory, n_artworks, n_users, swipes_per_user=50, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(directory, 'racomandation'), exist_ok=True)
+    features = {f"image_{i}.jpg": row.tolist() for i, row in enumerate(rng.random((n_artworks, 46)))}
+    with open(os.path.join(directory, 'racomandation', 'artwork_features.json'), 'w') as file:
+        json.dump(features, file, indent=4)
+    preferences = {}
+    for user in range(n_users):
+        arts = rng.integers(0, n_artworks, size=swipes_per_user)
+        preferences[f"user-{user}"] = {
+            'liked': [f"image_{a}.jpg" for a in arts[:swipes_per_user // 2]],
+            'disliked': [f"image_{a}.jpg" for a in arts[swipes_per_user // 2:]],
+        }
+    with open(os.path.join(directory, 'racomandation', 'user_preferences.json'), 'w') as file:
+        json.dump(preferences, file)
+
+
+def cold_start(directory):
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=directory, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - start
+    timings = json.loads(output.strip().splitlines()[-1])
+    return total, timings
+
+
+def legacy_startup(directory, n_users):
+    """Original startup: parse the JSON, fit, and re-parse the JSON once per user"""
+    path = os.path.join(directory, 'racomandation', 'artwork_features.json')
+    start = time.perf_counter()
+    with open(path, 'r') as file:
+        data = json.load(file)
+    parse = time.perf_counter() - start
+    FeatureStore.build(data)
+    return time.perf_counter() - start + parse * n_users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--artworks', type=int, default=50_000)
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 1_000, 10_000])
+    args = parser.parse_args()
+
+    phases = ('imports', 'preferences', 'catalog')
+    print(f"{'users':>7} {'variant':>12} {'spawn->first request (s)':>25} {'startup (s)':>12}"
+          + ''.join(f" {phase + ' (s)':>16}" for phase in phases) + f" {'sklearn':>8}")
+    for n_users in args.users:
+        directory = tempfile.mkdtemp()
+        try:
+            write_fixture(directory, args.artworks, n_users)
+            for variant in ('json import', 'store'):
+                total, timings = cold_start(directory)
+                print(f"{n_users:>7} {variant:>12} {total:>25.2f} {timings['startup']:>12.2f}"
+                      + ''.join(f" {timings[phase]:>16.3f}" for phase in phases) + f" {str(timings['sklearn']):>8}")
+            legacy = legacy_startup(directory, n_users)
+            print(f"{n_users:>7} {'original':>12} {legacy:>24.2f}*")
+        finally:
+            shutil.rmtree(directory)
+    print("* feature loading only, re-parse per user extrapolated from one parse")
+
+
+if __name__ == "__main__":
+    main()
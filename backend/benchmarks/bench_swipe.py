@@ -0,0 +1,58 @@
+"""
+Benchmark per-swipe model update latency as a user's history grows.
+
+Run from the backend directory:
+    python -m benchmarks.bench_swipe --history 2000
+
+Compares the per-user online update done by ArtRecommender._train_classifier
+with the original full RandomForestClassifier refit on every swipe.
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from benchmarks.bench_scoring import build_recommender
+
+USER_ID = 'swipe-user'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--artworks', type=int, default=50_000)
+    parser.add_argument('--history', type=int, default=2_000)
+    parser.add_argument('--checkpoints', type=int, nargs='+', default=[10, 100, 500, 1000, 2000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = build_recommender(args.artworks, directory)
+        recommender.swipe_log.close()
+    rng = np.random.default_rng(1)
+    swipes = rng.choice(args.artworks, size=args.history, replace=False)
+    labels = rng.random(args.history) < 0.5
+    recommender.user_preferences.set(USER_ID)
+
+    latencies = []
+    print(f"{'history':>8} {'online update (ms)':>19} {'full forest refit (ms)':>23}")
+    for i, (row, liked) in enumerate(zip(swipes, labels), start=1):
+        art_id = recommender.artwork_ids[row]
+        recommender.user_preferences.add(USER_ID, art_id, liked)
+
+        start = time.perf_counter()
+        recommender._train_classifier(USER_ID, art_id, liked)
+        latencies.append(time.perf_counter() - start)
+
+        if i in args.checkpoints:
+            X, y = recommender._training_data(USER_ID)
+            start = time.perf_counter()
+            RandomForestClassifier(n_estimators=100).fit(X, y)
+            refit = time.perf_counter() - start
+            recent = np.median(latencies[-min(50, len(latencies)):]) * 1000
+            print(f"{i:>8} {recent:>19.3f} {refit * 1000:>23.1f}")
+
+    print(f"Models cached: {len(recommender.user_models)}, "
+          f"approx memory: {recommender.user_models.memory_usage() / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
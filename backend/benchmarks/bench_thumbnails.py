@@ -0,0 +1,100 @@
+"""
+Benchmark serving thumbnails against the originals: bytes per swipe, decode
+time, and the cost of rendering thumbnails during feature extraction.
+
+Run from the backend directory:
+    python -m benchmarks.bench_thumbnails --images ../client/public/wikiart_images --limit 200
+
+Every swipe shows one card, so bytes per swipe is the mean file size of the
+size the card loads. Decode time is Pillow's full decode of the file, a
+stand-in for the browser's. Extraction is timed three ways over the same
+images: features only, features then a separate thumbnail pass (two
+decodes), and features with thumbnails rendered from the same decode
+(process_directory(thumbnails=...)). The features must be identical with and
+without thumbnails.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from racomandation.image_extraction import ImageFeatureExtractor, COLOR_MODES, IMAGE_EXTENSIONS
+from racomandation.thumbnails import ThumbnailCache
+
+
+def decode_ms(paths, repeat=3):
+    """Mean time to fully decode each file, best of repeat passes"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            with Image.open(path) as img:
+                img.load()
+        best = min(best, time.perf_counter() - start)
+    return best / len(paths) * 1e3
+
+
+def extract(extractor, directory, thumbnails=None):
+    start = time.perf_counter()
+    features = extractor.process_directory(directory, thumbnails=thumbnails)
+    return features, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', default=os.path.join('..', 'client', 'public', 'wikiart_images'))
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--color-mode', choices=COLOR_MODES, default='quantized')
+    args = parser.parse_args()
+
+    filenames = sorted(f for f in os.listdir(args.images) if f.lower().endswith(IMAGE_EXTENSIONS))[:args.limit]
+    scratch = tempfile.mkdtemp()
+    try:
+        # A directory holding only the selected images, for process_directory
+        images = os.path.join(scratch, 'images')
+        os.makedirs(images)
+        for filename in filenames:
+            os.symlink(os.path.abspath(os.path.join(args.images, filename)), os.path.join(images, filename))
+        extractor = ImageFeatureExtractor(color_mode=args.color_mode)
+
+        features, features_only = extract(extractor, images)
+        separate = ThumbnailCache(os.path.join(scratch, 'separate'))
+        start = time.perf_counter()
+        separate.build(images)
+        thumbnail_pass = time.perf_counter() - start
+        cache = ThumbnailCache(os.path.join(scratch, 'combined'))
+        combined_features, combined = extract(extractor, images, cache)
+        identical = all(np.array_equal(features[f], combined_features[f]) for f in features)
+
+        n = len(features)
+        print(f"{n} images, color mode {args.color_mode}, sizes "
+              + ', '.join(f"{size} {side}px" for size, side in cache.sizes.items()))
+        print(f"{'extraction':>34} {'ms/image':>9}")
+        print(f"{'features only':>34} {features_only / n * 1e3:>9.1f}")
+        print(f"{'features + separate thumbnail pass':>34} {(features_only + thumbnail_pass) / n * 1e3:>9.1f}")
+        print(f"{'features + thumbnails, one decode':>34} {combined / n * 1e3:>9.1f}")
+        print(f"Identical features with thumbnails: {identical}")
+
+        originals = [os.path.join(images, f) for f in features]
+        variants = {'original': originals}
+        for size in cache.sizes:
+            variants[size] = [cache.lookup(f, size)[0] for f in features]
+        base_bytes = np.mean([os.path.getsize(p) for p in originals])
+        base_decode = decode_ms(originals)
+        print(f"{'served':>10} {'KB/swipe':>9} {'vs orig':>8} {'decode ms':>10} {'vs orig':>8} {'megapixels':>11}")
+        for name, paths in variants.items():
+            size_bytes = np.mean([os.path.getsize(p) for p in paths])
+            decode = base_decode if name == 'original' else decode_ms(paths)
+            pixels = np.mean([np.prod(Image.open(p).size) for p in paths]) / 1e6
+            print(f"{name:>10} {size_bytes / 1024:>9.1f} {size_bytes / base_bytes:>7.1%} "
+                  f"{decode:>10.2f} {decode / base_decode:>7.1%} {pixels:>11.2f}")
+        if not identical:
+            raise SystemExit("Rendering thumbnails changed the extracted features")
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Check that gunicorn workers booting together all serve their first requests.
+
+Run from the backend directory (needs gunicorn):
+    python -m benchmarks.bench_worker_startup --workers 4 --rounds 5
+
+Each round deletes metadata.sqlite, starts gunicorn with gunicorn.conf.py
+and, as soon as it answers, sends --requests concurrent requests to
+/api/recommendations over separate connections, so they spread over the
+workers while they are still warming up. A round fails if any response is
+not 200 or the server log has a traceback. Also reports how long gunicorn
+takes to accept connections.
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from benchmarks.bench_workers import BACKEND_DIR, free_port
+from benchmarks.synthetic import write_catalog
+
+
+def first_request(port):
+    """Status of one /api/recommendations request on a new connection"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    connection.request('GET', '/api/recommendations')
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def start_round(directory, workers, port, log):
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        TINDEART_BIND=f"127.0.0.1:{port}",
+        TINDEART_FEATURE_STORE=os.path.join(directory, 'feature_store'),
+        TINDEART_PREFERENCES=os.path.join(directory, f"preferences_{port}.json"),
+        TINDEART_METADATA=os.path.join(directory, 'metadata.csv'),
+        TINDEART_METADATA_BACKEND='sqlite',
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=log
+    )
+    start = time.perf_counter()
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('HEAD', '/api/metrics')
+            connection.getresponse()
+            return server, time.perf_counter() - start
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=16, help='concurrent first requests per round')
+    parser.add_argument('--artworks', type=int, default=200_000,
+                        help='catalog size; a large CSV keeps the SQLite import slow enough to overlap')
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        write_catalog(directory, args.artworks)
+        sqlite_path = os.path.join(directory, 'metadata.sqlite')
+        print(f"{args.artworks} artworks, {args.workers} workers, {args.requests} first requests per round")
+        print(f"{'round':>6} {'up s':>6} {'non-200':>8} {'tracebacks':>11}")
+        for round_ in range(args.rounds):
+            if os.path.exists(sqlite_path):
+                os.remove(sqlite_path)
+            port = free_port()
+            log_path = os.path.join(directory, f"gunicorn_{round_}.log")
+            with open(log_path, 'w') as log:
+                server, up = start_round(directory, args.workers, port, log)
+                try:
+                    with Pool(args.requests) as pool:
+                        statuses = pool.map(first_request, [port] * args.requests)
+                finally:
+                    server.terminate()
+                    server.wait()
+            with open(log_path, 'r') as log:
+                tracebacks = log.read().count('Traceback')
+            bad = sum(status != 200 for status in statuses)
+            failures += bad + tracebacks
+            print(f"{round_:>6} {up:>6.2f} {bad:>8} {tracebacks:>11}")
+    if failures:
+        raise SystemExit(f"{failures} failed requests or tracebacks while the workers started")
+    print("All workers served their first requests")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark /api/swipe throughput as the number of gunicorn workers grows.
+
+Run from the backend directory (needs gunicorn):
+    python -m benchmarks.bench_workers --workers 1 2 4 8 --clients 16 --duration 10
+
+A synthetic catalog, metadata CSV and empty preferences are written to a
+temporary directory, then gunicorn is started with gunicorn.conf.py for each
+worker count and driven by client processes that swipe as random users over
+keep-alive connections. The clients run on the same machine as the server,
+so on small machines they compete for the same cores.
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+import numpy as np
+from benchmarks.synthetic import write_catalog
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(directory, workers, port):
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        TINDEART_BIND=f"127.0.0.1:{port}",
+        TINDEART_FEATURE_STORE=os.path.join(directory, 'feature_store'),
+        TINDEART_PREFERENCES=os.path.join(directory, f"preferences_{workers}.json"),
+        TINDEART_METADATA=os.path.join(directory, 'metadata.csv'),
+        TINDEART_METADATA_BACKEND='sqlite',
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/api/recommendations')
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def run_client(task):
+    """Swipe as random users until the deadline; returns request latencies in ms"""
+    port, art_ids, n_users, deadline, seed = task
+    rng = np.random.default_rng(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    while time.time() < deadline:
+        user = f"bench-{seed}-{rng.integers(n_users)}"
+        path = (f"/api/swipe?userid={user}&image={art_ids[rng.integers(len(art_ids))]}"
+                f"&liked={'true' if rng.random() < 0.5 else 'false'}")
+        start = time.perf_counter()
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status != 200:
+            raise RuntimeError(f"{path} returned {response.status}")
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--artworks', type=int, default=20_000)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--users', type=int, default=200, help='users per client')
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        art_ids = write_catalog(directory, args.artworks)
+        print(f"{args.artworks} artworks, {args.clients} clients, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for workers in args.workers:
+            port = free_port()
+            server = start_server(directory, workers, port)
+            try:
+                deadline = time.time() + args.duration
+                tasks = [(port, art_ids, args.users, deadline, seed) for seed in range(args.clients)]
+                with Pool(args.clients) as pool:
+                    results = pool.map(run_client, tasks)
+            finally:
+                server.terminate()
+                server.wait()
+            latencies = np.concatenate([np.array(r) for r in results])
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"{workers:>8} {len(latencies) / args.duration:>8.0f} {p50:>8.1f} {p99:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""
+Offline evaluation: replay swipes in order through recommender variants and
+report quality against speed.
+
+Run from the backend directory:
+    python -m benchmarks.evaluate --artworks 500 --users 50 --history 60
+    python -m benchmarks.evaluate --preferences racomandation/user_preferences.json \
+        --store racomandation/feature_store --variants exact ivf
+    python -m benchmarks.evaluate --out report.json
+
+Every variant replays the same swipes into a fresh ArtRecommender, in its
+own process. Before each swipe is recorded, the variant recommends --k
+artworks to the swiping user and scores the swiped artwork:
+
+    hit@k     share of likes whose artwork was among the k recommendations
+    AUC       mean over users of the ROC AUC of the scores against the
+              swipes (score_artworks, i.e. what the ranking sorts by)
+    recall    for variants with a vector index, mean share of the exact
+              top k by profile similarity that the index returns, over
+              steps where the user has a like (whichever path serves them)
+    rec ms    latency of get_recommendations, p50 and p95
+    update ms latency of record_swipe with inline training, p50
+
+Trained users are ranked by their classifier, which scores the whole
+catalog, so the index only serves users before their model is trained.
+The similarity-ivf variants never train one, which puts every
+recommendation through the index. A variant is judged against the first one (the baseline). Models and the
+popularity ranking are trained inline, not in the background, so a replay
+does not depend on thread timing; update latency therefore includes the
+forest rebuilds a server runs in the background. With more --workers than
+free cores the variants compete for them and latencies are inflated, so
+compare latency between runs with the same --workers.
+
+Without --preferences, users with a hidden taste in the feature space
+swipe random artworks (benchmarks.synthetic.synthetic_taste_swipes). With
+--preferences, the snapshot's swipes come first, user by user in a seeded
+random order (the snapshot does not keep the order), followed by the swipe
+log in sequence order.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+from racomandation.feature_store import FeatureStore
+from racomandation.swipe_log import load_snapshot
+from benchmarks.synthetic import synthetic_features, synthetic_taste_swipes
+
+
+def configure_exact(recommender, store):
+    return store, None
+
+
+def configure_ivf(recommender, store, n_probe=16):
+    from racomandation.vector_index import make_index
+    index = make_index('ivf', n_probe=n_probe)
+    index.build(store.unit, store.version)
+    return store, index
+
+
+def configure_ivf_probe4(recommender, store):
+    return configure_ivf(recommender, store, n_probe=4)
+
+
+def configure_float64(recommender, store):
+    # Same catalog in double precision, to check what float32 costs in quality
+    return FeatureStore(
+        store.ids, store.raw, store.embeddings.astype(np.float64), store.scaler_mean, store.scaler_scale,
+        store.pca_mean, store.pca_components, unit=store.unit.astype(np.float64),
+        version=store.version, space=store.space, index=store.index
+    ), None
+
+
+def configure_online_only(recommender, store):
+    # The incremental model alone, without the periodically rebuilt forest
+    recommender.user_models.rebuild_every = float('inf')
+    return store, None
+
+
+def configure_similarity_only(recommender, store):
+    # Never switch to the classifier: profile similarity for every user
+    recommender._train_classifier = lambda *args, **kwargs: None
+    return store, None
+
+
+def configure_similarity_ivf(recommender, store):
+    # Profile similarity served by the index, for every user
+    configure_similarity_only(recommender, store)
+    return configure_ivf(recommender, store)
+
+
+def configure_similarity_ivf_probe4(recommender, store):
+    configure_similarity_only(recommender, store)
+    return configure_ivf(recommender, store, n_probe=4)
+
+
+VARIANTS = {
+    'exact': configure_exact,
+    'ivf': configure_ivf,
+    'ivf-probe4': configure_ivf_probe4,
+    'float64': configure_float64,
+    'online-only': configure_online_only,
+    'similarity-only': configure_similarity_only,
+    'similarity-ivf': configure_similarity_ivf,
+    'similarity-ivf-probe4': configure_similarity_ivf_probe4,
+}
+
+
+def preference_swipes(preferences_file, seed=0):
+    """
+    Swipes of a preferences snapshot followed by its swipe log
+
+    Returns:
+    list of (user_id, artwork_id, liked) in replay order
+    """
+    rng = np.random.default_rng(seed)
+    seq, users = load_snapshot(preferences_file)
+    swipes = []
+    for user_id, preferences in users.items():
+        history = ([(user_id, art_id, True) for art_id in preferences.get('liked', [])]
+                   + [(user_id, art_id, False) for art_id in preferences.get('disliked', [])])
+        swipes.extend(history[i] for i in rng.permutation(len(history)))
+    log_path = os.path.splitext(preferences_file)[0] + '.log'
+    if os.path.exists(log_path):
+        records = []
+        with open(log_path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn trailing line
+                if 'user' in record and record['seq'] > seq:
+                    records.append(record)
+        records.sort(key=lambda record: record['seq'])
+        swipes.extend((record['user'], record['art'], record['liked']) for record in records)
+    return swipes
+
+
+def auc(labels, scores):
+    """ROC AUC of scores against boolean labels (Mann-Whitney, ties count half)"""
+    labels = np.asarray(labels, dtype=bool)
+    scores = np.asarray(scores, dtype=np.float64)
+    positives, negatives = scores[labels], scores[~labels]
+    greater = (positives[:, None] > negatives[None, :]).sum()
+    ties = (positives[:, None] == negatives[None, :]).sum()
+    return (greater + ties / 2) / (len(positives) * len(negatives))
+
+
+def index_recall(recommender, store, index, user_id, k):
+    """
+    Share of the exact top k by profile similarity that the index returns
+
+    Returns:
+    recall in [0, 1], or None for users without a like
+    """
+    preferences = recommender.user_preferences.get(user_id)
+    if preferences is None or not len(preferences.liked):
+        return None
+    profile = recommender._user_profile(store, preferences)
+    seen = recommender._seen_mask(store, user_id)
+    candidates = np.flatnonzero(~seen)
+    exact = candidates[np.argsort(-(store.unit[candidates] @ profile), kind='stable')[:k]]
+    if not len(exact):
+        return None
+    rows, _ = index.search(profile, k, exclude=seen)
+    return len(np.intersect1d(rows, exact)) / len(exact)
+
+
+def replay(variant, store_dir, swipes, k, seed):
+    """
+    Replay swipes through a fresh ArtRecommender configured by VARIANTS[variant]
+
+    Runs in a worker process; preferences go to a scratch snapshot and log.
+
+    Returns:
+    dict of quality and latency results
+    """
+    from racomandation.racomandation import ArtRecommender
+    from racomandation.user_models import UserModelRegistry
+    from racomandation.popularity import PopularityRanking
+
+    np.random.seed(seed)  # The forests draw from the global generator
+    workdir = tempfile.mkdtemp()
+    try:
+        recommender = ArtRecommender(preferences_file=os.path.join(workdir, 'user_preferences.json'))
+        recommender.user_models = UserModelRegistry(background=False)
+        recommender.popularity = PopularityRanking(recommender.user_preferences.codes, background=False)
+        store, index = VARIANTS[variant](recommender, FeatureStore.load(store_dir))
+        recommender.load_feature_store(store, index)
+
+        hits = likes = skipped = repeats = 0
+        labels, scores = {}, {}
+        recalls, recall_seconds = [], 0.0
+        recommend_seconds, update_seconds = [], []
+        start = time.perf_counter()
+        for user_id, art_id, liked in swipes:
+            if art_id not in store.index:
+                skipped += 1
+                continue
+            if recommender.user_preferences.action(user_id, art_id) is not None:
+                # Already seen, so it can't be recommended: train on it, don't score it
+                repeats += 1
+                recommender.record_swipe(user_id, art_id, liked)
+                continue
+            t = time.perf_counter()
+            recommendations = recommender.get_recommendations(user_id, k)
+            recommend_seconds.append(time.perf_counter() - t)
+            if liked:
+                likes += 1
+                hits += art_id in recommendations
+            if index is not None:
+                t = time.perf_counter()
+                recall = index_recall(recommender, store, index, user_id, k)
+                recall_seconds += time.perf_counter() - t  # Not part of the replay's throughput
+                if recall is not None:
+                    recalls.append(recall)
+            labels.setdefault(user_id, []).append(liked)
+            scores.setdefault(user_id, []).append(recommender.score_artworks(user_id, [art_id])[0])
+            t = time.perf_counter()
+            recommender.record_swipe(user_id, art_id, liked)
+            update_seconds.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start - recall_seconds
+        recommender.swipe_log.close()
+    finally:
+        shutil.rmtree(workdir)
+
+    user_aucs = [auc(labels[user_id], scores[user_id]) for user_id in labels
+                 if 0 < sum(labels[user_id]) < len(labels[user_id])]
+    recommend_ms = np.asarray(recommend_seconds) * 1000
+    update_ms = np.asarray(update_seconds) * 1000
+    return {
+        'variant': variant,
+        'steps': len(recommend_seconds),
+        'skipped': skipped,
+        'repeats': repeats,
+        'hit_rate': hits / likes if likes else float('nan'),
+        'auc': float(np.mean(user_aucs)) if user_aucs else float('nan'),
+        'users_with_auc': len(user_aucs),
+        'index_recall': float(np.mean(recalls)) if recalls else float('nan'),
+        'recommend_p50_ms': float(np.percentile(recommend_ms, 50)) if len(recommend_ms) else float('nan'),
+        'recommend_p95_ms': float(np.percentile(recommend_ms, 95)) if len(recommend_ms) else float('nan'),
+        'update_p50_ms': float(np.percentile(update_ms, 50)) if len(update_ms) else float('nan'),
+        'seconds': elapsed,
+    }
+
+
+def print_report(results, k):
+    base = results[0]
+    print(f"{'variant':>21} {f'hit@{k}':>8} {'AUC':>7} {f'recall@{k}':>10} {'rec p50 ms':>11} {'rec p95 ms':>11} "
+          f"{'update p50 ms':>14} {'steps/s':>8} {'vs ' + base['variant']:>24}")
+    for result in results:
+        delta = ''
+        if result is not base:
+            speedup = base['recommend_p50_ms'] / result['recommend_p50_ms']
+            delta = (f"{result['hit_rate'] - base['hit_rate']:+.3f} hit "
+                     f"{result['auc'] - base['auc']:+.3f} AUC {speedup:.2f}x")
+        recall = '-' if np.isnan(result['index_recall']) else f"{result['index_recall']:.3f}"
+        print(f"{result['variant']:>21} {result['hit_rate']:>8.3f} {result['auc']:>7.3f} {recall:>10} "
+              f"{result['recommend_p50_ms']:>11.3f} {result['recommend_p95_ms']:>11.3f} "
+              f"{result['update_p50_ms']:>14.3f} {result['steps'] / result['seconds']:>8.1f} {delta:>24}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS),
+                        help='variants to replay; the first one is the baseline')
+    parser.add_argument('--artworks', type=int, default=500)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--history', type=int, default=60, help='swipes per synthetic user')
+    parser.add_argument('--taste-features', type=int, default=4,
+                        help='raw features each synthetic user\'s taste depends on')
+    parser.add_argument('--noise', type=float, default=0.5, help='noise of the synthetic likes')
+    parser.add_argument('--preferences', help='replay this preferences snapshot (and its swipe log) instead')
+    parser.add_argument('--store', help='feature store directory for --preferences')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='variants replayed at once')
+    parser.add_argument('--out', help='write the report as JSON')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    try:
+        if args.preferences:
+            if not args.store:
+                parser.error("--preferences needs --store")
+            store_dir = args.store
+            swipes = preference_swipes(args.preferences, args.seed)
+            source = {'preferences': args.preferences, 'store': args.store}
+        else:
+            features = synthetic_features(args.artworks, args.seed)
+            store_dir = os.path.join(scratch, 'feature_store')
+            FeatureStore.build(features).save(store_dir)
+            swipes = synthetic_taste_swipes(features, args.users, args.history, args.taste_features,
+                                            args.noise, args.seed + 1)
+            source = {'artworks': args.artworks, 'users': args.users, 'history': args.history,
+                      'taste_features': args.taste_features, 'noise': args.noise}
+        n_users = len({user_id for user_id, _, _ in swipes})
+        print(f"Replaying {len(swipes)} swipes by {n_users} users through {len(args.variants)} variants, "
+              f"{min(args.workers, len(args.variants))} at a time")
+
+        # Fresh interpreters: forked workers would inherit the parent's threads and locks
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(replay, variant, store_dir, swipes, args.k, args.seed)
+                       for variant in args.variants]
+            results = [future.result() for future in futures]
+    finally:
+        shutil.rmtree(scratch)
+
+    print_report(results, args.k)
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump({'source': source, 'k': args.k, 'seed': args.seed, 'workers': args.workers,
+                       'results': results}, file, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Reproducible benchmark suite: latency percentiles and throughput of the
+recommender API and the Flask routes on synthetic data.
+
+Run from the backend directory:
+    python -m benchmarks.suite --artworks 10000 100000 --users 1000 --out results.json
+    python -m benchmarks.suite --artworks 10000 100000 --users 1000 --compare results.json
+
+Every configuration (catalog size x users x history length) gets a scratch
+directory with a synthetic feature store, metadata CSV and preferences
+snapshot generated from --seed, and runs in a fresh interpreter that imports
+main exactly as a server would. Each scenario issues --requests calls by
+random known users after --warmup untimed ones:
+
+    api.get_recommendations   ArtRecommender.get_recommendations (full ranking)
+    api.record_swipe          ArtRecommender.record_swipe with inline training
+    api.swipe                 ArtRecommender.swipe (queue hit, training in background)
+    api.format_recommendations  metadata enrichment of 10 recommendations
+    http.swipe                GET /api/swipe through the Flask test client
+    http.recommendations      GET /api/recommendations through the test client
+
+Results are written as JSON (--out) with the environment they were measured
+in. --compare reads an earlier file and exits with status 1 if any scenario
+present in both got slower at p50 or p95 by more than --tolerance (and by
+more than --min-delta-ms, so sub-millisecond jitter is not a regression).
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from racomandation.swipe_log import write_snapshot
+from benchmarks.synthetic import write_catalog, synthetic_histories
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = (
+    'api.get_recommendations',
+    'api.record_swipe',
+    'api.swipe',
+    'api.format_recommendations',
+    'http.swipe',
+    'http.recommendations',
+)
+COMPARED = ('p50_ms', 'p95_ms')
+
+
+def summarize(latencies, elapsed):
+    """Percentiles in milliseconds plus throughput for one scenario"""
+    latencies = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'n': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(float(p50), 4),
+        'p95_ms': round(float(p95), 4),
+        'p99_ms': round(float(p99), 4),
+        'max_ms': round(float(latencies.max()), 4),
+    }
+
+
+def measure(call, args_stream, n_requests, warmup):
+    """Time call(*args) for n_requests argument tuples after warmup untimed calls"""
+    for args in itertools.islice(args_stream, warmup):
+        call(*args)
+    latencies = []
+    start = time.perf_counter()
+    for args in itertools.islice(args_stream, n_requests):
+        t = time.perf_counter()
+        call(*args)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_config(config):
+    """
+    Run every selected scenario against the catalog in config['directory']
+
+    Called in the child process, with the TINDEART_* environment already
+    pointing at the scratch directory.
+
+    Returns:
+    dict of scenario -> summary
+    """
+    import main
+    import utils
+
+    app = main.create_app(warm_up=False)
+    recommender = app.extensions['tindeart'].recommender
+    client = app.test_client()
+    art_ids = recommender.artwork_ids.tolist()
+    users = list(recommender.user_preferences)
+    rng = np.random.default_rng(config['seed'])
+
+    def swipes(prefix=''):
+        while True:
+            yield (f"{prefix}{users[rng.integers(len(users))]}", art_ids[rng.integers(len(art_ids))],
+                   bool(rng.random() < 0.5))
+
+    def known_users():
+        while True:
+            yield (users[rng.integers(len(users))],)
+
+    def check(response):
+        assert response.status_code == 200, response.status_code
+
+    scenarios = {
+        'api.get_recommendations': (recommender.get_recommendations, known_users()),
+        'api.record_swipe': (recommender.record_swipe, swipes()),
+        'api.swipe': (recommender.swipe, swipes()),
+        'api.format_recommendations': (
+            lambda: utils.format_recommendations({'recommendations': art_ids[:10]}),
+            iter(lambda: (), None)
+        ),
+        'http.swipe': (
+            lambda user, art, liked: check(client.get(
+                f"/api/swipe?userid={user}&image={art}&liked={'true' if liked else 'false'}")),
+            swipes()
+        ),
+        'http.recommendations': (
+            lambda: check(client.get('/api/recommendations')),
+            iter(lambda: (), None)
+        ),
+    }
+
+    results = {}
+    for name in config['scenarios']:
+        call, args_stream = scenarios[name]
+        results[name] = measure(call, args_stream, config['requests'], config['warmup'])
+        # Let background training from this scenario finish before timing the next
+        recommender.candidate_queues.join()
+    recommender.swipe_log.close()
+    return results
+
+
+def write_fixture(directory, n_artworks, n_users, history, seed):
+    art_ids = write_catalog(directory, n_artworks, seed)
+    histories = synthetic_histories(art_ids, n_users, history, seed=seed + 1)
+    # /api/recommendations serves the demo user
+    histories['user1'] = histories.pop('user-0', {'liked': [], 'disliked': []})
+    write_snapshot(os.path.join(directory, 'user_preferences.json'), 0, histories)
+
+
+def run_isolated(config):
+    """Run one configuration in a fresh interpreter and return its results"""
+    with tempfile.TemporaryDirectory() as directory:
+        write_fixture(directory, config['artworks'], config['users'], config['history'], config['seed'])
+        env = dict(
+            os.environ,
+            TINDEART_FEATURE_STORE=os.path.join(directory, 'feature_store'),
+            TINDEART_PREFERENCES=os.path.join(directory, 'user_preferences.json'),
+            TINDEART_METADATA=os.path.join(directory, 'metadata.csv'),
+            TINDEART_BATCH_RESULTS=os.path.join(directory, 'batch_results'),
+            TINDEART_LOG_LEVEL='WARNING',
+        )
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.suite', '--run-one', json.dumps(config)],
+            cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True
+        )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def environment(seed):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+    }
+
+
+def config_key(result):
+    return (result['scenario'], result['artworks'], result['users'], result['history'])
+
+
+def compare(baseline, current, tolerance, min_delta_ms):
+    """
+    Scenarios of current that are slower than in baseline
+
+    Parameters:
+    baseline: earlier suite output
+    current: this run's suite output
+    tolerance: allowed relative slowdown, e.g. 0.1 for 10%
+    min_delta_ms: slowdowns smaller than this many milliseconds are ignored
+
+    Returns:
+    list of (result, metric, baseline value, current value)
+    """
+    previous = {config_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        before = previous.get(config_key(result))
+        if before is None:
+            continue
+        for metric in COMPARED:
+            old, new = before[metric], result[metric]
+            if new > old * (1 + tolerance) and new - old > min_delta_ms:
+                regressions.append((result, metric, old, new))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    previous = {config_key(result): result for result in (baseline or {}).get('results', [])}
+    print(f"{'scenario':>27} {'artworks':>9} {'users':>7} {'history':>7} "
+          f"{'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'vs base':>8}")
+    for result in results:
+        before = previous.get(config_key(result))
+        change = f"{result['p50_ms'] / before['p50_ms'] - 1:+.0%}" if before and before['p50_ms'] else ''
+        print(f"{result['scenario']:>27} {result['artworks']:>9} {result['users']:>7} {result['history']:>7} "
+              f"{result['throughput']:>9.1f} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} "
+              f"{result['p99_ms']:>9.3f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--artworks', type=int, nargs='+', default=[10_000])
+    parser.add_argument('--users', type=int, nargs='+', default=[1000])
+    parser.add_argument('--history', type=int, nargs='+', default=[50], help='swipes per synthetic user')
+    parser.add_argument('--requests', type=int, default=500, help='timed calls per scenario')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='earlier --out file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative slowdown (default 10%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05)
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_config(json.loads(args.run_one))))
+        return
+
+    report = {'environment': environment(args.seed), 'results': []}
+    for n_artworks, n_users, history in itertools.product(args.artworks, args.users, args.history):
+        config = {
+            'artworks': n_artworks, 'users': n_users, 'history': history, 'seed': args.seed,
+            'requests': args.requests, 'warmup': args.warmup, 'scenarios': args.scenarios,
+        }
+        for scenario, summary in run_isolated(config).items():
+            report['results'].append(
+                {'scenario': scenario, 'artworks': n_artworks, 'users': n_users, 'history': history, **summary}
+            )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_results(report['results'], baseline)
+
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if baseline is not None:
+        regressions = compare(baseline, report, args.tolerance, args.min_delta_ms)
+        for result, metric, old, new in regressions:
+            print(f"REGRESSION {result['scenario']} ({result['artworks']} artworks, {result['users']} users, "
+                  f"{result['history']} history): {metric} {old:.3f} -> {new:.3f} ms")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
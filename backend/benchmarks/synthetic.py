@@ -0,0 +1,108 @@
+"""
+Synthetic catalogs and swipe histories shared by the benchmarks.
+
+Everything is generated from a seed, so two runs with the same arguments
+benchmark the same data.
+"""
+import csv
+import itertools
+import os
+import numpy as np
+from racomandation.feature_store import FeatureStore
+
+N_RAW_FEATURES = 46  # Length of ImageFeatureExtractor.extract_features output
+
+
+def artwork_ids(n_artworks):
+    return [f"image_{i}.jpg" for i in range(n_artworks)]
+
+
+def synthetic_features(n_artworks, seed=0):
+    """Random raw feature vectors, as a dict of artwork_id -> features"""
+    rng = np.random.default_rng(seed)
+    return dict(zip(artwork_ids(n_artworks), rng.random((n_artworks, N_RAW_FEATURES))))
+
+
+def write_catalog(directory, n_artworks, seed=0):
+    """Write a feature store and metadata CSV for a synthetic catalog; returns the artwork IDs"""
+    features = synthetic_features(n_artworks, seed)
+    FeatureStore.build(features).save(os.path.join(directory, 'feature_store'))
+    with open(os.path.join(directory, 'metadata.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['filename', 'artist', 'genre', 'style', 'title'])
+        for i, art_id in enumerate(features):
+            writer.writerow([art_id, f"artist {i % 500}", f"genre {i % 20}", f"style {i % 30}", f"title {i}"])
+    return list(features)
+
+
+def synthetic_histories(art_ids, n_users, history, like_rate=0.5, seed=1):
+    """
+    Swipe histories for n_users users with history swipes each
+
+    Parameters:
+    art_ids: catalog the swiped artworks are drawn from
+    n_users: number of users (named user-0, user-1, ...)
+    history: swipes per user
+    like_rate: probability that a swipe is a like
+
+    Returns:
+    dict of user_id -> {'liked': [...], 'disliked': [...]}
+    """
+    rng = np.random.default_rng(seed)
+    art_ids = np.asarray(art_ids)
+    picks = rng.integers(len(art_ids), size=(n_users, history))
+    likes = rng.random((n_users, history)) < like_rate
+    return {
+        f"user-{user}": {
+            'liked': art_ids[picks[user][likes[user]]].tolist(),
+            'disliked': art_ids[picks[user][~likes[user]]].tolist(),
+        }
+        for user in range(n_users)
+    }
+
+
+def synthetic_swipes(n_swipes, n_users, n_artworks, seed=0):
+    """Stream of (user_id, artwork_id, liked) swipes by random users on random artworks"""
+    rng = np.random.default_rng(seed)
+    users = rng.integers(0, n_users, size=n_swipes)
+    arts = rng.integers(0, n_artworks, size=n_swipes)
+    liked = rng.random(n_swipes) < 0.5
+    for user, art, like in zip(users, arts, liked):
+        yield f"user-{user}", f"image_{art}.jpg", bool(like)
+
+
+def synthetic_taste_swipes(features, n_users, history, taste_features=4, noise=0.5, seed=1):
+    """
+    Chronological swipes by users with a hidden taste, for quality evaluation
+
+    Each user cares about a few raw features (say brightness and one
+    dominant color) and likes an artwork when a random weighting of those
+    features, standardized, plus Gaussian noise is positive. About half the
+    swipes are likes, and a model can learn the taste from the features.
+    Users swipe history random distinct artworks; the swipes of all users
+    are interleaved in random order.
+
+    Parameters:
+    features: dict of artwork_id -> raw features (e.g. synthetic_features)
+    n_users: number of users (named user-0, user-1, ...)
+    history: swipes per user
+    taste_features: number of raw features each user's taste depends on
+    noise: standard deviation of the noise, relative to the taste signal
+
+    Returns:
+    list of (user_id, artwork_id, liked) in swipe order
+    """
+    rng = np.random.default_rng(seed)
+    art_ids = np.asarray(list(features))
+    raw = np.array(list(features.values()), dtype=np.float64)
+    standardized = (raw - raw.mean(axis=0)) / raw.std(axis=0)
+    tastes = np.zeros((n_users, raw.shape[1]))
+    for taste in tastes:
+        taste[rng.choice(raw.shape[1], size=taste_features, replace=False)] = rng.standard_normal(taste_features)
+    tastes /= np.linalg.norm(tastes, axis=1, keepdims=True)
+    swipes = []
+    for user in range(n_users):
+        rows = rng.choice(len(art_ids), size=min(history, len(art_ids)), replace=False)
+        liked = standardized[rows] @ tastes[user] + noise * rng.standard_normal(len(rows)) > 0
+        swipes.extend(zip(itertools.repeat(f"user-{user}"), art_ids[rows].tolist(), liked.tolist()))
+    return [swipes[i] for i in rng.permutation(len(swipes))]
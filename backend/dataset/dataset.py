@@ -1,45 +1,335 @@
-from datasets import load_dataset
-import os
+"""
+Download artworks and their metadata into an image folder for the recommender.
+
+Run from the backend directory:
+    python -m dataset.dataset --limit 5000 --workers 8
+    python -m dataset.dataset --source /data/wikiart/ --offset 5000 --limit 5000
+    python -m dataset.dataset --limit 5000 --features racomandation/feature_store
+
+--source is a Hugging Face dataset name (streamed), a .parquet file or a
+directory of .parquet shards (the dataset's own download format), or a
+directory of images with an optional metadata.csv. Images are saved as
+image_<index>.jpg, where index is the position in the source, on a thread
+pool; JPEG sources are written as-is without re-encoding. Progress is
+checkpointed every --checkpoint-every images, so rerunning the same command
+after an interruption (or with a larger --limit) continues where the last
+run stopped; pass --restart to start over.
+
+With --features, each image is also handed to ImageFeatureExtractor while it
+is in memory and the feature store is rebuilt at the end, so images are not
+decoded a second time by `python -m racomandation.feature_store --images`.
+"""
+import argparse
 import csv
+import io
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
 
-# Load dataset in streaming mode
-dataset = load_dataset("huggan/wikiart", split="train", streaming=True)
-
-# Create output directories
-output_folder = "wikiart_images"
-os.makedirs(output_folder, exist_ok=True)
-
-# Metadata file
-metadata_path = os.path.join(output_folder, "metadata.csv")
-
-# Open CSV file for writing metadata
-with open(metadata_path, mode="w", newline="") as csv_file:
-    csv_writer = csv.writer(csv_file)
-    csv_writer.writerow(["filename", "artist", "genre", "style", "title"])  # CSV header
-
-    # Loop through dataset and save only first 500 images
-    for idx, item in enumerate(dataset):
-        if idx >= 500:  # Stop after saving 500 images
-            break
-
-        # Save image
-        image = item["image"]
-        filename = f"image_{idx}.jpg"
-        image_path = os.path.join(output_folder, filename)
-        image.save(image_path, "JPEG")
-        
-        filename = f"image_{idx}.jpg"
-        # Save metadata
-        print(item)
-        csv_writer.writerow([
-            filename,
-            item['image'],
-            item['genre'],
-            item['style'],
-        ])
-
-        if idx % 100 == 0:
-            print(f"Saved {idx} images...")
-
-print(f"Finished! 500 images and metadata saved in '{output_folder}'")
+FIELDS = ['filename', 'artist', 'genre', 'style', 'title']
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+CHECKPOINT_NAME = '.ingest_checkpoint.json'
+JPEG_MAGIC = b'\xff\xd8\xff'
+
+
+def iter_source(source, offset=0):
+    """
+    Stream (index, item) pairs from a dataset source, starting at offset
+
+    Items are dicts with an 'image' (PIL image, encoded bytes, a
+    {'bytes', 'path'} dict or a file path) and the label columns, with
+    class label ids already mapped to their names.
+
+    Parameters:
+    source: Hugging Face dataset name, .parquet file, directory of .parquet
+            shards or directory of images
+    offset: index of the first item to return
+    """
+    if os.path.isdir(source):
+        shards = sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith('.parquet'))
+        if shards:
+            return _iter_parquet(shards, offset)
+        return _iter_image_directory(source, offset)
+    if source.endswith('.parquet'):
+        return _iter_parquet([source], offset)
+    return _iter_hub(source, offset)
+
+
+def _iter_hub(name, offset):
+    from datasets import Image as ImageFeature, load_dataset
+
+    dataset = load_dataset(name, split="train", streaming=True)
+    names = {column: feature.names for column, feature in (dataset.features or {}).items()
+             if hasattr(feature, 'names')}
+    # Keep the encoded bytes: decoding happens on the thread pool, and only when needed
+    dataset = dataset.cast_column('image', ImageFeature(decode=False))
+    for index, item in enumerate(dataset.skip(offset), start=offset):
+        yield index, _label_names(item, names)
+
+
+def _iter_parquet(paths, offset):
+    import pyarrow.parquet as pq
+
+    position = 0
+    for path in paths:
+        parquet = pq.ParquetFile(path)
+        names = _parquet_label_names(parquet)
+        for group in range(parquet.num_row_groups):
+            n_rows = parquet.metadata.row_group(group).num_rows
+            if position + n_rows <= offset:
+                position += n_rows  # Skip whole row groups without reading them
+                continue
+            for item in parquet.read_row_group(group).to_pylist():
+                if position >= offset:
+                    yield position, _label_names(item, names)
+                position += 1
+
+
+def _parquet_label_names(parquet):
+    """Class label names stored in the schema metadata of Hugging Face parquet files"""
+    metadata = parquet.schema_arrow.metadata or {}
+    if b'huggingface' not in metadata:
+        return {}
+    features = json.loads(metadata[b'huggingface']).get('info', {}).get('features', {})
+    return {column: feature['names'] for column, feature in features.items()
+            if isinstance(feature, dict) and 'names' in feature}
+
+
+def _iter_image_directory(directory, offset):
+    filenames = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    metadata = {}
+    metadata_path = os.path.join(directory, 'metadata.csv')
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'r', newline='') as file:
+            metadata = {row['filename']: row for row in csv.DictReader(file)}
+    for index in range(offset, len(filenames)):
+        filename = filenames[index]
+        yield index, {**metadata.get(filename, {}), 'image': os.path.join(directory, filename)}
+
+
+def _label_names(item, names):
+    for column, labels in names.items():
+        value = item.get(column)
+        if isinstance(value, int) and 0 <= value < len(labels):
+            item[column] = labels[value]
+    return item
+
+
+def save_image(image, path, extract=False):
+    """
+    Write one source image as a JPEG
+
+    Encoded JPEG bytes are written unchanged; anything else is decoded and
+    re-encoded. Runs on the ingestion thread pool (PIL releases the GIL
+    while decoding and encoding).
+
+    Parameters:
+    image: PIL image, encoded bytes, {'bytes', 'path'} dict or file path
+    path: destination file
+    extract: also return the decoded image as an array for ImageFeatureExtractor
+
+    Returns:
+    uint8 (150, 150, 3) array if extract, otherwise None
+    """
+    if isinstance(image, dict):
+        image = image.get('bytes') or image.get('path')
+    if isinstance(image, str):
+        with open(image, 'rb') as file:
+            image = file.read()
+
+    if isinstance(image, bytes) and image.startswith(JPEG_MAGIC):
+        with open(path, 'wb') as file:
+            file.write(image)
+        img = Image.open(io.BytesIO(image)) if extract else None
+    else:
+        img = Image.open(io.BytesIO(image)) if isinstance(image, bytes) else image
+        img.convert('RGB').save(path, "JPEG")
+    if not extract:
+        return None
+    from racomandation.image_extraction import image_to_array
+    return image_to_array(img)
+
+
+def ingest(source, output_folder, limit=None, offset=0, workers=8, checkpoint_every=500,
+           restart=False, extractor=None, features_dir=None):
+    """
+    Save images and metadata from a source into output_folder
+
+    Parameters:
+    source: see iter_source
+    output_folder: directory for the images and metadata.csv
+    limit: number of source items to ingest from offset (None for all)
+    offset: index of the first source item
+    workers: threads encoding and writing images
+    checkpoint_every: items between metadata flushes and checkpoints
+    restart: ignore an existing checkpoint and rewrite metadata.csv
+    extractor: ImageFeatureExtractor to extract features with while images
+               are in memory (requires features_dir)
+    features_dir: feature store directory to rebuild from the extracted features
+
+    Returns:
+    number of images saved by this run
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    metadata_path = os.path.join(output_folder, "metadata.csv")
+    checkpoint_path = os.path.join(output_folder, CHECKPOINT_NAME)
+    shards_dir = os.path.join(features_dir, 'ingest') if extractor else None
+
+    checkpoint = None if restart else _load_checkpoint(checkpoint_path, source)
+    if checkpoint:
+        start = max(offset, checkpoint['next_index'])
+        _truncate_metadata(metadata_path, checkpoint['rows'])
+        rows = checkpoint['rows']
+        print(f"Resuming {source} at item {start} ({rows} images already saved)")
+    else:
+        start, rows = offset, 0
+        with open(metadata_path, mode="w", newline="") as csv_file:
+            csv.writer(csv_file).writerow(FIELDS)
+        if shards_dir:
+            shutil.rmtree(shards_dir, ignore_errors=True)
+    end = offset + limit if limit is not None else None
+    if shards_dir:
+        os.makedirs(shards_dir, exist_ok=True)
+
+    saved = 0
+    next_index = start
+    batch_rows, batch_arrays = [], []
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal rows
+        if batch_rows:
+            with open(metadata_path, mode="a", newline="") as csv_file:
+                csv.writer(csv_file).writerows(batch_rows)
+                csv_file.flush()
+                os.fsync(csv_file.fileno())
+            if extractor and batch_arrays:
+                features = extractor.extract_features_batch(np.stack(batch_arrays))
+                shard = os.path.join(shards_dir, f"{batch_rows[0][0]}.npz")
+                np.savez(shard, ids=np.array([row[0] for row in batch_rows]), raw=features)
+        rows += len(batch_rows)
+        _save_checkpoint(checkpoint_path, {'source': source, 'next_index': next_index, 'rows': rows})
+        batch_rows.clear()
+        batch_arrays.clear()
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"Saved {saved} images up to item {next_index} ({saved / elapsed:.1f} images/sec)")
+
+    def collect(pending_item):
+        nonlocal saved, next_index
+        index, filename, item, future = pending_item
+        next_index = index + 1
+        try:
+            img_array = future.result()
+        except Exception as e:
+            print(f"Error saving item {index}: {e}")
+            return
+        saved += 1
+        batch_rows.append([filename] + [_text(item.get(field)) for field in FIELDS[1:]])
+        if extractor:
+            batch_arrays.append(img_array)
+        if next_index % checkpoint_every == 0:
+            flush()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Bounded so a streaming source is never read far ahead of the writers
+        pending = deque()
+        for index, item in iter_source(source, start):
+            if end is not None and index >= end:
+                break
+            filename = f"image_{index}.jpg"
+            future = pool.submit(save_image, item['image'], os.path.join(output_folder, filename),
+                                 extractor is not None)
+            pending.append((index, filename, item, future))
+            if len(pending) >= workers * 4:
+                collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+    flush()
+
+    if extractor:
+        _build_feature_store(extractor, output_folder, features_dir, shards_dir)
+    print(f"Finished! {saved} images and metadata saved in '{output_folder}'")
+    return saved
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def _load_checkpoint(checkpoint_path, source):
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r') as file:
+        checkpoint = json.load(file)
+    if checkpoint.get('source') != source:
+        print(f"Checkpoint is for {checkpoint.get('source')}, starting over")
+        return None
+    return checkpoint
+
+
+def _save_checkpoint(checkpoint_path, checkpoint):
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def _truncate_metadata(metadata_path, rows):
+    """Drop metadata rows written after the last checkpoint (a crash between the two writes)"""
+    with open(metadata_path, 'r', newline='') as file:
+        kept = [row for _, row in zip(range(rows + 1), csv.reader(file))]
+    tmp_path = f"{metadata_path}.tmp"
+    with open(tmp_path, 'w', newline='') as file:
+        csv.writer(file).writerows(kept)
+    os.replace(tmp_path, metadata_path)
+
+
+def _build_feature_store(extractor, output_folder, features_dir, shards_dir):
+    """Rebuild the feature store from the extracted shards plus the artworks it already holds"""
+    from racomandation.feature_store import FeatureStore
+
+    artwork_data = {}
+    if FeatureStore.exists(features_dir):
+        previous = FeatureStore.load(features_dir)
+        artwork_data.update(zip(previous.ids.tolist(), previous.raw))
+    filenames = []
+    for name in sorted(os.listdir(shards_dir)):
+        with np.load(os.path.join(shards_dir, name)) as shard:
+            filenames.extend(shard['ids'].tolist())
+            artwork_data.update(zip(shard['ids'].tolist(), shard['raw']))
+    store = FeatureStore.build(artwork_data)
+    store.save(features_dir)
+    extractor.record_manifest(os.path.join(features_dir, 'manifest.json'), output_folder, filenames)
+    print(f"Saved {len(store)} artworks ({store.n_features} -> {store.n_components} features) to {features_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default="huggan/wikiart",
+                        help='Hugging Face dataset, .parquet file or directory of parquet shards or images')
+    parser.add_argument('--out', default=os.path.join('..', 'wikiart_images'))
+    parser.add_argument('--limit', type=int, default=500, help='items to ingest from --offset (0 for all)')
+    parser.add_argument('--offset', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=8, help='threads writing images')
+    parser.add_argument('--checkpoint-every', type=int, default=500)
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+    parser.add_argument('--features', help='feature store directory to extract features into')
+    parser.add_argument('--color-mode', default='kmeans', help='dominant color extraction mode (with --features)')
+    args = parser.parse_args()
+
+    extractor = None
+    if args.features:
+        from racomandation.image_extraction import ImageFeatureExtractor
+        extractor = ImageFeatureExtractor(color_mode=args.color_mode)
+    ingest(args.source, args.out, limit=args.limit or None, offset=args.offset, workers=args.workers,
+           checkpoint_every=args.checkpoint_every, restart=args.restart, extractor=extractor,
+           features_dir=args.features)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Gunicorn settings for serving the backend with several worker processes
+
+Run from the backend directory:
+    gunicorn main:app
+
+Each worker loads the app on its own (no preload_app): the swipe log, its
+flusher thread and the background training worker do not survive a fork.
+Read-mostly state is still shared between workers through the page cache:
+the feature store is memory-mapped and metadata is served from SQLite.
+Swipes are appended to one shared log under an flock and every worker
+follows the swipes the others write. `kill -HUP <master pid>` restarts the
+workers, which load the current feature store. Before forking, the master
+compiles a missing feature store and vector index and imports the
+metadata CSV into SQLite (on_starting), so workers booting together don't
+all build them.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('TINDEART_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# ArtRecommender is thread-safe, so each worker also serves a few requests concurrently
+worker_class = 'gthread'
+threads = int(os.environ.get('TINDEART_THREADS', 4))
+preload_app = False
+timeout = 60
+
+# The in-memory metadata backend would hold one copy of the CSV per worker
+os.environ.setdefault('TINDEART_METADATA_BACKEND', 'sqlite')
+
+
+def on_starting(server):
+    # Compile the feature store and vector index in a separate interpreter,
+    # so the master forks the workers without numpy or scikit-learn thread pools
+    build = subprocess.run([sys.executable, '-c', 'import main; main.build_artifacts()'])
+    if build.returncode != 0:
+        server.log.warning("Building the feature store or index failed; workers will build them")
+
+    # Import the metadata into SQLite once in the master, so the workers
+    # don't all rebuild it as they boot. The store opens no connection
+    # until a lookup, and this one is not the store the workers serve from.
+    import utils
+    from metadata import MetadataStore
+    if utils.METADATA_BACKEND != 'sqlite':
+        return
+    try:
+        MetadataStore(utils.METADATA_PATH, backend='sqlite').get_many(())
+    except FileNotFoundError:
+        server.log.warning("Metadata file not found: %s", utils.METADATA_PATH)
@@ -1,51 +1,326 @@
-import csv
-import json
+import logging
 import os
-from flask import Flask, request
-from racomandation.racomandation import ArtRecommender, example_usage
+import signal
+import threading
+import time
+
+IMPORT_START = time.perf_counter()  # Start of the import phase in the startup breakdown
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Flask, Response, current_app, g, request, send_file
 from flask_cors import CORS
+# None of these import sklearn: fitting and training import it on first use
+from racomandation.racomandation import ArtRecommender, example_usage
+from racomandation.feature_store import load_or_build
+from racomandation.vector_index import load_or_build_index
+from racomandation.batch_scoring import BatchResults
+from racomandation.metrics import metrics
+from racomandation.profiler import SamplingProfiler
+from racomandation.thumbnails import ThumbnailCache
+from racomandation import user_models
+import utils
 from utils import format_recommendations
 
-app = Flask(__name__)
-recommender = ArtRecommender()
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
+
+# DEBUG also logs every recommendation and training step; WARNING or
+# CRITICAL keeps request handling quiet
+logging.basicConfig(
+    level=os.environ.get('TINDEART_LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+api = Blueprint('api', __name__)
+
+
+class Backend:
+    def __init__(self, feature_store_dir=None, preferences_file=None, vector_index=None, batch_results_dir=None,
+                 thumbnails_dir=None, images_dir=None):
+        """
+        Recommender and background jobs behind one app, loaded from prebuilt artifacts
+
+        Nothing is fitted on the way: the feature store is memory-mapped, the
+        vector index, k-means clusters and batch results are loaded from the
+        store directory when they match its version, and thumbnails are
+        rendered ahead of time (python -m racomandation.thumbnails). Each
+        phase is timed into self.startup.
+
+        Parameters:
+        feature_store_dir: compiled feature store (TINDEART_FEATURE_STORE)
+        preferences_file: preferences snapshot (TINDEART_PREFERENCES)
+        vector_index: 'ivf', 'exact' or None for the exact scan (TINDEART_VECTOR_INDEX)
+        batch_results_dir: precomputed feeds (TINDEART_BATCH_RESULTS)
+        thumbnails_dir: thumbnail cache served by /api/images (TINDEART_THUMBNAILS)
+        images_dir: original images, to render thumbnails missing from the cache (TINDEART_IMAGES)
+        """
+        cwd = os.getcwd()
+        self.feature_store_dir = feature_store_dir or os.path.join(cwd, 'racomandation/feature_store')
+        self.vector_index = vector_index
+        self.batch_results_dir = batch_results_dir or os.path.join(cwd, 'racomandation/batch_results')
+        self.startup = {'imports': IMPORT_SECONDS}
+
+        # Every worker process replays the same preferences snapshot + swipe log and
+        # follows the swipes the other workers append to it
+        with self._phase('preferences'):
+            self.recommender = ArtRecommender(preferences_file=preferences_file)
+
+        # Load the compiled feature store (memory-mapped, no refit, so worker processes
+        # share its pages). The JSON export is only read the first time, to compile the store.
+        with self._phase('catalog'), metrics.timer('tindeart_catalog_seconds', operation='load'):
+            feature_store = load_or_build(
+                self.feature_store_dir,
+                os.path.join(cwd, 'racomandation/artwork_features.json')
+            )
+            index = load_or_build_index(self.feature_store_dir, feature_store, vector_index) if vector_index else None
+            self.recommender.popularity.cluster_file = os.path.join(self.feature_store_dir, 'clusters.npz')
+            self.recommender.load_feature_store(feature_store, index)
+
+        # Feeds precomputed for every user (python -m racomandation.batch_scoring or
+        # /api/batch_score) fill the candidate queues, so first requests skip ranking
+        with self._phase('batch_results'):
+            if os.path.exists(os.path.join(self.batch_results_dir, 'meta.json')):
+                self.recommender.load_batch_results(BatchResults.load(self.batch_results_dir))
+
+        with self._phase('thumbnails'):
+            self.thumbnails = ThumbnailCache(
+                thumbnails_dir or os.path.join(cwd, 'racomandation/thumbnails'),
+                originals_dir=images_dir or os.path.join(cwd, '..', 'client', 'public', 'wikiart_images')
+            )
+
+        self.batch_executor = ThreadPoolExecutor(max_workers=1)
+        self.batch_lock = threading.Lock()
+        self.batch_job = None
+
+        # Sampling profiler, only available when TINDEART_PROFILER=1
+        self.profiler = SamplingProfiler() if os.environ.get('TINDEART_PROFILER') == '1' else None
+
+    def _phase(self, name):
+        return _Phase(self.startup, name)
+
+    def warm_up(self):
+        """Import sklearn and load the metadata, so the first swipe and response don't pay for it"""
+        start = time.perf_counter()
+        try:
+            user_models.preload()
+            utils.metadata_store.get_many(())
+        except Exception as e:
+            logger.warning("Warm-up failed: %s", e)
+        self.startup['warm_up'] = time.perf_counter() - start
+        metrics.observe('tindeart_startup_seconds', self.startup['warm_up'], phase='warm_up')
+        logger.info("Warmed up in %.2fs", self.startup['warm_up'])
+
+    def run_batch_score(self, n_recommendations):
+        results = self.recommender.batch_recommendations(n_recommendations=n_recommendations)
+        results.save(self.batch_results_dir)
+        self.recommender.load_batch_results(results)
+        return {"users": len(results), "version": results.version}
+
+
+class _Phase:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timings[self.name] = time.perf_counter() - self.start
+        return False
+
+
+def create_app(feature_store_dir=None, preferences_file=None, vector_index=None, batch_results_dir=None,
+               thumbnails_dir=None, images_dir=None, warm_up=True):
+    """
+    Build the Flask app; arguments default to the TINDEART_* environment variables
 
+    Parameters:
+    warm_up: import sklearn and load the metadata on a background thread
+             once the app is built
 
-with open(os.path.join(os.getcwd(), 'racomandation/artwork_features.json'), 'r') as file:
-    data = json.load(file)
+    Returns:
+    Flask app, with its Backend in app.extensions['tindeart']
+    """
+    start = time.perf_counter()
+    backend = Backend(
+        feature_store_dir or os.environ.get('TINDEART_FEATURE_STORE'),
+        preferences_file or os.environ.get('TINDEART_PREFERENCES'),
+        vector_index or os.environ.get('TINDEART_VECTOR_INDEX'),
+        batch_results_dir or os.environ.get('TINDEART_BATCH_RESULTS'),
+        thumbnails_dir or os.environ.get('TINDEART_THUMBNAILS'),
+        images_dir or os.environ.get('TINDEART_IMAGES'),
+    )
 
-artwork_features = data
-    
-# Process artwork features
-recommender.process_artwork_features(artwork_features)
+    app = Flask(__name__)
+    app.extensions['tindeart'] = backend
+    app.register_blueprint(api)
+    CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+    recommender = backend.recommender
+    # After recompiling the store (python -m racomandation.feature_store ...),
+    # `kill -HUP <pid>` swaps the new catalog version in without a restart
+    if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, lambda *_: recommender.reload_feature_store(
+            backend.feature_store_dir, backend.vector_index))
 
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+    metrics.gauge('tindeart_catalog_artworks', 'Artworks in the served catalog',
+                  lambda: len(recommender.feature_store) if recommender.feature_store else 0)
+    metrics.gauge('tindeart_users', 'Users with recorded swipes', lambda: len(recommender.user_preferences))
+    metrics.gauge('tindeart_user_models', 'User models held in memory', lambda: len(recommender.user_models))
+    metrics.gauge('tindeart_candidate_queues', 'Users with a precomputed candidate queue',
+                  lambda: len(recommender.candidate_queues))
 
-@app.route("/")
+    backend.startup['create_app'] = time.perf_counter() - start
+    for phase, seconds in backend.startup.items():
+        metrics.observe('tindeart_startup_seconds', seconds, phase=phase)
+    logger.info("Started in %.2fs: %s", IMPORT_SECONDS + backend.startup['create_app'],
+                ', '.join(f"{phase} {seconds:.3f}s" for phase, seconds in backend.startup.items()))
+
+    if warm_up:
+        threading.Thread(target=backend.warm_up, name='warm-up', daemon=True).start()
+    return app
+
+
+def build_artifacts(feature_store_dir=None, vector_index=None):
+    """
+    Compile the feature store and build the vector index if they are
+    missing, so that app processes started afterwards only load them.
+    gunicorn.conf.py runs this before forking the workers.
+
+    Parameters:
+    feature_store_dir: compiled feature store (TINDEART_FEATURE_STORE)
+    vector_index: 'ivf', 'exact' or None for no index (TINDEART_VECTOR_INDEX)
+    """
+    cwd = os.getcwd()
+    directory = (feature_store_dir or os.environ.get('TINDEART_FEATURE_STORE')
+                 or os.path.join(cwd, 'racomandation/feature_store'))
+    store = load_or_build(directory, os.path.join(cwd, 'racomandation/artwork_features.json'))
+    vector_index = vector_index or os.environ.get('TINDEART_VECTOR_INDEX')
+    if vector_index:
+        load_or_build_index(directory, store, vector_index)
+
+
+def backend():
+    return current_app.extensions['tindeart']
+
+
+@api.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@api.after_app_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('tindeart_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+        metrics.inc('tindeart_requests_total', endpoint=endpoint, status=response.status_code)
+    return response
+
+
+@api.route("/")
 def hello_world():
-    return example_usage()
+    return example_usage(backend().recommender)
 
 
-@app.route("/api/user_preferences")
+@api.route("/api/user_preferences")
 def user_preferences():
-    return recommender.user_preferences
+    return backend().recommender.user_preferences.to_dict()
 
 
 
-@app.route("/api/swipe")
+@api.route("/api/swipe")
 def handle_swipe():
     # Get query parameters
     userid = request.args.get('userid')
     image = request.args.get('image')
     liked = request.args.get('liked').lower() == 'true'  # Convert string to boolean
 
-    # Record user swipe
-    recommender.record_swipe(userid, image, liked=liked)
-    # Get recommendations
-    recommendations = recommender.get_recommendations(userid)
+    # Record the swipe and serve the next cards from the user's precomputed
+    # queue; training and rescoring happen in the background
+    recommendations = backend().recommender.swipe(userid, image, liked=liked)
     # Format and return recommendations
     return format_recommendations({"recommendations": recommendations})
 
-@app.route("/api/recommendations")
-def get_recommendations():    
-    return format_recommendations(example_usage(recommender))
\ No newline at end of file
+@api.route("/api/images/<filename>")
+def get_image(filename):
+    # Downscaled artwork (?size=small|medium|large) instead of the original.
+    # send_file answers If-None-Match and Range requests and hands the file
+    # to the server's sendfile; the ETag is the content hash of the original
+    size = request.args.get('size', 'medium')
+    found = backend().thumbnails.lookup(filename, size)
+    if found is None:
+        return "Unknown image or size", 404
+    path, etag = found
+    response = send_file(path, mimetype='image/jpeg', etag=etag, conditional=True, max_age=86400)
+    sent = 0 if response.status_code == 304 else response.content_length or 0
+    metrics.inc('tindeart_image_bytes_total', sent, size=size)
+    return response
+
+
+@api.route("/api/batch_score")
+def batch_score():
+    # Rescore every user in the background (e.g. after a catalog update);
+    # poll /api/batch_score/status for the result
+    state = backend()
+    with state.batch_lock:
+        if state.batch_job is not None and not state.batch_job.done():
+            return {"status": "running"}, 202
+        state.batch_job = state.batch_executor.submit(state.run_batch_score, request.args.get('n', type=int))
+    return {"status": "started"}, 202
+
+
+@api.route("/api/batch_score/status")
+def batch_score_status():
+    job = backend().batch_job
+    if job is None:
+        return {"status": "idle"}
+    if not job.done():
+        return {"status": "running"}
+    if job.exception() is not None:
+        return {"status": "failed", "error": str(job.exception())}, 500
+    return {"status": "done", **job.result()}
+
+
+@api.route("/api/metrics")
+def get_metrics():
+    # Prometheus text format; each worker process reports its own samples
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@api.route("/api/profile/start")
+def start_profile():
+    profiler = backend().profiler
+    if profiler is None:
+        return "Profiler disabled, set TINDEART_PROFILER=1", 404
+    started = profiler.start()
+    return {"status": "started" if started else "running"}
+
+
+@api.route("/api/profile/stop")
+def stop_profile():
+    # Collapsed stacks, e.g. for flamegraph.pl or speedscope
+    profiler = backend().profiler
+    if profiler is None:
+        return "Profiler disabled, set TINDEART_PROFILER=1", 404
+    profiler.stop()
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+
+@api.route("/api/recommendations")
+def get_recommendations():
+    return format_recommendations(example_usage(backend().recommender))
+
+
+def __getattr__(name):
+    # `gunicorn main:app` and `flask --app main` build the app on first access,
+    # so importing main (or create_app) costs only the imports
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,118 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+
+FIELDS = ('filename', 'artist', 'genre', 'style', 'title')
+
+
+class MetadataStore:
+    def __init__(self, path, backend='memory', check_interval=1.0):
+        """
+        Artwork metadata loaded once from metadata.csv and indexed by filename
+
+        The CSV is only re-read when its mtime changes; the mtime itself is
+        checked at most once every check_interval seconds.
+
+        Parameters:
+        path: path to metadata.csv
+        backend: 'memory' keeps a dict in memory, 'sqlite' imports the CSV
+                 into an indexed SQLite file next to it for large catalogs
+        check_interval: minimum seconds between mtime checks
+        """
+        if backend not in ('memory', 'sqlite'):
+            raise ValueError(f"Unknown metadata backend: {backend}")
+        self.path = path
+        self.backend = backend
+        self.check_interval = check_interval
+        self.sqlite_path = f"{os.path.splitext(path)[0]}.sqlite"
+        self._rows = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get_many(self, filenames):
+        """
+        Look up metadata for a batch of filenames
+
+        Parameters:
+        filenames: iterable of artwork filenames
+
+        Returns:
+        dict of filename -> metadata row for the filenames that are known
+
+        Raises FileNotFoundError if the metadata file does not exist.
+        """
+        self._maybe_reload()
+        filenames = list(filenames)
+        if self.backend == 'memory':
+            rows = self._rows
+            return {name: rows[name] for name in filenames if name in rows}
+
+        placeholders = ','.join('?' * len(filenames))
+        cursor = self._connection().execute(
+            f"SELECT {', '.join(FIELDS)} FROM metadata WHERE filename IN ({placeholders})",
+            filenames
+        )
+        return {row[0]: dict(zip(FIELDS, row)) for row in cursor}
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime  # Raises FileNotFoundError
+            self._checked_at = now
+            if mtime == self._mtime:
+                return
+            if self.backend == 'memory':
+                self._rows = self._read_csv()
+            else:
+                self._import_sqlite(mtime)
+            self._mtime = mtime
+
+    def _read_csv(self):
+        with open(self.path, 'r', newline='') as file:
+            return {row['filename']: row for row in csv.DictReader(file)}
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Transactions are explicit (see _import_sqlite); other processes
+            # rebuilding the file make this one wait up to 30s instead of failing
+            connection = sqlite3.connect(self.sqlite_path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def _import_sqlite(self, mtime):
+        """
+        (Re)build the SQLite copy of the CSV unless it is already up to date
+
+        Several processes (e.g. gunicorn workers) may load the same file at
+        once. The check and the rebuild run in one BEGIN IMMEDIATE
+        transaction, which takes the write lock first, so one process
+        rebuilds and the others wait, then find the import up to date.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("CREATE TABLE IF NOT EXISTS source (mtime REAL)")
+            imported = connection.execute("SELECT mtime FROM source").fetchone()
+            if not imported or imported[0] != mtime:
+                columns = ', '.join(f"{field} TEXT" for field in FIELDS[1:])
+                connection.execute("DROP TABLE IF EXISTS metadata")
+                connection.execute(f"CREATE TABLE metadata (filename TEXT PRIMARY KEY, {columns})")
+                with open(self.path, 'r', newline='') as file:
+                    connection.executemany(
+                        f"INSERT OR REPLACE INTO metadata VALUES ({','.join('?' * len(FIELDS))})",
+                        (tuple(row.get(field) for field in FIELDS) for row in csv.DictReader(file))
+                    )
+                connection.execute("DELETE FROM source")
+                connection.execute("INSERT INTO source VALUES (?)", (mtime,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
@@ -0,0 +1,233 @@
+import argparse
+import json
+import logging
+import os
+import time
+import numpy as np
+from racomandation.feature_store import FeatureStore, normalize_rows
+
+
+class BatchResults:
+    def __init__(self, user_ids, rows, scores, version):
+        """
+        Precomputed top-N recommendations for many users
+
+        Parameters:
+        user_ids: array of user IDs; row i of rows/scores belongs to user_ids[i]
+        rows: int32 (n_users, n) artwork matrix rows sorted by descending
+              score, padded with -1 when a user has fewer unseen artworks
+        scores: float32 (n_users, n) similarity of each recommendation
+        version: catalog version the rows index into
+        """
+        self.user_ids = np.asarray(user_ids)
+        self.rows = rows
+        self.scores = scores
+        self.version = version
+        self.index = {user_id: i for i, user_id in enumerate(self.user_ids.tolist())}
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def recommendations(self, user_id, store):
+        """
+        Artwork IDs precomputed for a user, or None if the user was not scored
+
+        Raises ValueError if the results were computed for another catalog version.
+        """
+        if store.version != self.version:
+            raise ValueError(f"Results are for catalog version {self.version}, not {store.version}")
+        i = self.index.get(user_id)
+        if i is None:
+            return None
+        rows = self.rows[i]
+        return store.ids[rows[rows >= 0]].tolist()
+
+    def save(self, directory):
+        """Write the results as .npy files, renamed into place once complete"""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {'users.npy': self.user_ids, 'rows.npy': self.rows, 'scores.npy': self.scores}
+        for name, array in arrays.items():
+            with open(os.path.join(directory, f"{name}.tmp"), 'wb') as file:
+                np.save(file, np.ascontiguousarray(array))
+        with open(os.path.join(directory, 'meta.json.tmp'), 'w') as file:
+            json.dump({'version': self.version, 'n_users': len(self),
+                       'n': self.rows.shape[1], 'created': time.time()}, file)
+        for name in (*arrays, 'meta.json'):
+            os.replace(os.path.join(directory, f"{name}.tmp"), os.path.join(directory, name))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+                  for name in ('users.npy', 'rows.npy', 'scores.npy')]
+        with open(os.path.join(directory, 'meta.json')) as file:
+            version = json.load(file)['version']
+        return cls(*arrays, version=version)
+
+
+def user_profiles(store, user_preferences, user_ids):
+    """
+    Stack the similarity profiles of many users into one matrix
+
+    A profile is the normalized mean embedding of the user's liked artworks,
+    as in ArtRecommender._get_similarity_based_recommendations. Users without
+    a known like are skipped; they are served by the cold-start path.
+
+    Parameters:
+    store: FeatureStore the profiles are computed in
+    user_preferences: PreferenceStore
+    user_ids: users to build profiles for
+
+    Returns:
+    (kept user IDs, float32 (n_users, n_components) profiles,
+     (user positions, rows) of already swiped artworks, sorted by user)
+    """
+    codes = user_preferences.codes
+    kept, liked_users, liked_rows, seen_users, seen_rows = [], [], [], [], []
+    for user_id in user_ids:
+        preferences = user_preferences.get(user_id)
+        if preferences is None:
+            continue
+        liked = codes.rows(store, preferences.liked)
+        if not len(liked):
+            continue
+        position = len(kept)
+        kept.append(user_id)
+        liked_rows.append(liked)
+        liked_users.append(np.full(len(liked), position))
+        # Likes and dislikes are disjoint, so together they are the seen rows
+        seen = np.concatenate([liked, codes.rows(store, preferences.disliked)])
+        seen_rows.append(seen)
+        seen_users.append(np.full(len(seen), position))
+
+    profiles = np.zeros((len(kept), store.n_components), dtype=np.float32)
+    if kept:
+        # liked_users is sorted, so each user's likes are one contiguous run
+        liked_users = np.concatenate(liked_users)
+        starts = np.flatnonzero(np.r_[True, liked_users[1:] != liked_users[:-1]])
+        sums = np.add.reduceat(store.embeddings[np.concatenate(liked_rows)], starts, axis=0)
+        profiles = normalize_rows(sums / np.bincount(liked_users)[:, None])
+        seen = (np.concatenate(seen_users).astype(np.int64), np.concatenate(seen_rows).astype(np.int64))
+    else:
+        seen = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    return kept, profiles, seen
+
+
+def top_n_blocked(store, profiles, seen, n, user_block=256, artwork_block=32768):
+    """
+    Top-n most similar unseen artworks for every profile
+
+    Scores a user_block x artwork_block tile at a time and keeps a running
+    top-n per user, so memory is bounded by the tile size (about
+    user_block * artwork_block * 12 bytes for the scores and argpartition's
+    indices) whatever the number of users and artworks.
+
+    Parameters:
+    store: FeatureStore to score against
+    profiles: float32 (n_users, n_components) unit profiles
+    seen: (user positions, rows) pairs to exclude, sorted by user position
+    n: number of recommendations per user
+    user_block, artwork_block: tile size
+
+    Returns:
+    (rows, scores), both (n_users, n), sorted by descending score with
+    ties in catalog order; rows is -1 where fewer than n unseen artworks exist
+    """
+    n_users, n_artworks = len(profiles), len(store)
+    n = min(n, n_artworks)
+    rows_out = np.full((n_users, n), -1, dtype=np.int32)
+    scores_out = np.full((n_users, n), -np.inf, dtype=np.float32)
+    seen_users, seen_rows = seen
+    seen_bounds = np.searchsorted(seen_users, np.arange(n_users + 1))
+
+    for u0 in range(0, n_users, user_block):
+        u1 = min(u0 + user_block, n_users)
+        block_users = seen_users[seen_bounds[u0]:seen_bounds[u1]] - u0
+        block_rows = seen_rows[seen_bounds[u0]:seen_bounds[u1]]
+        best_rows = np.zeros((u1 - u0, 0), dtype=np.int64)
+        best_scores = np.zeros((u1 - u0, 0), dtype=np.float32)
+
+        for a0 in range(0, n_artworks, artwork_block):
+            a1 = min(a0 + artwork_block, n_artworks)
+            # Negated so argpartition can work on the tile without another copy
+            costs = profiles[u0:u1] @ -store.unit[a0:a1].T
+            in_tile = (block_rows >= a0) & (block_rows < a1)
+            costs[block_users[in_tile], block_rows[in_tile] - a0] = np.inf
+
+            tile_rows = _lowest_columns(costs, n)
+            tile_scores = -np.take_along_axis(costs, tile_rows, axis=1)
+            candidate_rows = np.concatenate([best_rows, tile_rows + a0], axis=1)
+            candidate_scores = np.concatenate([best_scores, tile_scores], axis=1)
+            keep = _lowest_columns(-candidate_scores, n)
+            best_rows = np.take_along_axis(candidate_rows, keep, axis=1)
+            best_scores = np.take_along_axis(candidate_scores, keep, axis=1)
+
+        # Sort by descending score, ties in catalog order
+        order = np.argsort(best_rows, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+        best_rows[np.isneginf(best_scores)] = -1  # Only seen artworks were left
+        rows_out[u0:u1] = best_rows
+        scores_out[u0:u1] = best_scores
+    return rows_out, scores_out
+
+
+def _lowest_columns(costs, n):
+    """Column indices of the n lowest values in each row (unordered)"""
+    if costs.shape[1] <= n:
+        return np.broadcast_to(np.arange(costs.shape[1]), costs.shape).copy()
+    return np.argpartition(costs, n - 1, axis=1)[:, :n]
+
+
+def batch_recommendations(store, user_preferences, user_ids=None, n_recommendations=10, **block_sizes):
+    """
+    Score many users against the catalog in one blocked pass
+
+    Parameters:
+    store: FeatureStore to score against
+    user_preferences: PreferenceStore
+    user_ids: users to score (defaults to every user in user_preferences)
+    n_recommendations: number of recommendations per user
+    block_sizes: user_block / artwork_block passed to top_n_blocked
+
+    Returns:
+    BatchResults for the users with at least one like
+    """
+    if user_ids is None:
+        user_ids = list(user_preferences)
+    kept, profiles, seen = user_profiles(store, user_preferences, user_ids)
+    rows, scores = top_n_blocked(store, profiles, seen, n_recommendations, **block_sizes)
+    return BatchResults(np.array(kept, dtype=str), rows, scores, store.version)
+
+
+def main():
+    from racomandation.racomandation import ArtRecommender
+
+    parser = argparse.ArgumentParser(description="Precompute recommendations for every user in one pass")
+    parser.add_argument('--store', default=os.path.join('racomandation', 'feature_store'))
+    parser.add_argument('--preferences', default=None, help='preferences snapshot (the swipe log next to it is replayed)')
+    parser.add_argument('--out', default=os.path.join('racomandation', 'batch_results'))
+    parser.add_argument('-n', type=int, default=100, help='recommendations per user')
+    parser.add_argument('--user-block', type=int, default=256)
+    parser.add_argument('--artwork-block', type=int, default=32768)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    store = FeatureStore.load(args.store)
+    recommender = ArtRecommender(preferences_file=args.preferences)
+    start = time.perf_counter()
+    results = batch_recommendations(store, recommender.user_preferences, n_recommendations=args.n,
+                                    user_block=args.user_block, artwork_block=args.artwork_block)
+    elapsed = time.perf_counter() - start
+    results.save(args.out)
+    recommender.swipe_log.close()
+    print(f"Scored {len(results)} users against {len(store)} artworks in {elapsed:.2f}s, "
+          f"wrote {args.out} (catalog version {store.version})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateQueue:
+    def __init__(self, artwork_ids, version):
+        """
+        Ranked, not yet swiped artworks for one user
+
+        Parameters:
+        artwork_ids: artwork IDs in ranked order
+        version: catalog version the ranking was computed for
+        """
+        self.items = dict.fromkeys(artwork_ids)  # Ordered set: O(1) removal anywhere
+        self.version = version
+        self.swiped = set()  # Swiped since the ranking was computed
+        self.swipes_since_refill = 0
+
+
+class CandidateQueues:
+    def __init__(self, depth=100, refill_below=20, rescore_every=5, max_users=100000, background=True):
+        """
+        Per-user queues of precomputed recommendations
+
+        A swipe only removes the swiped artwork from the user's queue. The
+        queue is rescored on a background worker once it runs low or enough
+        swipes have arrived to make the ranking stale, so serving the next
+        cards costs O(1) regardless of catalog size.
+
+        Parameters:
+        depth: number of ranked candidates computed per refill
+        refill_below: refill once fewer candidates than this remain
+        rescore_every: refill after this many swipes even if the queue is not low
+        max_users: maximum number of queues kept in memory (least recently used are dropped)
+        background: run training and refills on a worker thread instead of inline
+        """
+        self.depth = depth
+        self.refill_below = refill_below
+        self.rescore_every = rescore_every
+        self.max_users = max_users
+        self._queues = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+
+    def __contains__(self, user_id):
+        return user_id in self._queues
+
+    def __len__(self):
+        return len(self._queues)
+
+    def peek(self, user_id, n, version):
+        """
+        First n candidates of the user's queue without removing them
+
+        Returns None when the user has no queue, the queue was ranked for a
+        different catalog version, or it has run empty.
+        """
+        with self._lock:
+            queue = self._queues.get(user_id)
+            if queue is None or queue.version != version or not queue.items:
+                return None
+            self._queues.move_to_end(user_id)
+            return list(islice(queue.items, n))
+
+    def consume(self, user_id, artwork_id):
+        """Remove a swiped artwork from the user's queue"""
+        with self._lock:
+            queue = self._queues.get(user_id)
+            if queue is None:
+                return
+            queue.items.pop(artwork_id, None)
+            queue.swiped.add(artwork_id)
+            queue.swipes_since_refill += 1
+
+    def needs_refill(self, user_id):
+        with self._lock:
+            queue = self._queues.get(user_id)
+            return (queue is None or len(queue.items) < self.refill_below or
+                    queue.swipes_since_refill >= self.rescore_every)
+
+    def replace(self, user_id, artwork_ids, version):
+        """
+        Install a freshly ranked queue
+
+        Artworks swiped while the ranking was being computed are left out.
+        """
+        with self._lock:
+            previous = self._queues.get(user_id)
+            if previous is not None:
+                artwork_ids = [art_id for art_id in artwork_ids if art_id not in previous.swiped]
+            self._queues[user_id] = CandidateQueue(artwork_ids, version)
+            self._queues.move_to_end(user_id)
+            while len(self._queues) > self.max_users:
+                self._queues.popitem(last=False)
+
+    def migrate(self, old_version, new_version, removed=()):
+        """
+        Carry queues over to an incrementally updated catalog
+
+        Queues ranked for old_version stay valid for new_version minus the
+        removed artworks; artworks added by the update enter a queue on its
+        next refill.
+
+        Parameters:
+        old_version: catalog version the queues were ranked for
+        new_version: version of the updated catalog
+        removed: artwork IDs no longer in the catalog
+        """
+        removed = list(removed)
+        with self._lock:
+            for queue in self._queues.values():
+                if queue.version != old_version:
+                    continue
+                for art_id in removed:
+                    queue.items.pop(art_id, None)
+                queue.version = new_version
+
+    def submit(self, fn, *args):
+        """Run fn on the background worker (inline when background is off)"""
+        if self._executor is None:
+            return fn(*args)
+        return self._executor.submit(self._run, fn, *args)
+
+    def schedule_refill(self, user_id, rank):
+        """
+        Rescore the user's queue on the background worker
+
+        Jobs run in submission order, so a refill scheduled after a swipe sees
+        the model already updated with that swipe.
+
+        Parameters:
+        user_id: user whose queue should be refilled
+        rank: callable returning (artwork_ids, version) for the user
+        """
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+        self.submit(self._refill, user_id, rank)
+
+    def _refill(self, user_id, rank):
+        try:
+            artwork_ids, version = rank()
+            self.replace(user_id, artwork_ids, version)
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
+
+    @staticmethod
+    def _run(fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error("Error in background recommendation job: %s", e)
+
+    def drop(self, user_id):
+        with self._lock:
+            self._queues.pop(user_id, None)
+
+    def clear(self):
+        """Drop every queue, e.g. after the catalog changed"""
+        with self._lock:
+            self._queues.clear()
+
+    def join(self):
+        """Wait for all background jobs submitted so far to finish"""
+        if self._executor is not None:
+            self._executor.submit(lambda: None).result()
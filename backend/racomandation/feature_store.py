@@ -0,0 +1,387 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+import numpy as np
+from racomandation.popularity import load_or_build_clusters
+try:
+    import fcntl
+except ImportError:  # Windows: builds are only serialized within a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FILES = ('ids.npy', 'raw.npy', 'embeddings.npy', 'unit.npy', 'pipeline.npz', 'meta.json')
+
+
+class FeatureStore:
+    def __init__(self, ids, raw, embeddings, scaler_mean, scaler_scale, pca_mean, pca_components,
+                 unit=None, version=None, space=None, raw_sum=None, index=None):
+        """
+        Immutable, versioned artwork catalog: compiled features plus the
+        fitted scale -> PCA pipeline that produced the embeddings
+
+        A store is never modified after construction (its arrays are made
+        read-only); a catalog change builds a new store which is swapped in
+        as a whole.
+
+        Parameters:
+        ids: array of artwork IDs; row i of every matrix belongs to ids[i]
+        raw: float32 (n_artworks, n_features) matrix of extracted features
+        embeddings: float32 (n_artworks, n_components) PCA-reduced features
+        scaler_mean, scaler_scale: fitted StandardScaler parameters
+        pca_mean, pca_components: fitted PCA parameters
+        unit: embeddings with L2-normalized rows (computed when not given)
+        version: content hash identifying this catalog (computed when not given)
+        space: hash of the fitted pipeline; stores with the same space share
+               one embedding space, so user models carry over between them
+        raw_sum: float64 column sums of raw (computed on first use when not given)
+        index: artwork_id -> row dict (built from ids when not given)
+        """
+        self.ids = ids
+        self.raw = raw
+        self.embeddings = embeddings
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+        self.pca_mean = pca_mean
+        self.pca_components = pca_components
+        self.unit = unit if unit is not None else normalize_rows(embeddings)
+        for array in (self.ids, self.raw, self.embeddings, self.unit, self.scaler_mean,
+                      self.scaler_scale, self.pca_mean, self.pca_components):
+            if array.flags.writeable:
+                array.flags.writeable = False
+        if index is None:
+            index = dict(zip(ids.tolist(), range(len(ids))))
+        self.index = index  # artwork_id -> row
+        self.version = version or self._content_hash()
+        self.space = space or self._space_hash()
+        self._raw_sum = raw_sum
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def n_features(self):
+        return self.raw.shape[1]
+
+    @property
+    def n_components(self):
+        return self.embeddings.shape[1]
+
+    @property
+    def raw_sum(self):
+        if self._raw_sum is None:
+            self._raw_sum = self.raw.sum(axis=0, dtype=np.float64)
+        return self._raw_sum
+
+    def drift(self):
+        """
+        How far the catalog has moved from the data the pipeline was fitted on
+
+        The shift of the catalog's mean raw features from the fitted scaler
+        mean, in units of the fitted standard deviation (RMS over features).
+        0 right after a fit; grows as added or removed artworks change the
+        feature distribution.
+        """
+        if len(self) == 0:
+            return 0.0
+        shift = (self.raw_sum / len(self) - self.scaler_mean) / self.scaler_scale
+        return float(np.sqrt(np.mean(shift ** 2)))
+
+    def _space_hash(self):
+        digest = hashlib.sha1()
+        for array in (self.scaler_mean, self.scaler_scale, self.pca_mean, self.pca_components):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:12]
+
+    def _content_hash(self):
+        digest = hashlib.sha1()
+        digest.update('\n'.join(self.ids.tolist()).encode('utf-8'))
+        for array in (self.embeddings, self.scaler_mean, self.scaler_scale,
+                      self.pca_mean, self.pca_components):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:12]
+
+    @classmethod
+    def build(cls, artwork_data, max_components=64):
+        """
+        Fit StandardScaler and PCA on a full catalog
+
+        Parameters:
+        artwork_data: dict with artwork_id as key and features as values
+        max_components: upper bound on the PCA dimension
+
+        Returns:
+        FeatureStore
+        """
+        if not artwork_data:
+            raise ValueError("No artwork data provided")
+        # Only fitting needs sklearn; serving a saved store never imports it
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.decomposition import PCA
+
+        features = np.array(list(artwork_data.values()), dtype=np.float64)
+        n_samples, n_features = features.shape
+
+        scaler = StandardScaler()
+        features_scaled = scaler.fit_transform(features)
+
+        n_components = min(n_samples, n_features, max_components)
+        pca = PCA(n_components=n_components)
+        features_reduced = pca.fit_transform(features_scaled)
+
+        return cls(
+            ids=np.array(list(artwork_data.keys())),
+            raw=features.astype(np.float32),
+            embeddings=np.ascontiguousarray(features_reduced, dtype=np.float32),
+            scaler_mean=scaler.mean_,
+            scaler_scale=scaler.scale_,
+            pca_mean=pca.mean_,
+            pca_components=pca.components_,
+        )
+
+    @classmethod
+    def from_json(cls, json_path):
+        """Build a store from an artwork_features.json export (import format only)"""
+        with open(json_path, 'r') as file:
+            return cls.build(json.load(file))
+
+    def transform(self, features):
+        """
+        Project raw feature vectors into the stored embedding space
+
+        Uses the fitted scaler and PCA parameters, so no refit happens.
+        """
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        scaled = (features - self.scaler_mean) / self.scaler_scale
+        return ((scaled - self.pca_mean) @ self.pca_components.T).astype(np.float32)
+
+    def extend(self, artwork_data):
+        """
+        Return a new store with artworks appended, projected with the fitted
+        scaler and PCA (no refit)
+
+        Existing rows keep their positions and the new store stays in the
+        same embedding space. Only the new rows are transformed and hashed;
+        the version is derived from this store's version and the delta.
+
+        Parameters:
+        artwork_data: dict with artwork_id as key and features as values,
+                      for artworks not already in the store
+
+        Returns:
+        FeatureStore
+        """
+        if not artwork_data:
+            return self
+        duplicates = [art_id for art_id in artwork_data if art_id in self.index]
+        if duplicates:
+            raise ValueError(f"Artworks already in the catalog: {duplicates[:5]}")
+        ids = np.array(list(artwork_data.keys()))
+        features = np.array(list(artwork_data.values()), dtype=np.float64)
+        raw = features.astype(np.float32)
+        embeddings = self.transform(features)
+
+        digest = hashlib.sha1(f"{self.version}+".encode('utf-8'))
+        digest.update('\n'.join(ids.tolist()).encode('utf-8'))
+        digest.update(embeddings.tobytes())
+        index = dict(self.index)
+        index.update(zip(ids.tolist(), range(len(self), len(self) + len(ids))))
+        return self._derived(
+            np.concatenate([self.ids, ids]),
+            np.concatenate([self.raw, raw]),
+            np.concatenate([self.embeddings, embeddings]),
+            np.concatenate([self.unit, normalize_rows(embeddings)]),
+            digest.hexdigest()[:12],
+            self.raw_sum + raw.sum(axis=0, dtype=np.float64),
+            index,
+        )
+
+    def drop(self, art_ids):
+        """
+        Return a new store without the given artworks (unknown IDs are ignored)
+
+        Rows after a removed artwork move up; rows() of this store maps the
+        IDs to the positions that were removed.
+
+        Returns:
+        FeatureStore
+        """
+        rows = self.rows(art_ids)
+        if len(rows) == 0:
+            return self
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+
+        digest = hashlib.sha1(f"{self.version}-".encode('utf-8'))
+        digest.update('\n'.join(sorted(self.ids[rows].tolist())).encode('utf-8'))
+        return self._derived(
+            self.ids[keep], self.raw[keep], self.embeddings[keep], self.unit[keep],
+            digest.hexdigest()[:12],
+            self.raw_sum - self.raw[rows].sum(axis=0, dtype=np.float64),
+        )
+
+    def rows(self, art_ids):
+        """Row indices of the known artwork IDs, in order"""
+        index = self.index
+        return np.fromiter((index[art_id] for art_id in art_ids if art_id in index), dtype=np.intp)
+
+    def _derived(self, ids, raw, embeddings, unit, version, raw_sum, index=None):
+        """A store with new rows in this store's embedding space"""
+        return FeatureStore(
+            ids=ids, raw=raw, embeddings=embeddings, unit=unit,
+            scaler_mean=self.scaler_mean, scaler_scale=self.scaler_scale,
+            pca_mean=self.pca_mean, pca_components=self.pca_components,
+            version=version, space=self.space, raw_sum=raw_sum, index=index,
+        )
+
+    def save(self, directory):
+        """
+        Write the store as .npy files that can be memory-mapped on load
+
+        Files are written next to each other and then renamed into place, so a
+        reader never sees a half-written store. Temp names carry the process
+        ID, so writers in other processes can't rename each other's files;
+        hold build_lock(directory) to keep two writers from mixing stores.
+        """
+        os.makedirs(directory, exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        arrays = {'ids.npy': self.ids, 'raw.npy': self.raw,
+                  'embeddings.npy': self.embeddings, 'unit.npy': self.unit}
+        for name, array in arrays.items():
+            with open(os.path.join(directory, name + suffix), 'wb') as file:
+                np.save(file, np.ascontiguousarray(array))
+        with open(os.path.join(directory, 'pipeline.npz' + suffix), 'wb') as file:
+            np.savez(file, scaler_mean=self.scaler_mean, scaler_scale=self.scaler_scale,
+                     pca_mean=self.pca_mean, pca_components=self.pca_components)
+        with open(os.path.join(directory, 'meta.json' + suffix), 'w') as file:
+            json.dump({'version': self.version, 'space': self.space, 'n_artworks': len(self),
+                       'n_features': self.n_features, 'n_components': self.n_components,
+                       'created': time.time()}, file)
+        for name in FILES:
+            os.replace(os.path.join(directory, name + suffix), os.path.join(directory, name))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load a store written by save
+
+        Parameters:
+        directory: store directory
+        mmap: memory-map the matrices instead of reading them into memory
+
+        Returns:
+        FeatureStore
+        """
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ('ids', 'raw', 'embeddings', 'unit')}
+        with np.load(os.path.join(directory, 'pipeline.npz')) as pipeline:
+            params = {key: pipeline[key] for key in pipeline.files}
+        return cls(**arrays, **params, version=cls.read_version(directory))
+
+    @staticmethod
+    def read_version(directory):
+        """Version of the store saved in directory, without loading it"""
+        with open(os.path.join(directory, 'meta.json'), 'r') as file:
+            return json.load(file).get('version')
+
+    @staticmethod
+    def exists(directory):
+        return all(os.path.exists(os.path.join(directory, name)) for name in FILES)
+
+
+def normalize_rows(matrix):
+    """Return a float32 copy of matrix with unit-length rows (zero rows are left as zero)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+@contextmanager
+def build_lock(directory):
+    """
+    Hold an exclusive flock on <directory>/.build.lock, so that of several
+    processes (e.g. gunicorn workers) only one compiles an artifact into the
+    directory while the others wait and then load it
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.build.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def load_or_build(directory, json_path):
+    """
+    Load the compiled store, compiling it from the JSON export first if missing
+    """
+    if FeatureStore.exists(directory):
+        return FeatureStore.load(directory)
+    with build_lock(directory):
+        # Another process may have compiled it while this one waited
+        if FeatureStore.exists(directory):
+            return FeatureStore.load(directory)
+        logger.info("No feature store in %s, compiling it from %s", directory, json_path)
+        store = FeatureStore.from_json(json_path)
+        store.save(directory)
+    return store
+
+
+def main():
+    from racomandation.image_extraction import ImageFeatureExtractor, COLOR_MODES
+    from racomandation.thumbnails import ThumbnailCache
+
+    parser = argparse.ArgumentParser(description="Compile artwork features into a memory-mappable store")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--json', help='artwork_features.json export to import')
+    source.add_argument('--images', help='directory of images to run ImageFeatureExtractor on')
+    parser.add_argument('--out', default=os.path.join('racomandation', 'feature_store'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='extraction worker processes (with --images)')
+    parser.add_argument('--chunksize', type=int, default=16,
+                        help='images handed to a worker at a time (with --images)')
+    parser.add_argument('--color-mode', choices=COLOR_MODES, default='kmeans',
+                        help='dominant color extraction mode (with --images)')
+    parser.add_argument('--full', action='store_true',
+                        help='re-extract every image instead of only new or changed ones (with --images)')
+    parser.add_argument('--thumbnails', nargs='?', const=os.path.join('racomandation', 'thumbnails'),
+                        help='also render the thumbnails served by /api/images into this cache '
+                             'directory, from the same decode (with --images)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.images:
+        # Features of unchanged images are reused from the existing store
+        existing = {}
+        if not args.full and FeatureStore.exists(args.out):
+            previous = FeatureStore.load(args.out)
+            existing = dict(zip(previous.ids.tolist(), previous.raw))
+        extractor = ImageFeatureExtractor(color_mode=args.color_mode)
+        artwork_data = extractor.process_directory(
+            args.images,
+            workers=args.workers,
+            chunksize=args.chunksize,
+            manifest_path=os.path.join(args.out, 'manifest.json'),
+            existing_features=existing,
+            thumbnails=ThumbnailCache(args.thumbnails) if args.thumbnails else None
+        )
+        store = FeatureStore.build(artwork_data)
+    else:
+        store = FeatureStore.from_json(args.json)
+
+    store.save(args.out)
+    # Servers load these instead of fitting k-means for the cold-start ranking
+    load_or_build_clusters(os.path.join(args.out, 'clusters.npz'), store)
+    print(f"Saved {len(store)} artworks ({store.n_features} -> {store.n_components} features) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
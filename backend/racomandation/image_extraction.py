@@ -1,21 +1,44 @@
+import hashlib
+import itertools
 import json
+import logging
+import time
 import numpy as np
 from PIL import Image
 import os
-from sklearn.cluster import KMeans
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+COLOR_MODES = ('kmeans', 'minibatch', 'quantized')
+IMAGE_SIZE = (150, 150)  # Every image is resized to this before extraction
 
 class ImageFeatureExtractor:
-    def __init__(self, n_colors=5, hist_bins=8):
+    def __init__(self, n_colors=5, hist_bins=8, color_mode='kmeans', sample_pixels=2000,
+                 palette_levels=8):
         """
         Initialize the feature extractor
         
         Parameters:
         n_colors: number of dominant colors to extract
         hist_bins: number of bins for color histogram
+        color_mode: how dominant colors are found
+                    'kmeans': full KMeans on every pixel (slowest, reference)
+                    'minibatch': MiniBatchKMeans fit on a pixel subsample
+                    'quantized': most populated cells of a fixed quantized
+                                 palette, refined by a few vectorized k-means steps
+        sample_pixels: pixels sampled per image in 'minibatch' mode
+        palette_levels: levels per channel of the fixed palette in 'quantized' mode
         """
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f"Unknown color mode: {color_mode}")
         self.n_colors = n_colors
         self.hist_bins = hist_bins
+        self.color_mode = color_mode
+        self.sample_pixels = sample_pixels
+        self.palette_levels = palette_levels
         
     def extract_features(self, image_path):
         """
@@ -27,11 +50,7 @@ class ImageFeatureExtractor:
         Returns:
         feature_vector: numpy array of features
         """
-        # Load and resize image
-        img = Image.open(image_path)
-        img = img.convert('RGB')
-        img = img.resize((150, 150))  # Resize for consistency
-        img_array = np.array(img)
+        img_array = load_image(image_path)
         
         # Extract different types of features
         color_features = self._extract_color_features(img_array)
@@ -52,18 +71,8 @@ class ImageFeatureExtractor:
         # Reshape the image array for k-means
         pixels = img_array.reshape(-1, 3)
         
-        # Find dominant colors using k-means
-        kmeans = KMeans(n_clusters=self.n_colors, n_init=10)
-        kmeans.fit(pixels)
-        
-        # Get the dominant colors and their proportions
-        colors = kmeans.cluster_centers_
-        labels = kmeans.labels_
-        color_counts = Counter(labels)
-        total_pixels = sum(color_counts.values())
-        
-        # Calculate color proportions
-        color_props = [count/total_pixels for count in color_counts.values()]
+        # Find dominant colors and their proportions
+        _, color_props = self._dominant_colors(pixels)
         
         # Calculate mean and std for each channel
         means = img_array.mean(axis=(0, 1)) / 255.0
@@ -78,6 +87,118 @@ class ImageFeatureExtractor:
         
         return color_features
     
+    def _dominant_colors(self, pixels):
+        """
+        Find the dominant colors of an (n_pixels, 3) array
+        
+        Returns:
+        (colors, proportions) with n_colors rows, ordered by descending
+        proportion so the feature layout is stable between runs
+        """
+        if self.color_mode == 'kmeans':
+            from sklearn.cluster import KMeans
+            kmeans = KMeans(n_clusters=self.n_colors, n_init=10, random_state=0)
+            labels = kmeans.fit_predict(pixels)
+            colors = kmeans.cluster_centers_
+        elif self.color_mode == 'minibatch':
+            from sklearn.cluster import MiniBatchKMeans
+            rng = np.random.default_rng(0)
+            sample = pixels[rng.choice(len(pixels), size=min(self.sample_pixels, len(pixels)), replace=False)]
+            kmeans = MiniBatchKMeans(n_clusters=self.n_colors, n_init=3, random_state=0,
+                                     batch_size=1024)
+            kmeans.fit(sample)
+            colors = kmeans.cluster_centers_
+            labels = kmeans.predict(pixels)
+        else:
+            colors, labels = self._quantized_palette(pixels)
+        
+        counts = np.bincount(labels, minlength=self.n_colors)
+        proportions = counts / counts.sum()
+        order = np.argsort(-proportions, kind='stable')
+        return colors[order], proportions[order]
+    
+    def _quantized_palette(self, pixels):
+        """Dominant colors seeded from a fixed quantized palette using vectorized binning"""
+        levels = self.palette_levels
+        cells = (pixels.astype(np.int64) * levels) // 256
+        codes = (cells[:, 0] * levels + cells[:, 1]) * levels + cells[:, 2]
+        counts = np.bincount(codes, minlength=levels ** 3)
+        
+        # Palette = mean color of the n_colors most populated cells
+        top = np.argsort(-counts, kind='stable')[:self.n_colors]
+        sums = np.stack([
+            np.bincount(codes, weights=pixels[:, channel], minlength=levels ** 3)
+            for channel in range(3)
+        ], axis=1)
+        colors = sums[top] / np.maximum(counts[top], 1)[:, None]
+        
+        # Refine with a few vectorized k-means steps seeded from the palette
+        pixels = pixels.astype(np.float64)
+        for _ in range(3):
+            # argmin of ||p - c||^2 = argmin of ||c||^2 - 2 p.c (||p||^2 is constant per pixel)
+            labels = ((colors ** 2).sum(axis=1) - 2 * pixels @ colors.T).argmin(axis=1)
+            counts = np.bincount(labels, minlength=len(colors))
+            sums = np.stack([
+                np.bincount(labels, weights=pixels[:, channel], minlength=len(colors))
+                for channel in range(3)
+            ], axis=1)
+            occupied = counts > 0
+            colors[occupied] = sums[occupied] / counts[occupied, None]
+        return colors, labels
+    
+    def extract_features_batch(self, img_arrays):
+        """
+        Extract features for a batch of images at once
+        
+        Channel statistics, histograms and grid brightness are computed for
+        the whole batch in single vectorized passes; only the dominant colors
+        are found image by image. The output matches extract_features row for
+        row.
+        
+        Parameters:
+        img_arrays: uint8 array of shape (N, height, width, 3), e.g. from
+                    np.stack of load_image results
+        
+        Returns:
+        float64 array of shape (N, n_features)
+        """
+        img_arrays = np.asarray(img_arrays)
+        n_images, height, width, _ = img_arrays.shape
+        
+        # Color statistics
+        means = img_arrays.mean(axis=(1, 2)) / 255.0
+        stds = img_arrays.std(axis=(1, 2)) / 255.0
+        color_props = np.stack([
+            self._dominant_colors(img_array.reshape(-1, 3))[1] for img_array in img_arrays
+        ])
+        
+        # Histograms: a single bincount of pixel values offset by (image, channel),
+        # then value counts are summed into bins. Bin k holds values in
+        # [256k/bins, 256(k+1)/bins), like np.histogram(range=(0, 256))
+        offsets = ((np.arange(n_images)[:, None] * 3 + np.arange(3)[None, :]) * 256)[:, None, :]
+        counts = np.bincount(
+            (img_arrays.reshape(n_images, -1, 3) + offsets).ravel(),
+            minlength=n_images * 3 * 256
+        ).reshape(n_images, 3, 256)
+        bin_starts = np.searchsorted((np.arange(256) * self.hist_bins) // 256, np.arange(self.hist_bins))
+        counts = np.add.reduceat(counts, bin_starts, axis=2)
+        bin_width = 256 / self.hist_bins
+        histograms = counts.reshape(n_images, 3 * self.hist_bins) / (height * width * bin_width)
+        
+        # Composition: mean brightness of each cell of a 3x3 grid
+        h_split = height // 3
+        w_split = width // 3
+        grid = img_arrays[:, :3 * h_split, :3 * w_split].reshape(n_images, 3, h_split, 3, w_split, 3)
+        regions = grid.mean(axis=(2, 4, 5)).reshape(n_images, 9) / 255.0
+        brightness = img_arrays.mean(axis=(1, 2, 3)) / 255.0
+        contrast = img_arrays.std(axis=(1, 2, 3)) / 255.0
+        
+        return np.hstack([
+            means, stds, color_props,
+            histograms,
+            regions, brightness[:, None], contrast[:, None]
+        ])
+    
     def _extract_histogram_features(self, img_array):
         """Extract color histogram features"""
         histograms = []
@@ -119,28 +240,274 @@ class ImageFeatureExtractor:
         
         return np.array(features)
     
-    def process_directory(self, directory_path):
+    def process_directory(self, directory_path, workers=1, chunksize=16, manifest_path=None,
+                          existing_features=None, thumbnails=None):
         """
         Process all images in a directory
         
         Parameters:
         directory_path: path to directory containing images
+        workers: number of worker processes (1 extracts in this process)
+        chunksize: number of images decoded and extracted together as one batch
+        manifest_path: JSON manifest of previously processed images; when
+                       given, only new or changed images are extracted
+        existing_features: features from the previous run (e.g. the raw
+                           matrix of the feature store), reused for
+                           unchanged images
+        thumbnails: ThumbnailCache to render the served thumbnails into,
+                    from the same decode as the features
         
         Returns:
         artwork_features: dictionary of image features
         """
+        filenames = sorted(
+            filename for filename in os.listdir(directory_path)
+            if filename.lower().endswith(IMAGE_EXTENSIONS)
+        )
         artwork_features = {}
+        manifest = _load_manifest(manifest_path, self.config()) if manifest_path else {}
+        existing_features = existing_features or {}
         
-        for filename in os.listdir(directory_path):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_path = os.path.join(directory_path, filename)
-                try:
-                    features = self.extract_features(image_path)
-                    artwork_features[filename] = features
-                except Exception as e:
-                    print(f"Error processing {filename}: {str(e)}")
+        # Reuse features of images whose content has not changed
+        todo = []
+        for filename in filenames:
+            previous = manifest.get(filename)
+            entry = _manifest_entry(os.path.join(directory_path, filename), previous)
+            if filename in existing_features and previous and entry['sha1'] == previous['sha1']:
+                artwork_features[filename] = existing_features[filename]
+            else:
+                todo.append(filename)
+            manifest[filename] = entry
+        skipped = len(filenames) - len(todo)
+        
+        start = time.perf_counter()
+        paths = [os.path.join(directory_path, filename) for filename in todo]
+        chunks = [paths[i:i + chunksize] for i in range(0, len(paths), chunksize)]
+        digests = [[manifest[filename]['sha1'] for filename in todo[i:i + chunksize]]
+                   for i in range(0, len(todo), chunksize)]
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self, thumbnails)
+            ) as executor:
+                results = itertools.chain.from_iterable(executor.map(_extract_in_worker, chunks, digests))
+                self._collect(todo, results, artwork_features, manifest, start)
+        else:
+            results = itertools.chain.from_iterable(
+                self._extract_chunk(chunk, thumbnails, chunk_digests)
+                for chunk, chunk_digests in zip(chunks, digests)
+            )
+            self._collect(todo, results, artwork_features, manifest, start)
+        
+        elapsed = time.perf_counter() - start
+        rate = len(todo) / elapsed if elapsed > 0 else 0.0
+        logger.info("Extracted %d images in %.1fs (%.1f images/sec), %d unchanged images reused",
+                    len(todo), elapsed, rate, skipped)
+        
+        if thumbnails is not None:
+            # Extracted images were rendered with their features; unchanged
+            # ones are only decoded if their thumbnails are missing
+            extracted = set(todo)
+            for filename in filenames:
+                if filename not in manifest:
+                    continue
+                if filename in extracted:
+                    thumbnails.record(filename, manifest[filename])
+                else:
+                    thumbnails.add(os.path.join(directory_path, filename), manifest[filename])
+            thumbnails.save_index()
+        
+        if manifest_path:
+            # Forget images that were removed from the directory
+            manifest = {filename: manifest[filename] for filename in filenames if filename in manifest}
+            _save_manifest(manifest_path, self.config(), manifest)
         
         return artwork_features
+    
+    def record_manifest(self, manifest_path, directory_path, filenames):
+        """
+        Add manifest entries for images whose features were extracted
+        outside process_directory (e.g. during dataset ingestion), so the
+        next incremental run reuses their features instead of re-extracting
+        
+        Parameters:
+        manifest_path: JSON manifest used by process_directory
+        directory_path: directory the images were written to
+        filenames: names of the images in directory_path
+        """
+        manifest = _load_manifest(manifest_path, self.config())
+        for filename in filenames:
+            manifest[filename] = _manifest_entry(os.path.join(directory_path, filename), manifest.get(filename))
+        _save_manifest(manifest_path, self.config(), manifest)
+    
+    def config(self):
+        """Settings that change the extracted features"""
+        return {
+            'n_colors': self.n_colors,
+            'hist_bins': self.hist_bins,
+            'color_mode': self.color_mode,
+            'sample_pixels': self.sample_pixels,
+            'palette_levels': self.palette_levels,
+        }
+    
+    def _extract_chunk(self, image_paths, thumbnails=None, digests=None):
+        """
+        Decode and extract a chunk of images with the batch API
+        
+        Parameters:
+        image_paths: images to extract
+        thumbnails: ThumbnailCache to render each decoded image into
+        digests: SHA-1 of each image, naming its thumbnails
+        
+        Returns:
+        list of (features, error) in the order of image_paths
+        """
+        results = []
+        decoded = []
+        for image_path, img_array, error in iter_images(image_paths, thumbnails, digests):
+            if error is None:
+                decoded.append((len(results), img_array))
+            results.append([None, error])
+        if decoded:
+            try:
+                features = self.extract_features_batch(np.stack([img_array for _, img_array in decoded]))
+                for (position, _), row in zip(decoded, features):
+                    results[position][0] = row
+            except Exception as e:
+                for position, _ in decoded:
+                    results[position][1] = str(e)
+        return [tuple(result) for result in results]
+    
+    def _collect(self, filenames, results, artwork_features, manifest, start, report_every=500):
+        for done, (filename, (features, error)) in enumerate(zip(filenames, results), start=1):
+            if error is None:
+                artwork_features[filename] = features
+            else:
+                logger.warning("Error processing %s: %s", filename, error)
+                manifest.pop(filename, None)  # Retry on the next run
+            if done % report_every == 0:
+                elapsed = time.perf_counter() - start
+                logger.info("Processed %d/%d images (%.1f images/sec)", done, len(filenames), done / elapsed)
+
+
+# Per-process extractor used by process_directory workers
+_worker_extractor = None
+
+
+_worker_thumbnails = None
+
+
+def _init_worker(extractor, thumbnails=None):
+    global _worker_extractor, _worker_thumbnails
+    _worker_extractor = extractor
+    _worker_thumbnails = thumbnails
+    # One BLAS/OpenMP thread per process so workers don't oversubscribe the cores
+    threadpool_limits(1)
+
+
+def _extract_in_worker(image_paths, digests=None):
+    return _worker_extractor._extract_chunk(image_paths, _worker_thumbnails, digests)
+
+
+def load_image(image_path, thumbnails=None, digest=None):
+    """
+    Decode an image as an RGB uint8 array resized to IMAGE_SIZE
+    
+    Parameters:
+    image_path: path to the image file
+    thumbnails: ThumbnailCache to also render the decoded image into
+    digest: SHA-1 of the image file (required with thumbnails)
+    """
+    with Image.open(image_path) as img:
+        if thumbnails is not None:
+            thumbnails.render(img, digest)
+        return image_to_array(img)
+
+
+def image_to_array(img):
+    """RGB uint8 array resized to IMAGE_SIZE of an already opened PIL image"""
+    img = img.convert('RGB')
+    img = img.resize(IMAGE_SIZE)  # Resize for consistency
+    return np.array(img)
+
+
+def iter_images(image_paths, thumbnails=None, digests=None):
+    """
+    Stream decoded images one at a time
+    
+    Parameters:
+    image_paths: images to decode
+    thumbnails: ThumbnailCache to render each decoded image into
+    digests: SHA-1 of each image (required with thumbnails)
+    
+    Returns:
+    generator of (image_path, img_array, error); img_array is None and error
+    holds the message when an image cannot be decoded
+    """
+    digests = digests if digests is not None else itertools.repeat(None)
+    for image_path, digest in zip(image_paths, digests):
+        try:
+            yield image_path, load_image(image_path, thumbnails, digest), None
+        except Exception as e:
+            yield image_path, None, str(e)
+
+
+def iter_image_batches(image_paths, batch_size=64):
+    """
+    Stream decoded images as stacked (batch, height, width, 3) arrays for
+    extract_features_batch, skipping images that cannot be decoded
+    
+    Returns:
+    generator of (image_paths, img_arrays)
+    """
+    decoded = iter((path, img_array) for path, img_array, error in iter_images(image_paths)
+                   if error is None)
+    while True:
+        batch = list(itertools.islice(decoded, batch_size))
+        if not batch:
+            return
+        yield [path for path, _ in batch], np.stack([img_array for _, img_array in batch])
+
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest_entry(image_path, previous=None):
+    """
+    Manifest entry (size, mtime, content hash) for an image
+    
+    The content hash is only recomputed when size or mtime changed, so
+    unchanged files cost one stat call.
+    """
+    stat = os.stat(image_path)
+    if previous and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime_ns:
+        return previous
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': _file_sha1(image_path)}
+
+
+def _load_manifest(manifest_path, config):
+    """Image entries of the manifest, or nothing if it was written with other extractor settings"""
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as file:
+        manifest = json.load(file)
+    if manifest.get('config') != config:
+        return {}
+    return manifest['images']
+
+
+def _save_manifest(manifest_path, config, images):
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump({'config': config, 'images': images}, file)
+    os.replace(tmp_path, manifest_path)
 
 # Example usage
 def example_usage():
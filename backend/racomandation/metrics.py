@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, from sub-millisecond queue hits to full refits
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Counts of observed values per bucket, plus their sum and count
+
+        Parameters:
+        buckets: sorted upper bounds; values above the last one land in +Inf
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True):
+        """
+        In-process counters, latency histograms and gauges, rendered in the
+        Prometheus text exposition format
+
+        Every worker process keeps its own registry; samples carry a pid label
+        so scrapes of different workers can be told apart.
+
+        Parameters:
+        enabled: when False, timers and counters are no-ops
+        """
+        self.enabled = enabled
+        self._help = {}  # name -> (type, help text)
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._gauges = {}  # name -> callable returning the current value
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        """Set the TYPE ('counter', 'histogram' or 'gauge') and HELP lines of a metric"""
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        """Increment a counter"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """Record one value (usually seconds) in a histogram"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """Time the body of a with block into a histogram"""
+        return _Timer(self, name, labels)
+
+    def gauge(self, name, help_text, read):
+        """Register a gauge whose value is read when the metrics are rendered"""
+        self.describe(name, 'gauge', help_text)
+        self._gauges[name] = read
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format
+
+        Returns:
+        str
+        """
+        pid = str(os.getpid())
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, (list(h.counts), h.sum, h.count, h.buckets)) for key, h in self._histograms.items()),
+                key=lambda item: item[0]
+            )
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            kind, help_text = self._help.get(name, (kind, ''))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{_labels(labels, pid)} {value}")
+
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels, pid, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels, pid)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(labels, pid)} {count}")
+
+        for name, read in sorted(self._gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                continue  # A gauge must never break the scrape
+            header(name, 'gauge')
+            lines.append(f"{name}{_labels((), pid)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+class _Timer:
+    # A plain class rather than @contextmanager: this runs on every request
+    __slots__ = ('registry', 'name', 'labels', 'start')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def _labels(labels, pid, le=None):
+    pairs = [*labels, ('pid', pid)]
+    if le is not None:
+        pairs.append(('le', le))
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process-wide registry the recommender and the Flask app record into;
+# TINDEART_METRICS=0 turns recording off
+metrics = MetricsRegistry(enabled=os.environ.get('TINDEART_METRICS', '1') != '0')
+
+metrics.describe('tindeart_request_seconds', 'histogram', 'HTTP request latency by endpoint')
+metrics.describe('tindeart_requests_total', 'counter', 'HTTP requests by endpoint and status')
+metrics.describe('tindeart_startup_seconds', 'histogram', 'Process startup time by phase')
+metrics.describe('tindeart_catalog_seconds', 'histogram', 'Catalog load, build and update time by operation')
+metrics.describe('tindeart_preferences_seconds', 'histogram', 'Preference persistence time by operation')
+metrics.describe('tindeart_training_seconds', 'histogram', 'User model training time by mode')
+metrics.describe('tindeart_scoring_seconds', 'histogram', 'Time to rank recommendations by path')
+metrics.describe('tindeart_recommendations_total', 'counter', 'Rankings computed by path')
+metrics.describe('tindeart_candidate_queue_total', 'counter', 'Candidate queue lookups by result')
+metrics.describe('tindeart_model_cache_total', 'counter', 'User model cache lookups by result')
+metrics.describe('tindeart_image_bytes_total', 'counter', 'Image bytes sent by /api/images by thumbnail size')
+metrics.describe('tindeart_metadata_seconds', 'histogram', 'Metadata enrichment time per response')
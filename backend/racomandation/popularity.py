@@ -0,0 +1,228 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from racomandation.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PopularityRanking:
+    def __init__(self, codes, prior_strength=20, n_clusters=16, pool_size=1000, rebuild_every=1000,
+                 cluster_sample=20000, cluster_file=None, background=True):
+        """
+        Precomputed cold-start ranking: Bayesian like-rate interleaved across
+        clusters of the embedding space
+
+        Like and swipe counts per artwork are updated on every swipe. Each
+        artwork's like-rate is shrunk towards the global like-rate by
+        prior_strength pseudo-swipes, so a single like does not put an artwork
+        on top. The catalog is clustered with k-means on the PCA embeddings and
+        the ranking takes the best remaining artwork of each cluster in turn,
+        so new users see the whole range of styles rather than one popular
+        corner. Only the first pool_size artworks of the ranking are kept; it
+        is rebuilt every rebuild_every swipes and for every new catalog version.
+
+        Parameters:
+        codes: ArtworkCodes the counts are indexed by (shared with PreferenceStore)
+        prior_strength: weight of the global like-rate, in swipes
+        n_clusters: number of k-means clusters the ranking interleaves
+        pool_size: length of the precomputed ranking
+        rebuild_every: number of swipes between rebuilds of the ranking
+        cluster_sample: artworks k-means is fit on (all of them are assigned)
+        cluster_file: .npz file the clusters are saved to and loaded from, so
+                      a restart with the same catalog does not fit k-means again
+        background: rebuild on a worker thread instead of inline
+        """
+        self.codes = codes
+        self.prior_strength = prior_strength
+        self.n_clusters = n_clusters
+        self.pool_size = pool_size
+        self.rebuild_every = rebuild_every
+        self.cluster_sample = cluster_sample
+        self.cluster_file = cluster_file
+        self.likes = np.zeros(0, dtype=np.int64)  # code -> likes
+        self.swipes = np.zeros(0, dtype=np.int64)  # code -> swipes
+        self.swipes_since_rebuild = 0
+        self._ranking = None  # (catalog version, ranked rows)
+        self._clusters = None  # (catalog version, labels, distance to the cluster center)
+        self._pending = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+
+    def record(self, code, liked, previous=None):
+        """
+        Count a swipe
+
+        Parameters:
+        code: artwork code (ArtworkCodes.intern)
+        liked: whether the artwork was liked
+        previous: the user's earlier action on the artwork (True, False or
+                  None), so a changed mind moves the like instead of adding a swipe
+        """
+        with self._lock:
+            if code >= len(self.likes):
+                size = max(code + 1, 2 * len(self.likes), 1024)
+                self.likes = np.concatenate([self.likes, np.zeros(size - len(self.likes), dtype=np.int64)])
+                self.swipes = np.concatenate([self.swipes, np.zeros(size - len(self.swipes), dtype=np.int64)])
+            if previous is None:
+                self.swipes[code] += 1
+                self.likes[code] += int(liked)
+            else:
+                self.likes[code] += 1 if liked else -1
+            self.swipes_since_rebuild += 1
+
+    def count(self, user_preferences):
+        """Recount likes and swipes from every user's preferences (a PreferenceStore)"""
+        likes, swipes = user_preferences.counts()
+        with self._lock:
+            self.likes, self.swipes = likes, swipes
+            self.swipes_since_rebuild = self.rebuild_every  # Rank with the new counts on the next chance
+
+    def scores(self, store):
+        """
+        Bayesian like-rate of every artwork in the catalog
+
+        Returns:
+        float64 array with one score per row of store
+        """
+        table = self.codes.table(store)
+        with self._lock:
+            likes, swipes = self.likes, self.swipes
+        n = min(len(table), len(likes))
+        rows, present = table[:n], table[:n] >= 0
+        row_likes = np.zeros(len(store))
+        row_swipes = np.zeros(len(store))
+        row_likes[rows[present]] = likes[:n][present]
+        row_swipes[rows[present]] = swipes[:n][present]
+        # Global like-rate with a uniform prior, so an empty history scores 0.5
+        prior = (likes.sum() + 1) / (swipes.sum() + 2)
+        return (row_likes + self.prior_strength * prior) / (row_swipes + self.prior_strength)
+
+    def top(self, store, n, exclude=()):
+        """
+        First n artworks of the ranking that are not excluded, an O(n) read
+
+        Parameters:
+        store: catalog snapshot the ranking must have been built for
+        n: number of artwork IDs to return
+        exclude: rows to skip (the user's seen artworks)
+
+        Returns:
+        list of artwork IDs, or None while no ranking exists for this catalog
+        version or when it runs out of artworks
+        """
+        ranking = self._ranking
+        if ranking is None or ranking[0] != store.version:
+            self.schedule_rebuild(store, force=True)
+            return None
+        picked = []
+        for row in ranking[1]:
+            if len(picked) == n:
+                break
+            if row not in exclude:
+                picked.append(row)
+        if len(picked) < n:
+            return None
+        return store.ids[picked].tolist()
+
+    def schedule_rebuild(self, store, force=False):
+        """Rebuild the ranking once enough swipes have arrived (or now, with force)"""
+        with self._lock:
+            if self._pending or (not force and self.swipes_since_rebuild < self.rebuild_every):
+                return
+            self._pending = True
+        if self._executor is None:
+            self._rebuild(store)
+        else:
+            self._executor.submit(self._rebuild, store)
+
+    def rebuild(self, store):
+        """
+        Rank the catalog: best artworks of every cluster first, then the
+        second best of every cluster, and so on
+
+        Returns:
+        int array of the first pool_size rows
+        """
+        with self._lock:
+            self.swipes_since_rebuild = 0
+        scores = self.scores(store)
+        labels, distances = self._cluster(store)
+        # Within a cluster: highest score first, the most central artwork on ties
+        order = np.lexsort((distances, -scores, labels))
+        sorted_labels = labels[order]
+        starts = np.searchsorted(sorted_labels, np.arange(labels.max() + 1))
+        rank_in_cluster = np.arange(len(order)) - starts[sorted_labels]
+        # Round-robin over the clusters, visiting the one with the best artwork first
+        cluster_best = scores[order[np.minimum(starts, len(order) - 1)]]
+        interleaved = np.lexsort((-cluster_best[sorted_labels], rank_in_cluster))
+        ranking = order[interleaved[:self.pool_size]]
+        self._ranking = (store.version, ranking.tolist())
+        return ranking
+
+    def _rebuild(self, store):
+        try:
+            with metrics.timer('tindeart_catalog_seconds', operation='popularity'):
+                self.rebuild(store)
+        except Exception as e:
+            logger.error("Error rebuilding the popularity ranking: %s", e)
+        finally:
+            with self._lock:
+                self._pending = False
+
+    def _cluster(self, store):
+        """k-means labels of every artwork and its distance to the cluster center, cached per catalog version"""
+        clusters = self._clusters
+        if clusters is not None and clusters[0] == store.version:
+            return clusters[1], clusters[2]
+        if self.cluster_file:
+            labels, distances = load_or_build_clusters(self.cluster_file, store, self.n_clusters, self.cluster_sample)
+        else:
+            labels, distances = build_clusters(store, self.n_clusters, self.cluster_sample)
+        self._clusters = (store.version, labels, distances)
+        return labels, distances
+
+
+def build_clusters(store, n_clusters=16, sample_size=20000):
+    """
+    Cluster the catalog with k-means on the PCA embeddings
+
+    k-means is fit on a sample of sample_size artworks and every artwork is
+    assigned to its nearest center.
+
+    Returns:
+    (int labels, float32 distance of each artwork to its cluster center)
+    """
+    from sklearn.cluster import KMeans
+
+    embeddings = store.embeddings
+    k = min(n_clusters, len(store))
+    sample = embeddings
+    if len(store) > sample_size:
+        rng = np.random.default_rng(0)
+        sample = embeddings[np.sort(rng.choice(len(store), size=sample_size, replace=False))]
+    kmeans = KMeans(n_clusters=k, n_init=1, random_state=0).fit(sample)
+    labels = kmeans.predict(embeddings)
+    distances = np.linalg.norm(embeddings - kmeans.cluster_centers_[labels].astype(embeddings.dtype), axis=1)
+    logger.info("Clustered %d artworks into %d clusters for cold-start ranking", len(store), k)
+    return labels, distances
+
+
+def load_or_build_clusters(path, store, n_clusters=16, sample_size=20000):
+    """
+    Load the clusters saved at path, rebuilding and saving them when they are
+    missing or belong to another catalog version
+    """
+    if os.path.exists(path):
+        with np.load(path) as data:
+            if str(data['version']) == store.version and int(data['n_clusters']) == n_clusters:
+                return data['labels'], data['distances']
+    labels, distances = build_clusters(store, n_clusters, sample_size)
+    # Several workers may build at once; each writes its own file and renames it
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, version=store.version, n_clusters=n_clusters, labels=labels, distances=distances)
+    os.replace(tmp_path, path)
+    return labels, distances
@@ -0,0 +1,235 @@
+import threading
+import numpy as np
+
+EMPTY = np.empty(0, dtype=np.int32)
+EMPTY.flags.writeable = False  # Shared by every user without likes or dislikes
+
+
+class ArtworkCodes:
+    def __init__(self):
+        """
+        Interns artwork IDs to dense int32 codes
+
+        Codes are assigned in first-seen order and never change, so they stay
+        valid across catalog versions. Each catalog version gets a lookup table
+        from code to matrix row, built once and extended as new IDs appear.
+        """
+        self._codes = {}
+        self._names = []
+        self._tables = {}  # catalog version -> code -> row table (-1 when not in the catalog)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def intern(self, art_id):
+        """Code of art_id, assigning the next free one if it is new"""
+        code = self._codes.get(art_id)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(art_id)
+                if code is None:
+                    code = len(self._names)
+                    self._names.append(art_id)
+                    self._codes[art_id] = code
+        return code
+
+    def lookup(self, art_id):
+        """Code of art_id, or None if it was never interned"""
+        return self._codes.get(art_id)
+
+    def names(self, codes):
+        """Artwork IDs of the given codes"""
+        names = self._names
+        return [names[code] for code in codes.tolist()]
+
+    def rows(self, store, codes):
+        """
+        Map codes to rows of the store's matrices, skipping artworks not in the catalog
+
+        Parameters:
+        store: FeatureStore the rows index into
+        codes: int32 array of codes
+
+        Returns:
+        intp array of rows, in the order of codes
+        """
+        rows = self.table(store)[codes]
+        return rows[rows >= 0]
+
+    def table(self, store):
+        """Code -> row table for the store's catalog version (-1 for artworks it lacks)"""
+        table = self._tables.get(store.version)
+        if table is not None and len(table) == len(self._names):
+            return table
+        with self._lock:
+            table = self._tables.get(store.version)
+            if table is None:
+                table = np.empty(0, dtype=np.intp)
+            if len(table) < len(self._names):
+                index = store.index
+                tail = self._names[len(table):]
+                table = np.concatenate([table, np.fromiter(
+                    (index.get(name, -1) for name in tail), dtype=np.intp, count=len(tail)
+                )])
+                if store.version not in self._tables:
+                    # Keep the previous version's table for requests still in flight on it
+                    self._tables = dict(list(self._tables.items())[-1:])
+                self._tables[store.version] = table
+            return table
+
+
+class UserPreferences:
+    __slots__ = ('liked', 'disliked')
+
+    def __init__(self, liked=EMPTY, disliked=EMPTY):
+        """
+        One user's likes and dislikes as sorted, duplicate-free int32 code arrays
+
+        An artwork is in at most one of the two arrays: the user's last swipe
+        on it decides which.
+        """
+        self.liked = liked
+        self.disliked = disliked
+
+    def seen(self):
+        """Codes of every artwork the user swiped"""
+        return np.concatenate([self.liked, self.disliked])
+
+    def action(self, code):
+        """True if the artwork is liked, False if disliked, None if not swiped"""
+        for array, liked in ((self.liked, True), (self.disliked, False)):
+            position = np.searchsorted(array, code)
+            if position < len(array) and array[position] == code:
+                return liked
+        return None
+
+    def add(self, code, liked):
+        """
+        Record a swipe; returns False if it did not change the preferences
+        """
+        keep, other = (self.liked, self.disliked) if liked else (self.disliked, self.liked)
+        position = np.searchsorted(keep, code)
+        if position < len(keep) and keep[position] == code:
+            return False
+        keep = np.insert(keep, position, code).astype(np.int32, copy=False)
+        flipped = np.searchsorted(other, code)
+        if flipped < len(other) and other[flipped] == code:
+            other = np.delete(other, flipped) if len(other) > 1 else EMPTY
+        if liked:
+            self.liked, self.disliked = keep, other
+        else:
+            self.disliked, self.liked = keep, other
+        return True
+
+
+class PreferenceStore:
+    def __init__(self, codes=None):
+        """
+        Every user's swipes, deduplicated with last-action-wins semantics
+
+        Artwork IDs are interned once in codes, so a swipe costs four bytes
+        instead of a string per occurrence, and a repeated swipe of the same
+        artwork does not count twice in training or in the user's profile.
+
+        Parameters:
+        codes: ArtworkCodes to intern into (shared when rebuilding preferences)
+        """
+        self.codes = codes if codes is not None else ArtworkCodes()
+        self._users = {}
+
+    def __len__(self):
+        return len(self._users)
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def __iter__(self):
+        return iter(self._users)
+
+    def __getitem__(self, user_id):
+        return self._users[user_id]
+
+    def get(self, user_id):
+        return self._users.get(user_id)
+
+    def add(self, user_id, art_id, liked):
+        """
+        Record a swipe; the caller serializes swipes of the same user
+
+        Returns:
+        True if the user's preferences changed (False for a repeated swipe)
+        """
+        preferences = self._users.get(user_id)
+        if preferences is None:
+            preferences = self._users[user_id] = UserPreferences()
+        return preferences.add(self.codes.intern(art_id), liked)
+
+    def set(self, user_id, liked=(), disliked=()):
+        """
+        Replace a user's preferences with lists of artwork IDs
+
+        Duplicates are dropped; an artwork in both lists counts as liked,
+        since the order of the swipes is not known.
+        """
+        intern = self.codes.intern
+        liked = set(map(intern, liked))
+        disliked = set(map(intern, disliked)) - liked
+        self._users[user_id] = UserPreferences(_code_array(liked), _code_array(disliked))
+
+    def action(self, user_id, art_id):
+        """The user's current action on the artwork: True (liked), False (disliked) or None"""
+        preferences = self._users.get(user_id)
+        code = self.codes.lookup(art_id)
+        if preferences is None or code is None:
+            return None
+        return preferences.action(code)
+
+    def counts(self):
+        """
+        Likes and swipes per artwork code over all users
+
+        Returns:
+        (likes, swipes) int64 arrays indexed by code
+        """
+        users = list(self._users.values())
+        size = len(self.codes)
+        liked = np.concatenate([EMPTY, *(preferences.liked for preferences in users)])
+        disliked = np.concatenate([EMPTY, *(preferences.disliked for preferences in users)])
+        likes = np.bincount(liked, minlength=size).astype(np.int64)
+        return likes, likes + np.bincount(disliked, minlength=size)
+
+    def liked_ids(self, user_id):
+        return self.codes.names(self._users[user_id].liked)
+
+    def disliked_ids(self, user_id):
+        return self.codes.names(self._users[user_id].disliked)
+
+    def seen_ids(self, user_id):
+        """Artwork IDs the user swiped (empty for unknown users)"""
+        preferences = self._users.get(user_id)
+        return self.codes.names(preferences.seen()) if preferences else []
+
+    def to_dict(self):
+        """
+        Plain {user_id: {'liked': [...], 'disliked': [...]}} with artwork IDs,
+        as stored in the preferences snapshot and served by the API
+        """
+        names = self.codes.names
+        return {
+            user_id: {'liked': names(preferences.liked), 'disliked': names(preferences.disliked)}
+            for user_id, preferences in list(self._users.items())
+        }
+
+    @classmethod
+    def from_dict(cls, user_preferences, codes=None):
+        """Build a store from {user_id: {'liked': [...], 'disliked': [...]}}"""
+        store = cls(codes)
+        for user_id, preferences in user_preferences.items():
+            store.set(user_id, preferences.get('liked', ()), preferences.get('disliked', ()))
+        return store
+
+
+def _code_array(codes):
+    # Building small arrays from a sorted list is much faster than np.unique
+    return np.array(sorted(codes), dtype=np.int32) if codes else EMPTY
@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005, max_depth=64):
+        """
+        Statistical profiler that samples the stacks of every thread
+
+        A background thread wakes every interval seconds and records the
+        current stack of each other thread, so overhead does not depend on how
+        much code runs. Results are collapsed stacks (one "frame;frame;... count"
+        line per distinct stack), the input format of flame graph tools.
+
+        Parameters:
+        interval: seconds between samples
+        max_depth: innermost frames kept per stack
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling (no-op if already running); clears earlier samples"""
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks.clear()
+            self.samples = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Stop sampling; the collected stacks stay available"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def collapsed(self):
+        """
+        Collected stacks in collapsed format, most frequent first
+
+        Returns:
+        str
+        """
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id != own:
+                        self._stacks[self._stack(frame)] += 1
+                self.samples += 1
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
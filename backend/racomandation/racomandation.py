@@ -1,164 +1,556 @@
-import json
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.decomposition import PCA
-from sklearn.ensemble import RandomForestClassifier
+from racomandation.user_models import UserModelRegistry
+from racomandation.candidate_queue import CandidateQueues
+from racomandation.preferences import PreferenceStore
+from racomandation.popularity import PopularityRanking
+from racomandation.feature_store import FeatureStore
+from racomandation.swipe_log import SwipeLog, load_snapshot, write_snapshot
+from racomandation.vector_index import load_or_build_index, make_index, top_k
+from racomandation.batch_scoring import batch_recommendations
+from racomandation.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 class ArtRecommender:
-    def __init__(self):
-        self.scaler = StandardScaler()
-        self.pca = None
-        self.classifier = RandomForestClassifier(n_estimators=100)
-        self.user_preferences = {}
-        self.user_preferences_file_image = {}
-        self.artwork_features = {}
+    def __init__(self, preferences_file=None, compact_every=10000, user_lock_stripes=64, refit_drift=0.1):
+        """
+        Parameters:
+        preferences_file: path of the preferences snapshot (defaults to racomandation/user_preferences.json)
+        compact_every: number of logged swipes after which the log is compacted into the snapshot
+        user_lock_stripes: number of locks that per-user mutations are striped across
+        refit_drift: FeatureStore.drift() above which add_artworks/remove_artworks
+                     schedule a full refit of the scaler and PCA
+        """
+        self.feature_store = None  # Immutable catalog snapshot; replaced as a whole, never mutated
+        self.vector_index = None  # Optional ANN index over feature_store.unit (see vector_index.py)
+        self.user_models = UserModelRegistry()  # One model per user, LRU-evicted
+        self.candidate_queues = CandidateQueues()  # Precomputed recommendations served by swipe()
+        self.user_preferences = PreferenceStore()  # Deduplicated swipes with interned artwork IDs
+        # Cold-start ranking, counted from the same swipes
+        self.popularity = PopularityRanking(self.user_preferences.codes)
         self.is_classifier_trained = {}  # Track training status for each user
-        self.preferences_file = os.path.join(os.getcwd(), 'racomandation/user_preferences.json')
+        self.preferences_file = preferences_file or os.path.join(os.getcwd(), 'racomandation/user_preferences.json')
+        self.compact_every = compact_every
+        self.swipe_log = None  # Append-only log of swipes since the last snapshot
+        # Per-user mutations take the user's stripe; compaction takes them all
+        self._user_locks = [threading.RLock() for _ in range(user_lock_stripes)]
+        self._catalog_lock = threading.Lock()  # Serializes catalog swaps and updates
+        self.refit_drift = refit_drift
+        # Catalog refits and log compactions, one at a time off the request threads
+        self._background_executor = ThreadPoolExecutor(max_workers=1)
+        self._refit_job = None
+        self._compaction_job = None
         self._load_preferences()  # Load existing preferences on initialization
         
     def _load_preferences(self):
-        """Load user preferences from JSON file if it exists"""
+        """Rebuild user preferences from the last snapshot plus the swipe log tail"""
         try:
-            if os.path.exists(self.preferences_file):
-                with open(self.preferences_file, 'r') as file:
-                    self.user_preferences = json.load(file)
-                # Convert user preferences to include artwork features
-                for user_id, preferences in self.user_preferences.items():
-                    self.user_preferences_file_image[user_id] = {
-                        'liked': [],
-                        'disliked': []
-                    }
-                    
-                    # Load artwork features from json file
-                    artwork_features_file = os.path.join(os.getcwd(), 'racomandation/artwork_features.json')
-                    with open(artwork_features_file, 'r') as file:
-                        artwork_data = json.load(file)
-                    
-                    # Process liked images
-                    if 'liked' in preferences:
-                        for image_name in preferences['liked']:
-                            if image_name in artwork_data:
-                                self.user_preferences_file_image[user_id]['liked'].append({
-                                    'file_name': image_name,
-                                    'file_data': artwork_data[image_name]
-                                })
-                                
-                    # Process disliked images            
-                    if 'disliked' in preferences:
-                        for image_name in preferences['disliked']:
-                            if image_name in artwork_data:
-                                self.user_preferences_file_image[user_id]['disliked'].append({
-                                    'file_name': image_name,
-                                    'file_data': artwork_data[image_name]
-                                })
-                    
-                print(f"Loaded preferences for {len(self.user_preferences)} users")
+            with metrics.timer('tindeart_preferences_seconds', operation='load'):
+                self.swipe_log = SwipeLog(
+                    os.path.splitext(self.preferences_file)[0] + '.log',
+                    on_records=self._apply_records,
+                    on_resync=self._resync_preferences
+                )
+                self.user_preferences, replayed = self._read_preferences()
+                self.popularity.count(self.user_preferences)
+            if replayed:
+                logger.info("Replayed %d swipes from %s", replayed, self.swipe_log.path)
+            
+            if self.user_preferences:
+                logger.info("Loaded preferences for %d users", len(self.user_preferences))
         except Exception as e:
-            print(f"Error loading preferences: {e}")
-            self.user_preferences = {}
+            logger.error("Error loading preferences: %s", e)
+            self.user_preferences = PreferenceStore(self.user_preferences.codes)
+
+    def _read_preferences(self):
+        """
+        Read the snapshot and replay the swipe log on top of it
+        
+        Returns:
+        (PreferenceStore, number of replayed swipes)
+        """
+        # Hold the log so no other worker compacts between the two reads
+        with self.swipe_log.locked():
+            seq, user_preferences = load_snapshot(self.preferences_file)
+            records = self.swipe_log.replay(after_seq=seq)
+        # Artwork codes are kept, so tables built for the current catalog stay valid
+        preferences = PreferenceStore.from_dict(user_preferences, self.user_preferences.codes)
+        del user_preferences
+        for record in records:
+            preferences.add(record['user'], record['art'], record['liked'])
+        return preferences, len(records)
+
+    def _resync_preferences(self):
+        """
+        Rebuild preferences after missing swipes that another worker already
+        compacted into the snapshot (only when this worker fell far behind)
+        """
+        with self._all_user_locks():
+            self.swipe_log.flush()  # Write this worker's pending swipes so the replay includes them
+            self.user_preferences, _ = self._read_preferences()
+            self.popularity.count(self.user_preferences)
+            self.user_models.clear()
+            self.candidate_queues.clear()
+        logger.warning("Resynchronized preferences for %d users from %s",
+                       len(self.user_preferences), self.preferences_file)
 
-    def _save_preferences(self):
-        """Save user preferences to JSON file"""
+    def _save_preferences(self, min_records=0):
+        """
+        Compact the swipe log into a new preferences snapshot
+        
+        Individual swipes are persisted by appending to the swipe log, so this
+        full rewrite only runs every compact_every swipes (or on demand).
+        Holds the log and every user lock so that no swipe, from this or any
+        other worker process, lands between the snapshot and the truncation.
+        
+        Parameters:
+        min_records: skip compaction if the log holds fewer records by the
+                     time the lock is acquired (another worker compacted first)
+        """
         try:
-            with open(self.preferences_file, 'w') as file:
-                json.dump(self.user_preferences, file, indent=2)
-            print("Preferences saved successfully")
+            with self.swipe_log.locked(), self._all_user_locks():
+                self.swipe_log.flush()  # Also applies swipes logged by other workers
+                if self.swipe_log.records_since_compaction < min_records:
+                    return
+                with metrics.timer('tindeart_preferences_seconds', operation='compact'):
+                    write_snapshot(self.preferences_file, self.swipe_log.seq, self.user_preferences.to_dict())
+                    self.swipe_log.truncate()
+            logger.info("Preferences saved successfully")
         except Exception as e:
-            print(f"Error saving preferences: {e}")
+            logger.error("Error saving preferences: %s", e)
+
+    def _user_lock(self, user_id):
+        """Lock serializing mutations of one user's preferences and model"""
+        return self._user_locks[hash(user_id) % len(self._user_locks)]
+
+    @contextmanager
+    def _all_user_locks(self):
+        with ExitStack() as stack:
+            for lock in self._user_locks:
+                stack.enter_context(lock)
+            yield
+
+    def _add_swipe(self, user_id, artwork_id, liked):
+        """
+        Add a swipe to the in-memory preferences; the caller holds the user's lock
+        
+        Returns:
+        False if the swipe repeats the user's last action on the artwork
+        """
+        if user_id not in self.user_preferences:
+            self.is_classifier_trained[user_id] = False
+        previous = self.user_preferences.action(user_id, artwork_id)
+        if not self.user_preferences.add(user_id, artwork_id, liked):
+            return False
+        self.popularity.record(self.user_preferences.codes.lookup(artwork_id), liked, previous)
+        return True
 
+    def _apply_records(self, records):
+        """Apply swipes that other worker processes wrote to the shared swipe log"""
+        store = self.feature_store
+        for record in records:
+            user_id, artwork_id, liked = record['user'], record['art'], record['liked']
+            with self._user_lock(user_id):
+                changed = self._add_swipe(user_id, artwork_id, liked)
+            self.candidate_queues.consume(user_id, artwork_id)
+            if changed and store is not None and artwork_id in store.index:
+                self.candidate_queues.submit(self._train_classifier, user_id, artwork_id, liked, store)
+        if store is not None:
+            self.popularity.schedule_rebuild(store)
+
+    @property
+    def artwork_ids(self):
+        """Artwork IDs of the current catalog; row i of the matrices belongs to artwork_ids[i]"""
+        return self.feature_store.ids if self.feature_store else np.array([])
+    
+    @property
+    def artwork_index(self):
+        """artwork_id -> row index in the current catalog"""
+        return self.feature_store.index if self.feature_store else {}
+    
+    @property
+    def artwork_matrix(self):
+        """PCA-reduced features of the current catalog, float32 (n_artworks, n_components)"""
+        return self.feature_store.embeddings if self.feature_store else None
+    
+    @property
+    def artwork_unit_matrix(self):
+        """Current catalog embeddings with L2-normalized rows, for cosine similarity"""
+        return self.feature_store.unit if self.feature_store else None
+    
     def process_artwork_features(self, artwork_data):
         """
         Process artwork features (colors, style, composition, etc.)
         
+        Fits the scaler and PCA on the whole catalog and swaps the result in
+        as a new catalog version. Only call this when the catalog changes;
+        prefer load_feature_store with a compiled store, which skips the fit.
+        
         Parameters:
         artwork_data: dict with artwork_id as key and features as values
         """
-        if not artwork_data:
-            raise ValueError("No artwork data provided")
+        with metrics.timer('tindeart_catalog_seconds', operation='build'):
+            store = FeatureStore.build(artwork_data)
+            self.load_feature_store(store)
+                    
+        logger.info("Processed %d artworks. Feature dimension reduced from %d to %d",
+                    len(store), store.n_features, store.n_components)
+    
+    def load_feature_store(self, store, vector_index=None):
+        """
+        Atomically swap in a compiled FeatureStore as the current catalog
+        
+        Request handlers read self.feature_store once and keep using that
+        snapshot, so a swap never mixes two catalog versions within a request.
+        User models were trained in the previous embedding space and are
+        dropped; they are refit from history on next use.
+        
+        Parameters:
+        store: FeatureStore, e.g. FeatureStore.load(directory) which memory-maps the matrices
+        vector_index: optional index built over store.unit for approximate
+                      similarity search; without one the exact scan is used
+        """
+        with self._catalog_lock:
+            self._install_catalog(store, vector_index)
+    
+    def _install_catalog(self, store, vector_index):
+        """Swap a new catalog in; the caller holds _catalog_lock"""
+        previous = self.feature_store
+        self.vector_index = vector_index
+        self.feature_store = store
+        if previous is not None and previous.space != store.space:
+            self.user_models.clear()
+        if previous is not None and previous.version != store.version:
+            self.candidate_queues.clear()
+        self.user_preferences.codes.table(store)  # Build the code -> row table before requests need it
+        self.popularity.schedule_rebuild(store, force=True)
+        logger.info("Serving catalog version %s (%d artworks)", store.version, len(store))
+    
+    def reload_feature_store(self, directory, index_kind=None):
+        """
+        Swap in the store saved in directory if it is a new catalog version
+        
+        Parameters:
+        directory: feature store directory
+        index_kind: vector index to load or build for the new store ('ivf',
+                    'exact' or None for no index)
+        
+        Returns:
+        True if a new version was loaded
+        """
+        current = self.feature_store.version if self.feature_store else None
+        if FeatureStore.read_version(directory) == current:
+            return False
+        with metrics.timer('tindeart_catalog_seconds', operation='load'):
+            store = FeatureStore.load(directory)
+            index = load_or_build_index(directory, store, index_kind) if index_kind else None
+            self.load_feature_store(store, index)
+        return True
+    
+    def add_artworks(self, artwork_data):
+        """
+        Add artworks to the catalog without refitting the scaler and PCA
+        
+        New artworks are projected with the fitted pipeline and appended to
+        the feature matrices and the vector index, so the cost is proportional
+        to the number of new artworks (plus copying the matrices once). The
+        embedding space does not change: user models and candidate queues
+        are kept, and the new artworks show up on each queue's next refill.
+        Artworks that are already in the catalog are replaced.
+        
+        A full refit is scheduled in the background once FeatureStore.drift()
+        exceeds refit_drift.
+        
+        Parameters:
+        artwork_data: dict with artwork_id as key and features as values
+        
+        Returns:
+        the new FeatureStore (save it to keep the update across restarts)
+        """
+        return self._update_catalog(artwork_data, ())
+    
+    def remove_artworks(self, art_ids):
+        """
+        Remove artworks from the catalog without refitting the scaler and PCA
+        
+        The artworks are dropped from the feature matrices, the vector index
+        and every candidate queue; swipes on them stay in the users' history.
+        
+        Parameters:
+        art_ids: artwork IDs to remove (unknown IDs are ignored)
+        
+        Returns:
+        the new FeatureStore
+        """
+        return self._update_catalog({}, art_ids)
+    
+    def _update_catalog(self, artwork_data, removed_ids):
+        with self._catalog_lock, metrics.timer('tindeart_catalog_seconds', operation='update'):
+            store = self.feature_store
+            if not store:
+                raise ValueError("No artwork features processed. Call process_artwork_features first.")
+            removed = [art_id for art_id in dict.fromkeys(removed_ids) if art_id in store.index]
+            # Replaced artworks are dropped and appended again with their new features
+            dropped = removed + [art_id for art_id in artwork_data if art_id in store.index]
+            updated = store.drop(dropped).extend(artwork_data)
             
-        features = np.array(list(artwork_data.values()))
-        n_samples, n_features = features.shape
+            # Update the index alongside, on a copy so searches in flight keep
+            # a consistent index; an index for another version is left alone
+            index = self.vector_index
+            if index is not None and index.version == store.version:
+                index = index.copy()
+                index.drop(store.rows(dropped))
+                index.add(updated.unit[len(updated) - len(artwork_data):])
+                index.version = updated.version
+            
+            # Build the new version's code -> row table before requests need it,
+            # so the first request after the update doesn't pay O(#codes) inline
+            self.user_preferences.codes.table(updated)
+            self.vector_index = index
+            self.feature_store = updated
+            self.candidate_queues.migrate(store.version, updated.version, removed)
+            
+            drift = updated.drift()
+            logger.info("Serving catalog version %s (%d artworks): %d added, %d removed, drift %.3f",
+                        updated.version, len(updated), len(artwork_data), len(removed), drift)
+            # Only one refit at a time; it picks up every update made before it starts
+            if drift > self.refit_drift and (self._refit_job is None or self._refit_job.done()):
+                self._refit_job = self._background_executor.submit(self._refit_catalog)
+        return updated
+    
+    def _refit_catalog(self):
+        """Refit the scaler and PCA on the current catalog and swap the result in"""
+        try:
+            # Holding the lock makes catalog updates wait for the refit instead
+            # of being lost; requests keep being served from the current store
+            with self._catalog_lock, metrics.timer('tindeart_catalog_seconds', operation='refit'):
+                store = self.feature_store
+                logger.info("Catalog drift %.3f > %s, refitting %d artworks",
+                            store.drift(), self.refit_drift, len(store))
+                refit = FeatureStore.build(dict(zip(store.ids.tolist(), store.raw)))
+                index = self.vector_index
+                if index is not None:
+                    index = make_index(index.kind, **index.settings()).build(refit.unit, refit.version)
+                self._install_catalog(refit, index)
+        except Exception as e:
+            logger.error("Error refitting the catalog: %s", e)
+    
+    def swipe(self, user_id, artwork_id, liked, n_recommendations=10):
+        """
+        Record a swipe and return the user's next recommendations
         
-        # Normalize features
-        features_scaled = self.scaler.fit_transform(features)
+        Only the event is recorded inline and the artwork is removed from the
+        user's candidate queue. Training and rescoring run on the queue's
+        background worker, so the cost does not depend on catalog size.
         
-        # Initialize PCA with appropriate number of components
-        n_components = min(n_samples, n_features, 64)
-        self.pca = PCA(n_components=n_components)
+        Parameters:
+        user_id: unique identifier for the user
+        artwork_id: artwork that was swiped
+        liked: whether the artwork was liked
+        n_recommendations: number of recommendations to return
+        
+        Returns:
+        list of artwork IDs sorted by predicted preference
+        """
+        store = self.feature_store
+        if self.record_swipe(user_id, artwork_id, liked, train=False):
+            self.candidate_queues.submit(self._train_classifier, user_id, artwork_id, liked, store)
+        self.candidate_queues.consume(user_id, artwork_id)
+        return self.next_recommendations(user_id, n_recommendations)
+    
+    def next_recommendations(self, user_id, n_recommendations=10):
+        """
+        Serve recommendations from the user's candidate queue
         
-        # Reduce dimensionality
-        features_reduced = self.pca.fit_transform(features_scaled)
+        The queue is only ranked inline the first time a user is seen (or
+        after a catalog swap); otherwise a refill is scheduled in the
+        background when the queue runs low or gets stale.
+        """
+        store = self.feature_store
+        if not store:
+            raise ValueError("No artwork features processed. Call process_artwork_features first.")
         
-        # Store processed features
-        for idx, art_id in enumerate(artwork_data.keys()):
-            self.artwork_features[art_id] = features_reduced[idx]
-                    
-        print(f"Processed {len(artwork_data)} artworks. Feature dimension reduced from {n_features} to {n_components}")
+        queues = self.candidate_queues
+        recommendations = queues.peek(user_id, n_recommendations, store.version)
+        if recommendations is None:
+            metrics.inc('tindeart_candidate_queue_total', result='miss')
+            queues.replace(user_id, *self._rank_candidates(user_id, store))
+            recommendations = queues.peek(user_id, n_recommendations, store.version) or []
+        else:
+            metrics.inc('tindeart_candidate_queue_total', result='hit')
+            if queues.needs_refill(user_id):
+                queues.schedule_refill(user_id, lambda: self._rank_candidates(user_id))
+        return recommendations
+    
+    def batch_recommendations(self, user_ids=None, n_recommendations=None, **block_sizes):
+        """
+        Score many users in one blocked pass over the catalog
+        
+        Each user's similarity profile (see _get_similarity_based_recommendations)
+        is stacked into a matrix and multiplied against the artwork matrix in
+        tiles, so memory stays bounded for any number of users. Users without
+        likes are skipped.
+        
+        Parameters:
+        user_ids: users to score (defaults to every user with preferences)
+        n_recommendations: recommendations per user (defaults to the candidate queue depth)
+        block_sizes: user_block / artwork_block tile size, see batch_scoring.top_n_blocked
+        
+        Returns:
+        BatchResults, which can be saved and later passed to load_batch_results
+        """
+        store = self.feature_store
+        if not store:
+            raise ValueError("No artwork features processed. Call process_artwork_features first.")
+        return batch_recommendations(store, self.user_preferences, user_ids,
+                                     n_recommendations or self.candidate_queues.depth, **block_sizes)
     
-    def record_swipe(self, user_id, artwork_id, liked):
+    def load_batch_results(self, results):
+        """
+        Fill users' candidate queues from precomputed BatchResults
+        
+        Results for another catalog version are ignored. Artworks the user
+        swiped after the results were computed are left out.
+        
+        Returns:
+        number of queues filled
+        """
+        store = self.feature_store
+        if store is None or results.version != store.version:
+            logger.warning("Ignoring batch results for catalog version %s", results.version)
+            return 0
+        for user_id in results.user_ids.tolist():
+            seen = set(self.user_preferences.seen_ids(user_id))
+            ranked = [art_id for art_id in results.recommendations(user_id, store) if art_id not in seen]
+            self.candidate_queues.replace(user_id, ranked, store.version)
+        logger.info("Filled candidate queues for %d users from batch results", len(results))
+        return len(results)
+    
+    def _rank_candidates(self, user_id, store=None):
+        """Rank a full queue for the user; returns (artwork_ids, catalog version)"""
+        store = store or self.feature_store
+        return self._recommend(user_id, self.candidate_queues.depth, store), store.version
+    
+    def record_swipe(self, user_id, artwork_id, liked, train=True):
         """
         Record user's swipe action (like/dislike)
+        
+        Parameters:
+        train: update the user's model inline; swipe() passes False and
+               trains on the background worker instead
+        
+        Returns:
+        False if the swipe repeated the user's last action on the artwork, in
+        which case there is nothing to train on
         """
-        if not self.artwork_features:
+        store = self.feature_store
+        if not store:
             raise ValueError("No artwork features processed. Call process_artwork_features first.")
             
-        if artwork_id not in self.artwork_features:
+        if artwork_id not in store.index:
             raise ValueError(f"Artwork ID {artwork_id} not found in processed features")
             
-        if user_id not in self.user_preferences:
-            self.user_preferences[user_id] = {'liked': [], 'disliked': []}
-            self.is_classifier_trained[user_id] = False
+        with self._user_lock(user_id):
+            changed = self._add_swipe(user_id, artwork_id, liked)
+            # Persist the swipe with an O(1) log append; repeats are logged too,
+            # the log is the history of events
+            self.swipe_log.append(user_id, artwork_id, liked)
         
-        if liked:
-            self.user_preferences[user_id]['liked'].append(artwork_id)
-        else:
-            self.user_preferences[user_id]['disliked'].append(artwork_id)
-            
-        # Save preferences after each update
-        self._save_preferences()
+        self.popularity.schedule_rebuild(store)
+        
+        # Fold the log into a snapshot once it has grown enough. Compaction
+        # takes every user lock, so it runs in the background; a swipe that
+        # races past the check only queues a compaction that finds nothing to do
+        if self.swipe_log.records_since_compaction >= self.compact_every:
+            job = self._compaction_job
+            if job is None or job.done():
+                self._compaction_job = self._background_executor.submit(
+                    self._save_preferences, min_records=self.compact_every)
             
-        # Train classifier if enough data is available
-        self._train_classifier(user_id)
+        # Update the user's model with the new swipe
+        if train and changed:
+            self._train_classifier(user_id, artwork_id, liked, store)
+        return changed
     
-    def _train_classifier(self, user_id):
+    def _train_classifier(self, user_id, artwork_id=None, liked=None, store=None):
         """
-        Train a classifier based on user's likes and dislikes
+        Update the user's own model based on their likes and dislikes
+        
+        The online model is updated with just the new swipe when it is cached,
+        so the cost does not grow with the user's history. A full refit from
+        history only happens on a cache miss, and the forest is rebuilt in the
+        background every few swipes.
+        
+        Parameters:
+        user_id: unique identifier for the user
+        artwork_id: artwork that was just swiped (None refits from history)
+        liked: whether the artwork was liked
+        store: catalog snapshot to train in (defaults to the current one)
         """
-        liked_count = len(self.user_preferences[user_id]['liked'])
-        disliked_count = len(self.user_preferences[user_id]['disliked'])
+        store = store or self.feature_store
+        # Models are not thread-safe; swipes of the same user train one at a time
+        with self._user_lock(user_id):
+            preferences = self.user_preferences[user_id]
+            liked_count, disliked_count = len(preferences.liked), len(preferences.disliked)
         
-        print(f"User {user_id} has {liked_count} likes and {disliked_count} dislikes")
+            logger.debug("User %s has %d likes and %d dislikes", user_id, liked_count, disliked_count)
         
-        # Skip training if not enough data
-        if liked_count < 5 or disliked_count < 5:
-            self.is_classifier_trained[user_id] = False
-            return
-        
-        # Prepare training data
-        X = []
-        y = []
-        
-        # Add liked artworks
-        for art_id in self.user_preferences[user_id]['liked']:
-            if art_id in self.artwork_features:
-                X.append(self.artwork_features[art_id])
-                y.append(1)
-                
-        # Add disliked artworks
-        for art_id in self.user_preferences[user_id]['disliked']:
-            if art_id in self.artwork_features:
-                X.append(self.artwork_features[art_id])
-                y.append(0)
-        
-        # Train classifier
-        X = np.array(X)
-        y = np.array(y)
-        self.classifier.fit(X, y)
-        self.is_classifier_trained[user_id] = True
-        
-        print(f"Trained classifier for user {user_id} with {len(X)} samples")
+            updated = False
+            if artwork_id is not None:
+                with metrics.timer('tindeart_training_seconds', mode='partial_fit'):
+                    x = store.embeddings[store.index[artwork_id]].reshape(1, -1)
+                    updated = self.user_models.partial_fit(
+                        user_id, x, np.array([int(liked)]), store.space) is not None
+            if not updated:
+                with metrics.timer('tindeart_training_seconds', mode='fit'):
+                    self.user_models.fit(user_id, *self._training_data(user_id, store), store.space)
+        
+            # Only serve from the model once there is enough data
+            if liked_count < 5 or disliked_count < 5:
+                self.is_classifier_trained[user_id] = False
+                return
+        
+            self.is_classifier_trained[user_id] = True
+            self.user_models.schedule_rebuild(user_id, lambda: self._training_data(user_id))
+        
+            logger.debug("Updated classifier for user %s with %d samples", user_id, liked_count + disliked_count)
+    
+    def _training_data(self, user_id, store=None):
+        """Build (X, y) from a user's full like/dislike history"""
+        store = store or self.feature_store
+        preferences = self.user_preferences[user_id]
+        codes = self.user_preferences.codes
+        liked_rows = codes.rows(store, preferences.liked)
+        disliked_rows = codes.rows(store, preferences.disliked)
+        
+        X = store.embeddings[np.concatenate([liked_rows, disliked_rows])]
+        y = np.concatenate([
+            np.ones(len(liked_rows), dtype=np.int8),
+            np.zeros(len(disliked_rows), dtype=np.int8)
+        ])
+        return X, y
+    
+    def _user_model(self, user_id, store=None):
+        """Return the user's model for the catalog version, refitting it from history on a miss"""
+        store = store or self.feature_store
+        model = self.user_models.get(user_id, store.space)
+        if model is None:
+            metrics.inc('tindeart_model_cache_total', result='miss')
+            with self._user_lock(user_id):
+                model = self.user_models.get(user_id, store.space)
+                if model is None:
+                    with metrics.timer('tindeart_training_seconds', mode='fit'):
+                        model = self.user_models.fit(user_id, *self._training_data(user_id, store), store.space)
+                    self.user_models.schedule_rebuild(user_id, lambda: self._training_data(user_id))
+        else:
+            metrics.inc('tindeart_model_cache_total', result='hit')
+        return model
     
     def get_recommendations(self, user_id, n_recommendations=10):
         """
@@ -171,85 +563,144 @@ class ArtRecommender:
         Returns:
         list of artwork IDs sorted by predicted preference
         """        
-        if not self.artwork_features:
+        # Read the catalog once so a concurrent swap cannot mix versions
+        store = self.feature_store
+        if not store:
             raise ValueError("No artwork features processed. Call process_artwork_features first.")
-        
+        return self._recommend(user_id, n_recommendations, store)
+    
+    def _recommend(self, user_id, n_recommendations, store):
+        """Score the whole catalog snapshot for the user and return the top N artwork IDs"""
         # If user has no preferences or classifier isn't trained, use similarity-based approach
         if (user_id not in self.user_preferences or 
             not self.is_classifier_trained.get(user_id, False)):
-            print(f"Using similarity-based recommendations for user {user_id}")
-            return self._get_similarity_based_recommendations(user_id, n_recommendations)
-        
-        print(f"Using classifier-based recommendations for user {user_id}")
-        # Use trained classifier for predictions
-        predictions = {}
-        for art_id, features in self.artwork_features.items():
-            if art_id not in self.user_preferences[user_id]['liked'] and \
-               art_id not in self.user_preferences[user_id]['disliked']:
-                pred_prob = self.classifier.predict_proba(features.reshape(1, -1))[0][1]
-                predictions[art_id] = pred_prob
-        
-        # Sort artworks by predicted probability and return top N
-        recommended_arts = sorted(
-            predictions.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
-        return [art_id for art_id, _ in recommended_arts[:n_recommendations]]
+            logger.debug("Using similarity-based recommendations for user %s", user_id)
+            return self._get_similarity_based_recommendations(user_id, n_recommendations, store)
+        
+        logger.debug("Using classifier-based recommendations for user %s", user_id)
+        metrics.inc('tindeart_recommendations_total', path='classifier')
+        with metrics.timer('tindeart_scoring_seconds', path='classifier'):
+            # Score every unseen artwork with a single batched predict_proba call
+            candidates = np.flatnonzero(~self._seen_mask(store, user_id))
+            if len(candidates) == 0:
+                return []
+            model = self._user_model(user_id, store)
+            scores = model.predict_proba(store.embeddings[candidates])[:, 1]
+            
+            return self._top_n(store, candidates, scores, n_recommendations)
     
-    def _get_similarity_based_recommendations(self, user_id, n_recommendations):
+    def _get_similarity_based_recommendations(self, user_id, n_recommendations, store=None):
         """
         Get recommendations based on similarity to liked artworks
         """
-        # If user has no preferences, return random recommendations
-        if user_id not in self.user_preferences or not self.user_preferences[user_id]['liked']:
-            print(f"No preferences found for user {user_id}, returning random recommendations")
-            all_arts = list(self.artwork_features.keys())
-            np.random.shuffle(all_arts)
-            return all_arts[:n_recommendations]
-        
-        # Calculate average feature vector of liked artworks
-        liked_features = []
-        for art_id in self.user_preferences[user_id]['liked']:
-            if art_id in self.artwork_features:
-                liked_features.append(self.artwork_features[art_id])
-        
-        user_profile = np.mean(liked_features, axis=0)
-        
-        # Calculate similarity scores
-        similarities = {}
-        for art_id, features in self.artwork_features.items():
-            if art_id not in self.user_preferences[user_id]['liked'] and \
-               art_id not in self.user_preferences[user_id]['disliked']:
-                similarity = cosine_similarity(
-                    user_profile.reshape(1, -1),
-                    features.reshape(1, -1)
-                )[0][0]
-                similarities[art_id] = similarity
-        
-        # Sort artworks by similarity and return top N
-        recommended_arts = sorted(
-            similarities.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
-        return [art_id for art_id, _ in recommended_arts[:n_recommendations]]
+        store = store or self.feature_store
+        # Users without a like get the precomputed popularity ranking
+        preferences = self.user_preferences.get(user_id)
+        if preferences is None or not len(preferences.liked):
+            seen = set(self.user_preferences.codes.rows(store, preferences.seen()).tolist()) if preferences else ()
+            popular = self.popularity.top(store, n_recommendations, exclude=seen)
+            if popular is not None:
+                logger.debug("No likes for user %s, returning popular recommendations", user_id)
+                metrics.inc('tindeart_recommendations_total', path='popular')
+                return popular
+            # Until the ranking for this catalog version is built
+            logger.debug("No likes for user %s, returning random recommendations", user_id)
+            metrics.inc('tindeart_recommendations_total', path='random')
+            n = min(n_recommendations, len(store))
+            picks = np.random.default_rng().choice(len(store), size=n, replace=False)
+            return store.ids[picks].tolist()
+        
+        start = time.perf_counter()
+        user_profile = self._user_profile(store, preferences)
+        seen = self._seen_mask(store, user_id)
+        
+        # An index is only valid for the catalog version it was built from
+        index = self.vector_index
+        if index is not None and index.version == store.version:
+            rows, _ = index.search(user_profile, n_recommendations, exclude=seen)
+            metrics.inc('tindeart_recommendations_total', path='index')
+            metrics.observe('tindeart_scoring_seconds', time.perf_counter() - start, path='index')
+            return store.ids[rows].tolist()
+        
+        # Cosine similarity against every artwork is one matrix-vector product
+        # on the pre-normalized matrix
+        candidates = np.flatnonzero(~seen)
+        if len(candidates) == 0:
+            return []
+        similarities = store.unit[candidates] @ user_profile
+        
+        recommendations = self._top_n(store, candidates, similarities, n_recommendations)
+        metrics.inc('tindeart_recommendations_total', path='similarity')
+        metrics.observe('tindeart_scoring_seconds', time.perf_counter() - start, path='similarity')
+        return recommendations
+    
+    def _user_profile(self, store, preferences):
+        """Unit-length average embedding of the artworks a user liked"""
+        liked_rows = self.user_preferences.codes.rows(store, preferences.liked)
+        user_profile = store.embeddings[liked_rows].mean(axis=0)
+        profile_norm = np.linalg.norm(user_profile)
+        if profile_norm > 0:
+            user_profile = user_profile / profile_norm
+        return user_profile
+    
+    def score_artworks(self, user_id, artwork_ids):
+        """
+        Scores the user's recommendations would rank the given artworks by
+        
+        The user's model once it is trained, cosine similarity to the liked
+        artworks before that, and the popularity score for users without a
+        like. Scores are exact even when recommendations come from an
+        approximate index, and only comparable within one user. Used by
+        offline evaluation (benchmarks/evaluate.py).
+        
+        Parameters:
+        user_id: unique identifier for the user
+        artwork_ids: artwork IDs in the current catalog
+        
+        Returns:
+        float array with one score per artwork
+        """
+        store = self.feature_store
+        if not store:
+            raise ValueError("No artwork features processed. Call process_artwork_features first.")
+        rows = np.fromiter((store.index[art_id] for art_id in artwork_ids), dtype=np.intp)
+        preferences = self.user_preferences.get(user_id)
+        if preferences is None or not len(preferences.liked):
+            return self.popularity.scores(store)[rows]
+        if self.is_classifier_trained.get(user_id, False):
+            return self._user_model(user_id, store).predict_proba(store.embeddings[rows])[:, 1]
+        return store.unit[rows] @ self._user_profile(store, preferences)
+    
+    def _seen_mask(self, store, user_id):
+        """Boolean mask over the artwork matrix marking artworks the user already swiped"""
+        mask = np.zeros(len(store), dtype=bool)
+        preferences = self.user_preferences.get(user_id)
+        if preferences is not None:
+            mask[self.user_preferences.codes.rows(store, preferences.seen())] = True
+        return mask
+    
+    def _top_n(self, store, candidates, scores, n_recommendations):
+        """
+        Select the highest scoring candidates without sorting every score
+        
+        Parameters:
+        store: catalog snapshot the candidates index into
+        candidates: row indices into the artwork matrix
+        scores: score for each candidate (same length as candidates)
+        n_recommendations: number of artwork IDs to return
+        
+        Returns:
+        list of artwork IDs sorted by descending score
+        """
+        # Same selection as the vector indexes, so both paths order ties
+        # the same way (in catalog order)
+        rows, _ = top_k(np.asarray(candidates), scores, n_recommendations)
+        return store.ids[rows].tolist()
 
 
 # Example usage
 def example_usage(recommender):
-    # Initialize recommender
-    # Load JSON from a file
-    print(os.getcwd())
-    with open(os.path.join(os.getcwd(), 'racomandation/artwork_features.json'), 'r') as file:
-        data = json.load(file)
-    
-    artwork_features = data
-    
-    # Process artwork features
-    recommender.process_artwork_features(artwork_features)
-    
-    # Simulate user swipes
+    # Features are loaded once at startup (see main.py); this only reads them
     user_id = 'user1'
     
     # Get recommendations
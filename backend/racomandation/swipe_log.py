@@ -0,0 +1,297 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: the log is only safe within a single process
+    fcntl = None
+from racomandation.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SwipeLog:
+    def __init__(self, path, fsync_every=64, fsync_interval=0.5, on_records=None, on_resync=None):
+        """
+        Durable append-only log of swipe events stored as JSON lines
+
+        Appends are buffered and written with a single write + fsync per
+        group (group commit), either once fsync_every records are pending or
+        within fsync_interval seconds, whichever comes first. A crash can
+        lose at most that window of swipes and never corrupts earlier
+        records: a torn trailing line is dropped before the next write.
+        Groups are written by a background flusher outside the append lock,
+        so appending never waits for an fsync.
+
+        Several processes (e.g. gunicorn workers) can share one log. Writes,
+        reads and truncation hold an exclusive flock on `<path>.lock`, and
+        sequence numbers are assigned when a group is written. Every flush
+        first catches up with records other processes have written since and
+        passes them to on_records, so each process sees every swipe within
+        about fsync_interval seconds. A process that fell so far behind that
+        records it never read were already compacted away calls on_resync
+        instead, which should rebuild its state from the snapshot and replay().
+
+        Parameters:
+        path: path of the log file
+        fsync_every: maximum number of records per group commit
+        fsync_interval: maximum seconds a record waits before being flushed
+        on_records: callable receiving a list of records written by other processes
+        on_resync: callable invoked (while holding locked()) when records were missed
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.on_records = on_records
+        self.on_resync = on_resync
+        self.seq = 0  # Sequence number of the last record written or read
+        self.records_since_compaction = 0
+        self._buffer = []
+        self._lock = threading.Lock()  # Guards the append buffer
+        self._flushed = threading.Condition(self._lock)
+        self._io_lock = threading.RLock()  # Guards the file; taken before _lock
+        self._lock_depth = 0
+        self._lock_file = open(f"{path}.lock", 'a+b')
+        self._closed = False
+
+        with self.locked():
+            self._open()
+            self._catch_up()  # Existing records are read back with replay()
+
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    @contextmanager
+    def locked(self):
+        """
+        Hold the log exclusively, across threads and processes
+
+        Reentrant within a thread. Hold it around reading a snapshot and
+        replaying the log, or writing a snapshot and truncating the log, so
+        no other process writes in between.
+        """
+        with self._io_lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield self
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def append(self, user_id, artwork_id, liked):
+        """Buffer a swipe event; it gets its sequence number when its group is written"""
+        with self._lock:
+            self._buffer.append({'user': user_id, 'art': artwork_id,
+                                 'liked': bool(liked), 'ts': round(time.time(), 3)})
+            if len(self._buffer) >= self.fsync_every:
+                self._flushed.notify()  # Flush a full group now
+
+    def flush(self):
+        """
+        Write and fsync all pending records
+
+        Records other processes wrote since the last flush are read first and
+        passed to on_records.
+        """
+        if self._closed:
+            return
+        with self.locked():
+            if self._closed:
+                return
+            records, missed = self._catch_up()
+            if missed and self.on_resync is not None:
+                self.on_resync()  # Replaces delivering records one by one
+                return
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+            self._write(pending)
+            if records and self.on_records is not None:
+                self.on_records(records)
+
+    def replay(self, after_seq=0):
+        """
+        Return logged events with a sequence number above after_seq
+
+        Returns:
+        list of dicts with 'seq', 'user', 'art', 'liked' and 'ts' keys
+        """
+        with self.locked():
+            self._catch_up()  # Follow a truncation by another process
+            self._file.seek(0)
+            data = self._file.read(self._offset)
+        return [record for record, _ in self._parse(data)
+                if record['seq'] > after_seq and 'user' in record]
+
+    def truncate(self):
+        """
+        Drop every record from the log
+
+        Only safe once a snapshot covering self.seq has been made durable,
+        while holding locked(). The file is replaced by a new one so other
+        processes finish reading the old file before switching over. The new
+        file starts with a checkpoint line carrying self.seq, so sequence
+        numbers keep increasing after a restart. Records still buffered are
+        kept and written to the new file.
+        """
+        with self.locked():
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(json.dumps({'seq': self.seq}).encode('utf-8') + b'\n')
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            self._file.close()
+            self._open()
+
+    def close(self):
+        """Flush pending records and close the log file"""
+        if self._closed:
+            return
+        with self.locked():
+            if self._closed:
+                return
+            self._catch_up()
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+                self._write(pending)
+                self._closed = True
+                self._flushed.notify()
+            self._file.close()
+
+    def _open(self):
+        self._file = open(self.path, 'a+b')
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._offset = 0  # Bytes of the file this process has read or written
+        self._checkpoint = 0  # Sequence number the file was truncated at
+        self.records_since_compaction = 0
+
+    def _catch_up(self):
+        """
+        Read records appended by other processes, switching files after a truncation
+
+        Returns:
+        (records, missed) where missed is True when the log was truncated
+        more than once since this process last read it, so records in
+        between were never seen
+        """
+        records = self._read_new()
+        try:
+            truncated = os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            truncated = False
+        missed = False
+        if truncated:
+            self._file.close()
+            self._open()
+            last_seq = self.seq
+            records += self._read_new()
+            missed = self._checkpoint > last_seq
+        return records, missed
+
+    def _read_new(self):
+        self._file.seek(self._offset)
+        records = []
+        consumed = 0
+        for record, end in self._parse(self._file.read()):
+            self.seq = max(self.seq, record['seq'])
+            consumed = end
+            if 'user' in record:
+                records.append(record)
+            else:  # Checkpoint line written by truncate()
+                self._checkpoint = record['seq']
+        self._offset += consumed
+        self.records_since_compaction += len(records)
+        return records
+
+    def _write(self, records):
+        """Write one group of records with a single write + fsync"""
+        if not records:
+            return
+        if os.fstat(self._file.fileno()).st_size != self._offset:
+            logger.warning("Truncating torn record at end of %s", self.path)
+            self._file.truncate(self._offset)
+        lines = []
+        for record in records:
+            self.seq += 1
+            lines.append(json.dumps({'seq': self.seq, **record}, separators=(',', ':')) + '\n')
+        data = ''.join(lines).encode('utf-8')
+        with metrics.timer('tindeart_preferences_seconds', operation='write'):
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._offset += len(data)
+        self.records_since_compaction += len(records)
+
+    def _changed_on_disk(self):
+        """Cheap check (no lock) for records written by other processes"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != self._inode or stat.st_size != self._offset
+
+    def _flush_periodically(self):
+        while True:
+            with self._lock:
+                if len(self._buffer) < self.fsync_every and not self._closed:
+                    self._flushed.wait(self.fsync_interval)
+                if self._closed:
+                    return
+                pending = bool(self._buffer)
+            try:
+                if pending or self._changed_on_disk():
+                    self.flush()
+            except Exception as e:
+                logger.error("Error flushing swipe log %s: %s", self.path, e)
+
+    @staticmethod
+    def _parse(data):
+        """Yield (record, end_offset) for every complete record in data"""
+        offset = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            offset += len(line)
+            yield record, offset
+
+
+def load_snapshot(path):
+    """
+    Load a preferences snapshot
+
+    Accepts both the snapshot format written by write_snapshot and the
+    legacy plain {user_id: {'liked': [...], 'disliked': [...]}} file.
+
+    Returns:
+    (seq, user_preferences) where seq is the last log record the snapshot covers
+    """
+    if not os.path.exists(path):
+        return 0, {}
+    with open(path, 'r') as file:
+        data = json.load(file)
+    if 'users' in data and 'seq' in data:
+        return data['seq'], data['users']
+    return 0, data
+
+
+def write_snapshot(path, seq, user_preferences):
+    """Atomically replace the snapshot at path with the given preferences"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump({'seq': seq, 'users': user_preferences}, file, separators=(',', ':'))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,248 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from racomandation.image_extraction import IMAGE_EXTENSIONS, _manifest_entry
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each thumbnail; the swipe card shows 'medium'
+THUMBNAIL_SIZES = {'small': 240, 'medium': 640, 'large': 1024}
+JPEG_QUALITY = 85
+
+
+class ThumbnailCache:
+    def __init__(self, directory, originals_dir=None, sizes=None, quality=JPEG_QUALITY):
+        """
+        Content-addressed on-disk cache of downscaled JPEG copies of the artworks
+
+        Thumbnails are named after the SHA-1 of the original file
+        (<directory>/<ab>/<sha1>-<size>.jpg), so a changed image gets new
+        files and a new ETag, and identical images under several names are
+        stored once. index.json maps each filename to the size, mtime and
+        hash of its original, in the format of the extraction manifest.
+        Entries that lookup adds or updates are written to it right away,
+        so a restart does not hash those originals again.
+
+        Parameters:
+        directory: cache directory
+        originals_dir: directory of the original images; lets lookup render
+                       missing thumbnails and notice changed originals
+        sizes: {name: longest side in pixels}, THUMBNAIL_SIZES by default
+        quality: JPEG quality of the thumbnails
+        """
+        self.directory = directory
+        self.originals_dir = originals_dir
+        self.sizes = dict(sizes or THUMBNAIL_SIZES)
+        self.quality = quality
+        self.entries = _load_index(os.path.join(directory, 'index.json'))  # filename -> manifest entry
+        self._lock = threading.Lock()  # Serializes index.json writes between request threads
+
+    def path(self, digest, size):
+        return os.path.join(self.directory, digest[:2], f"{digest}-{size}.jpg")
+
+    def missing(self, digest):
+        """Names of the sizes not rendered yet for an original"""
+        return [size for size in self.sizes if not os.path.exists(self.path(digest, size))]
+
+    def render(self, img, digest):
+        """
+        Write the missing thumbnails of an opened image
+
+        Each size is resized from the next larger one rather than from the
+        original, so only the first resize touches every decoded pixel.
+
+        Parameters:
+        img: PIL image of the original (decoded once, e.g. shared with
+             feature extraction)
+        digest: SHA-1 of the original file
+
+        Returns:
+        number of thumbnails written
+        """
+        missing = self.missing(digest)
+        current = img if img.mode == 'RGB' else img.convert('RGB')
+        for size in sorted(missing, key=self.sizes.get, reverse=True):
+            current = _fit(current, self.sizes[size])
+            _save_jpeg(current, self.path(digest, size), self.quality)
+        return len(missing)
+
+    def add(self, image_path, entry=None):
+        """
+        Index an original, decoding it only if some of its thumbnails are missing
+
+        Parameters:
+        image_path: path of the original
+        entry: its manifest entry, when already known
+
+        Returns:
+        the manifest entry of the original
+        """
+        filename = os.path.basename(image_path)
+        entry = _manifest_entry(image_path, entry or self.entries.get(filename))
+        if self.missing(entry['sha1']):
+            self.render_file(image_path, entry)
+        self.entries[filename] = entry
+        return entry
+
+    def record(self, filename, entry):
+        """Index an original whose thumbnails were rendered elsewhere (e.g. during extraction)"""
+        self.entries[filename] = entry
+
+    def lookup(self, filename, size):
+        """
+        Cached thumbnail of an artwork, rendered on a miss when the original is available
+
+        Parameters:
+        filename: artwork ID (image filename)
+        size: one of the names in sizes
+
+        Returns:
+        (path, etag), or None for unknown artworks and sizes
+        """
+        # Only plain image filenames: not '.', '..', paths or other files
+        if (size not in self.sizes or os.path.basename(filename) != filename
+                or not filename.lower().endswith(IMAGE_EXTENSIONS)):
+            return None
+        entry = self.entries.get(filename)
+        original = os.path.join(self.originals_dir, filename) if self.originals_dir else None
+        if original and os.path.isfile(original):
+            # One stat per request; the original is only hashed again when it changed
+            known, entry = entry, self.add(original, entry)
+            if entry != known:
+                self._persist(filename, entry)
+        if entry is None:
+            return None
+        path = self.path(entry['sha1'], size)
+        if not os.path.exists(path):
+            return None
+        return path, f"{entry['sha1']}-{size}"
+
+    def build(self, directory_path, workers=1):
+        """
+        Render the thumbnails of every image in a directory, skipping the ones
+        already cached, and save the index
+
+        Returns:
+        number of originals that had to be decoded
+        """
+        filenames = sorted(
+            filename for filename in os.listdir(directory_path)
+            if filename.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        todo = []
+        for filename in filenames:
+            image_path = os.path.join(directory_path, filename)
+            entry = _manifest_entry(image_path, self.entries.get(filename))
+            self.entries[filename] = entry
+            if self.missing(entry['sha1']):
+                todo.append((image_path, entry))
+
+        start = time.perf_counter()
+        if workers > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self.directory, self.sizes, self.quality)
+            ) as executor:
+                list(executor.map(_render_in_worker, todo, chunksize=16))
+        else:
+            for image_path, entry in todo:
+                self.render_file(image_path, entry)
+        elapsed = time.perf_counter() - start
+        logger.info("Rendered thumbnails of %d images in %.1fs, %d already cached",
+                    len(todo), elapsed, len(filenames) - len(todo))
+        self.save_index()
+        return len(todo)
+
+    def save_index(self):
+        with self._lock:
+            self._write_index(self.entries)
+
+    def _persist(self, filename, entry):
+        """Write one entry to index.json, keeping the entries other processes saved since it was loaded"""
+        with self._lock:
+            entries = _load_index(os.path.join(self.directory, 'index.json'))
+            entries[filename] = entry
+            self._write_index(entries)
+
+    def _write_index(self, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, 'index.json')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(entries, file)
+        os.replace(tmp_path, path)
+
+    def render_file(self, image_path, entry):
+        """Decode an original and render its missing thumbnails, logging failures"""
+        try:
+            with Image.open(image_path) as img:
+                # JPEG decoding can skip detail the largest thumbnail doesn't need
+                largest = max(self.sizes.values())
+                img.draft('RGB', (largest, largest))
+                self.render(img, entry['sha1'])
+        except Exception as e:
+            logger.warning("Error rendering thumbnails of %s: %s", image_path, e)
+
+
+# Per-process cache used by build workers; only the parent writes the index
+_worker_cache = None
+
+
+def _init_worker(directory, sizes, quality):
+    global _worker_cache
+    _worker_cache = ThumbnailCache(directory, sizes=sizes, quality=quality)
+
+
+def _render_in_worker(item):
+    _worker_cache.render_file(*item)
+
+
+def _fit(img, longest):
+    """img scaled down so its longest side is at most longest pixels (never up)"""
+    width, height = img.size
+    scale = longest / max(width, height)
+    if scale >= 1:
+        return img
+    # Same filter as Image.thumbnail, which can't be used as it resizes in place
+    return img.resize((max(1, round(width * scale)), max(1, round(height * scale))),
+                      Image.BICUBIC, reducing_gap=2.0)
+
+
+def _save_jpeg(img, path, quality):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Request threads and extraction workers may render the same image at once
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    # Baseline, not progressive: progressive JPEGs are a few percent smaller
+    # but take over twice as long to decode
+    img.save(tmp_path, 'JPEG', quality=quality, optimize=True)
+    os.replace(tmp_path, path)
+
+
+def _load_index(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the thumbnails served by /api/images")
+    parser.add_argument('--images', required=True, help='directory of original images')
+    parser.add_argument('--out', default=os.path.join('racomandation', 'thumbnails'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    cache = ThumbnailCache(args.out)
+    cache.build(args.images, workers=args.workers)
+    print(f"Indexed {len(cache.entries)} images in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
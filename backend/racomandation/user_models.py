@@ -0,0 +1,221 @@
+import importlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from racomandation.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLASSES = np.array([0, 1])
+TREE_NODE_BYTES = 80  # Approximate size of one sklearn tree node plus its value entry
+
+
+def preload():
+    """
+    Import the sklearn estimators ahead of the first swipe
+
+    sklearn takes about a second to import, most of the server's import time,
+    so it is only imported when a model is first needed; the server calls
+    this on a background thread once it is up.
+    """
+    for module in ('sklearn.linear_model', 'sklearn.ensemble'):
+        importlib.import_module(module)
+
+
+def _online_model():
+    from sklearn.linear_model import SGDClassifier
+    return SGDClassifier(loss='log_loss', alpha=1e-3, random_state=0)
+
+
+class UserModel:
+    def __init__(self, n_estimators=100):
+        """
+        Preference model for a single user
+
+        An online logistic model is updated on every swipe. A random forest is
+        rebuilt in the background from the full history every few swipes and,
+        once available, its probabilities are averaged with the online model's.
+
+        Parameters:
+        n_estimators: number of trees in the periodically rebuilt forest
+        """
+        self.online = _online_model()
+        self.forest = None
+        self.n_estimators = n_estimators
+        self.swipes_since_rebuild = 0
+        self.generation = 0  # Bumped on every full refit so stale forests are dropped
+        self.version = None  # Embedding space (FeatureStore.space) the model was trained in
+
+    def fit(self, X, y, version=None, epochs=5):
+        """Fit the online model from scratch on a user's full history"""
+        self.online = _online_model()
+        self.forest = None
+        self.version = version
+        for _ in range(epochs):
+            self.online.partial_fit(X, y, classes=CLASSES)
+        self.swipes_since_rebuild = len(y)
+        self.generation += 1
+
+    def partial_fit(self, X, y):
+        """Update the online model with new swipes"""
+        self.online.partial_fit(X, y, classes=CLASSES)
+        self.swipes_since_rebuild += len(y)
+
+    def predict_proba(self, X):
+        """Probability of each class for every row of X"""
+        proba = self.online.predict_proba(X)
+        forest = self.forest
+        if forest is not None:
+            proba = (proba + forest.predict_proba(X)) / 2
+        return proba
+
+    def build_forest(self, X, y):
+        """Fit a new random forest; the caller decides whether to install it"""
+        from sklearn.ensemble import RandomForestClassifier
+        forest = RandomForestClassifier(n_estimators=self.n_estimators)
+        forest.fit(X, y)
+        return forest
+
+    def nbytes(self):
+        """Approximate memory held by the fitted models"""
+        size = 0
+        if hasattr(self.online, 'coef_'):
+            size += self.online.coef_.nbytes + self.online.intercept_.nbytes
+        forest = self.forest
+        if forest is not None:
+            size += sum(tree.tree_.node_count for tree in forest.estimators_) * TREE_NODE_BYTES
+        return size
+
+
+class UserModelRegistry:
+    def __init__(self, max_users=10000, max_bytes=512 * 1024 * 1024, rebuild_every=10,
+                 n_estimators=100, background=True):
+        """
+        Per-user model store with LRU eviction and a memory cap
+
+        Evicted users are refit from their swipe history the next time they
+        are needed, so eviction only costs time, never correctness.
+
+        Parameters:
+        max_users: maximum number of user models kept in memory
+        max_bytes: approximate memory cap across all user models
+        rebuild_every: number of swipes between background forest rebuilds
+        n_estimators: number of trees per user forest
+        background: rebuild forests on a worker thread instead of inline
+        """
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.rebuild_every = rebuild_every
+        self.n_estimators = n_estimators
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._pending = set()
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+
+    def __contains__(self, user_id):
+        return user_id in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+    def get(self, user_id, version=None):
+        """
+        Return the user's model and mark it as recently used
+
+        Returns None on a cache miss, or when version is given and the model
+        was trained in a different embedding space.
+        """
+        with self._lock:
+            model = self._models.get(user_id)
+            if model is None or (version is not None and model.version != version):
+                return None
+            self._models.move_to_end(user_id)
+            return model
+
+    def fit(self, user_id, X, y, version=None):
+        """Create (or replace) a user's model from their full history"""
+        model = self.get(user_id) or UserModel(self.n_estimators)
+        model.fit(X, y, version)
+        with self._lock:
+            self._models[user_id] = model
+            self._models.move_to_end(user_id)
+            self._resize(user_id)
+        return model
+
+    def partial_fit(self, user_id, X, y, version=None):
+        """Update an existing user's model with new swipes; returns None on a cache miss"""
+        model = self.get(user_id, version)
+        if model is not None:
+            model.partial_fit(X, y)
+        return model
+
+    def schedule_rebuild(self, user_id, load_history):
+        """
+        Rebuild the user's forest once enough swipes have arrived
+
+        Parameters:
+        user_id: user whose forest should be rebuilt
+        load_history: callable returning (X, y) for the user's full history
+        """
+        with self._lock:
+            model = self._models.get(user_id)
+            if (model is None or user_id in self._pending or
+                    model.swipes_since_rebuild < self.rebuild_every):
+                return
+            model.swipes_since_rebuild = 0
+            self._pending.add(user_id)
+            generation = model.generation
+
+        if self._executor is None:
+            self._rebuild(user_id, model, generation, load_history)
+        else:
+            self._executor.submit(self._rebuild, user_id, model, generation, load_history)
+
+    def _rebuild(self, user_id, model, generation, load_history):
+        try:
+            X, y = load_history()
+            if len(np.unique(y)) < 2:
+                return
+            with metrics.timer('tindeart_training_seconds', mode='forest'):
+                forest = model.build_forest(X, y)
+            with self._lock:
+                # Drop the result if the user was evicted or refit meanwhile
+                if self._models.get(user_id) is model and model.generation == generation:
+                    model.forest = forest
+                    self._resize(user_id)
+        except Exception as e:
+            logger.error("Error rebuilding model for user %s: %s", user_id, e)
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
+
+    def evict(self, user_id):
+        """Drop a user's model from memory"""
+        with self._lock:
+            if self._models.pop(user_id, None) is not None:
+                self._total_bytes -= self._sizes.pop(user_id, 0)
+
+    def clear(self):
+        """Drop every user model, e.g. after the embedding space changed"""
+        with self._lock:
+            self._models.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def memory_usage(self):
+        """Approximate bytes held by all user models"""
+        return self._total_bytes
+
+    def _resize(self, user_id):
+        """Refresh a model's size and evict least recently used models over the caps"""
+        size = self._models[user_id].nbytes()
+        self._total_bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+        while len(self._models) > 1 and (
+                len(self._models) > self.max_users or self._total_bytes > self.max_bytes):
+            oldest = next(iter(self._models))
+            self.evict(oldest)
@@ -0,0 +1,354 @@
+import os
+import numpy as np
+from racomandation.feature_store import build_lock
+
+INDEX_KINDS = ('exact', 'ivf')
+
+
+class BruteForceIndex:
+    kind = 'exact'
+
+    def __init__(self):
+        """
+        Exact inner-product search over every vector
+
+        Vectors are expected to be L2-normalized, so inner product equals
+        cosine similarity. Serves as the reference for approximate indexes.
+        """
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.version = None  # Catalog version the index was built for
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def build(self, vectors, version=None):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.version = version
+        return self
+
+    def add(self, vectors):
+        """
+        Append vectors; they get the next row ids
+
+        Returns:
+        row ids of the added vectors
+        """
+        start = len(self.vectors)
+        self.vectors = np.vstack([self.vectors, np.asarray(vectors, dtype=np.float32)])
+        return np.arange(start, len(self.vectors))
+
+    def drop(self, rows):
+        """Remove vectors by row id; later row ids move up to stay contiguous"""
+        self.vectors = np.delete(self.vectors, rows, axis=0)
+
+    def copy(self):
+        """Copy that can be updated while this index keeps serving searches"""
+        index = BruteForceIndex()
+        index.vectors, index.version = self.vectors, self.version
+        return index
+
+    def settings(self):
+        """Keyword arguments for make_index that recreate this index's configuration"""
+        return {}
+
+    def search(self, query, k, exclude=None):
+        """
+        Find the k vectors with the highest inner product with query
+
+        Parameters:
+        query: vector of the same dimension as the indexed vectors
+        k: number of results
+        exclude: optional boolean mask over row ids of vectors to skip
+
+        Returns:
+        (rows, scores) sorted by descending score
+        """
+        scores = self.vectors @ np.asarray(query, dtype=np.float32)
+        rows = np.arange(len(scores))
+        if exclude is not None:
+            keep = ~exclude[:len(scores)]
+            rows, scores = rows[keep], scores[keep]
+        return top_k(rows, scores, k)
+
+    def save(self, path):
+        _save_npz(path, kind='exact', version=str(self.version))
+
+    def _load(self, data, vectors):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        return self
+
+
+class IVFIndex:
+    kind = 'ivf'
+
+    def __init__(self, n_lists=None, n_probe=16, iterations=10, train_size=100_000, seed=0):
+        """
+        Inverted-file index with a spherical k-means coarse quantizer
+
+        Vectors are partitioned into n_lists clusters. A search scores only
+        the vectors in the n_probe clusters whose centroids are closest to
+        the query, so cost grows with n_probe * n / n_lists instead of n.
+
+        Parameters:
+        n_lists: number of clusters (defaults to about sqrt(n))
+        n_probe: clusters scanned per search; higher is slower but more accurate
+        iterations: k-means iterations when building
+        train_size: vectors sampled to train the quantizer
+        seed: random seed for sampling and centroid initialization
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = None
+        self.list_rows = []  # Row ids in each cluster
+        self.list_vectors = []  # Contiguous vectors of each cluster, parallel to list_rows
+        self.size = 0
+        self.version = None  # Catalog version the index was built for
+
+    def __len__(self):
+        return self.size
+
+    def build(self, vectors, version=None):
+        """
+        Train the coarse quantizer and assign every vector to a cluster
+
+        Parameters:
+        vectors: (n, dim) L2-normalized vectors; row i gets row id i
+        version: catalog version the vectors belong to
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(self.seed)
+
+        sample = vectors
+        if len(vectors) > self.train_size:
+            sample = vectors[rng.choice(len(vectors), size=self.train_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]  # Keep centroids of empty clusters where they are
+            centroids = _normalize(sums)
+
+        self.centroids = centroids
+        self.n_lists = n_lists
+        self.list_rows = [np.zeros(0, dtype=np.int64) for _ in range(n_lists)]
+        self.list_vectors = [np.zeros((0, vectors.shape[1]), dtype=np.float32) for _ in range(n_lists)]
+        self.size = 0
+        self.version = version
+        self.add(vectors)
+        return self
+
+    def add(self, vectors):
+        """
+        Insert vectors into their nearest clusters without retraining
+
+        Returns:
+        row ids of the added vectors
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rows = np.arange(self.size, self.size + len(vectors))
+        labels = self._nearest(vectors, self.centroids)
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(self.n_lists + 1))
+        for cluster in np.unique(labels):
+            members = order[bounds[cluster]:bounds[cluster + 1]]
+            self.list_rows[cluster] = np.concatenate([self.list_rows[cluster], rows[members]])
+            self.list_vectors[cluster] = np.vstack([self.list_vectors[cluster], vectors[members]])
+        self.size += len(vectors)
+        return rows
+
+    def drop(self, rows):
+        """
+        Remove vectors by row id without retraining; later row ids move up
+        to stay contiguous, like the rows of a store after FeatureStore.drop
+        """
+        removed = np.zeros(self.size, dtype=bool)
+        removed[rows] = True
+        new_rows = np.cumsum(~removed) - 1
+        for cluster, list_rows in enumerate(self.list_rows):
+            keep = ~removed[list_rows]
+            if not keep.all():
+                self.list_vectors[cluster] = self.list_vectors[cluster][keep]
+                list_rows = list_rows[keep]
+            self.list_rows[cluster] = new_rows[list_rows]
+        self.size -= int(removed.sum())
+
+    def copy(self):
+        """
+        Copy that can be updated while this index keeps serving searches
+
+        Only the cluster lists are copied; add and drop replace the arrays
+        of the clusters they change, so unchanged clusters stay shared.
+        """
+        index = IVFIndex(**self.settings())
+        index.n_lists = self.n_lists
+        index.centroids = self.centroids
+        index.list_rows = list(self.list_rows)
+        index.list_vectors = list(self.list_vectors)
+        index.size = self.size
+        index.version = self.version
+        return index
+
+    def settings(self):
+        """Keyword arguments for make_index that recreate this index's configuration"""
+        return {'n_probe': self.n_probe, 'iterations': self.iterations,
+                'train_size': self.train_size, 'seed': self.seed}
+
+    def search(self, query, k, exclude=None, n_probe=None):
+        """
+        Approximate top-k inner-product search
+
+        When filtering leaves fewer than k results, more clusters are probed
+        until k are found or every cluster has been scanned.
+
+        Parameters:
+        query: vector of the same dimension as the indexed vectors
+        k: number of results
+        exclude: optional boolean mask over row ids of vectors to skip
+        n_probe: clusters to scan (defaults to self.n_probe)
+
+        Returns:
+        (rows, scores) sorted by descending score
+        """
+        query = np.asarray(query, dtype=np.float32)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        ranked = np.argsort(-(self.centroids @ query))
+
+        rows_parts, score_parts = [], []
+        found = 0
+        probed = 0
+        while probed < self.n_lists:
+            for cluster in ranked[probed:probed + n_probe]:
+                rows = self.list_rows[cluster]
+                scores = self.list_vectors[cluster] @ query
+                if exclude is not None:
+                    keep = ~exclude[rows]
+                    rows, scores = rows[keep], scores[keep]
+                rows_parts.append(rows)
+                score_parts.append(scores)
+                found += len(rows)
+            probed += n_probe
+            if found >= k:
+                break
+            n_probe *= 2
+
+        if not rows_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return top_k(np.concatenate(rows_parts), np.concatenate(score_parts), k)
+
+    def save(self, path):
+        """Save the index to a single .npz file"""
+        sizes = np.array([len(rows) for rows in self.list_rows], dtype=np.int64)
+        _save_npz(
+            path,
+            kind='ivf',
+            version=str(self.version),
+            params=np.array([self.n_probe, self.iterations, self.train_size, self.seed]),
+            centroids=self.centroids,
+            sizes=sizes,
+            rows=np.concatenate(self.list_rows),
+            vectors=np.vstack(self.list_vectors),
+        )
+
+    def _load(self, data, vectors):
+        self.n_probe, self.iterations, self.train_size, self.seed = data['params'].tolist()
+        self.centroids = data['centroids']
+        self.n_lists = len(self.centroids)
+        bounds = np.concatenate([[0], np.cumsum(data['sizes'])])
+        rows, list_vectors = data['rows'], data['vectors']
+        self.list_rows = [rows[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        self.list_vectors = [list_vectors[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        self.size = int(bounds[-1])
+        return self
+
+    @staticmethod
+    def _nearest(vectors, centroids, block=65536):
+        """Index of the highest inner-product centroid for each vector, in blocks to bound memory"""
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block):
+            labels[start:start + block] = (vectors[start:start + block] @ centroids.T).argmax(axis=1)
+        return labels
+
+
+def top_k(rows, scores, k):
+    """Highest scoring k (rows, scores) without sorting every score; ties keep row order"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return rows[:0], scores[:0]
+    if k < len(scores):
+        top = np.sort(np.argpartition(-scores, k - 1)[:k])
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return rows[top], scores[top]
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def make_index(kind, **kwargs):
+    """Create an empty index of the given kind ('exact' or 'ivf')"""
+    if kind == 'exact':
+        return BruteForceIndex()
+    if kind == 'ivf':
+        return IVFIndex(**kwargs)
+    raise ValueError(f"Unknown vector index: {kind}")
+
+
+def _save_npz(path, **arrays):
+    # Written under a pid-unique name and renamed into place, so a worker
+    # loading the index never reads a partly written archive
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_index(path, vectors=None):
+    """
+    Load an index saved with save()
+
+    Parameters:
+    path: .npz file
+    vectors: the indexed vectors, needed by the exact index which does not
+             store its own copy
+    """
+    with np.load(path) as data:
+        index = make_index(str(data['kind']))
+        index.version = str(data['version'])
+        return index._load(data, vectors)
+
+
+def load_or_build_index(directory, store, kind='ivf', **kwargs):
+    """
+    Load the index saved next to a feature store, rebuilding it when it is
+    missing or was built for another catalog version
+    """
+    path = os.path.join(directory, f"index_{kind}.npz")
+    index = _load_current(path, store)
+    if index is not None:
+        return index
+    with build_lock(directory):
+        # Another process may have built it while this one waited
+        index = _load_current(path, store)
+        if index is None:
+            index = make_index(kind, **kwargs).build(store.unit, store.version)
+            index.save(path)
+    return index
+
+
+def _load_current(path, store):
+    """The index saved at path if it was built for store's version, else None"""
+    if not os.path.exists(path):
+        return None
+    index = load_index(path, store.unit)
+    return index if index.version == store.version else None
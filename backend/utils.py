@@ -1,35 +1,39 @@
-import csv
+import os
+from metadata import MetadataStore
+from racomandation.metrics import metrics
+
+# Path of the metadata CSV written by dataset/dataset.py; override with TINDEART_METADATA
+METADATA_PATH = os.environ.get(
+    'TINDEART_METADATA',
+    os.path.join(os.getcwd(), '..', 'wikiart_images', 'metadata.csv')
+)
+# 'memory' or 'sqlite' (for catalogs that don't fit comfortably in memory)
+METADATA_BACKEND = os.environ.get('TINDEART_METADATA_BACKEND', 'memory')
+
+metadata_store = MetadataStore(METADATA_PATH, backend=METADATA_BACKEND)
 
 
 def format_recommendations(recommendations):
-        # Open and read the metadata CSV file
-    metadata = []
+    # Look up metadata for the whole batch at once; the CSV is loaded once
+    # and only re-read when it changes
     try:
-        with open('/Users/luisbeqja/Desktop/Personal Projects/TindeArt/wikiart_images/metadata.csv', 'r') as file:
-            csv_reader = csv.DictReader(file)
-            for row in csv_reader:
-                metadata.append(row)
+        with metrics.timer('tindeart_metadata_seconds'):
+            metadata_map = metadata_store.get_many(recommendations['recommendations'])
     except FileNotFoundError:
         return "Metadata file not found", 404
     except Exception as e:
         return f"Error reading metadata: {str(e)}", 500
-    
-    # Get recommendations from example_usage
-    recommendations_data = recommendations
-    
-    # Create a mapping of filenames to metadata
-    metadata_map = {row['filename']: row for row in metadata}
-    
+
     # Get full metadata for each recommended artwork
     enriched_recommendations = []
-    for filename in recommendations_data['recommendations']:
+    for filename in recommendations['recommendations']:
         if filename in metadata_map:
             artwork_info = {
                 'filename': filename,
                 'artist': metadata_map[filename]['artist'],
-                'genre': metadata_map[filename]['genre'], 
+                'genre': metadata_map[filename]['genre'],
                 'style': metadata_map[filename]['style'],
             }
             enriched_recommendations.append(artwork_info)
-    
+
     return {'recommendations': enriched_recommendations}